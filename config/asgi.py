@@ -3,6 +3,10 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Em produção com views async, suba com uvicorn e ``SERVIDOR_ASGI=true``:
+
+    SERVIDOR_ASGI=true uvicorn config.asgi:application --workers 2
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -14,3 +18,17 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.SERVIDOR_ASGI:
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+    from django.views.static import serve
+
+    class StaticFilesHandler(ASGIStaticFilesHandler):
+        """Serve o STATIC_ROOT do collectstatic (nomes com hash do manifest)."""
+
+        def serve(self, request):
+            return serve(request, self.file_path(request.path), document_root=settings.STATIC_ROOT)
+
+    application = StaticFilesHandler(application)
@@ -30,6 +30,50 @@ GOOGLE_DRIVE_REDIRECT_URI = os.getenv(
 
 GOOGLE_DRIVE_POST_CONNECT_REDIRECT = "/painel/integracoes/drive/"
 
+# Quantidade de itens do /api/sync/ agrupados em uma mesma transação.
+# 1 mantém o comportamento de uma transação por item. Nos dois modos um erro
+# de banco num item volta como status "error" do item (não como 500). Com 1,
+# falhas do Drive aparecem em photo_errors; em lote o Drive só é chamado
+# depois do commit e as falhas ficam no log.
+SYNC_TAMANHO_LOTE = int(os.getenv("SYNC_TAMANHO_LOTE", "1"))
+
+# SyncJob em PROCESSANDO sem progresso (atualizado_em) há mais que isto é
+# considerado abandonado por um worker que caiu e vai para ERRO.
+SYNC_JOB_TIMEOUT_SEGUNDOS = int(os.getenv("SYNC_JOB_TIMEOUT_SEGUNDOS", "900"))
+
+# TarefaDrive (envio de fotos em lote, restauração de OS reidratada, renomeação
+# de pastas): manage.py processar_tarefas_drive retoma as PENDENTE há mais de
+# ATRASO (a thread pós-commit não chegou a rodar), as PROCESSANDO paradas há
+# mais de TIMEOUT (worker caiu no meio) e as com ERRO até MAX_TENTATIVAS.
+TAREFAS_DRIVE_ATRASO_SEGUNDOS = int(os.getenv("TAREFAS_DRIVE_ATRASO_SEGUNDOS", "120"))
+TAREFAS_DRIVE_TIMEOUT_SEGUNDOS = int(os.getenv("TAREFAS_DRIVE_TIMEOUT_SEGUNDOS", "900"))
+TAREFAS_DRIVE_MAX_TENTATIVAS = int(os.getenv("TAREFAS_DRIVE_MAX_TENTATIVAS", "5"))
+
+# Janela (em segundos) que o /api/pwa/changes/ volta antes do cursor recebido,
+# cobrindo transações que gravaram antes do cursor e só commitaram depois dele.
+PWA_CHANGES_SOBREPOSICAO_SEGUNDOS = int(os.getenv("PWA_CHANGES_SOBREPOSICAO_SEGUNDOS", "120"))
+
+# Tombstones (RegistroExcluido) mais velhos que isto são apagados por
+# manage.py limpar_registros_excluidos. Deve cobrir o maior tempo que um PWA
+# fica offline: um cursor mais antigo recebe o estado completo de novo.
+PWA_EXCLUIDOS_RETENCAO_DIAS = int(os.getenv("PWA_EXCLUIDOS_RETENCAO_DIAS", "30"))
+
+# Validade (em segundos) do grafo de etapas em memória de cada worker; alterações
+# via admin/API invalidam na hora, o TTL cobre os demais workers.
+ETAPAS_CACHE_TTL_SEGUNDOS = int(os.getenv("ETAPAS_CACHE_TTL_SEGUNDOS", "300"))
+
+# OS fechadas há mais de N dias vão para OSArquivada (manage.py arquivar_os)
+ARQUIVAMENTO_OS_DIAS = int(os.getenv("ARQUIVAMENTO_OS_DIAS", "180"))
+
+# Qualidade (0 a 11) do brotli nas respostas da /api/ (ApiCompressionMiddleware)
+API_BROTLI_QUALIDADE = int(os.getenv("API_BROTLI_QUALIDADE", "5"))
+
+# Tamanho máximo, já descompactado, de corpos enviados com Content-Encoding: gzip
+# para /api/sync/ e /api/fotos-os/.
+API_CORPO_DESCOMPACTADO_MAX_BYTES = int(
+    os.getenv("API_CORPO_DESCOMPACTADO_MAX_BYTES", str(50 * 1024 * 1024))
+)
+
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 
 
@@ -70,15 +114,45 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    "core.metricas.MetricasMiddleware",
+    "core.tracing.TracingMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.middleware.ApiCompressionMiddleware",
+    "core.middleware.GzipRequestMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    "core.db_router.ReplicaMiddleware",
+    "core.profiling.ProfilingMiddleware",
 ]
 
+# Sob uvicorn (config.asgi) toda a cadeia de middleware precisa ser async;
+# o WhiteNoise só é síncrono e forçaria cada requisição a passar por uma
+# thread. Nesse modo os estáticos saem do handler em config/asgi.py.
+SERVIDOR_ASGI = os.getenv("SERVIDOR_ASGI", "False").lower() == "true"
+if SERVIDOR_ASGI:
+    MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
+
+# Timeout das chamadas HTTP ao Drive feitas pelo cliente async (core.drive_async)
+DRIVE_HTTP_TIMEOUT_SEGUNDOS = float(os.getenv("DRIVE_HTTP_TIMEOUT_SEGUNDOS", "30"))
+
+# Upload em lote (POST /api/fotos-os/lote/): máximo de arquivos por requisição
+# e quantos envios ao Drive o lote faz em paralelo.
+FOTOS_LOTE_MAX_ARQUIVOS = int(os.getenv("FOTOS_LOTE_MAX_ARQUIVOS", "30"))
+DRIVE_UPLOAD_CONCORRENCIA = int(os.getenv("DRIVE_UPLOAD_CONCORRENCIA", "4"))
+
+# Teto de chamadas por segundo ao Drive de cada processo no cliente async
+# (lote de fotos e manage.py drive_backfill); 0 desliga.
+DRIVE_REQUISICOES_POR_SEGUNDO = float(os.getenv("DRIVE_REQUISICOES_POR_SEGUNDO", "10"))
+
+# Circuito do Drive por oficina (core.drive_circuito): abre depois de N falhas
+# seguidas de autenticação/404 e barra as chamadas por este tempo.
+DRIVE_CIRCUITO_FALHAS = int(os.getenv("DRIVE_CIRCUITO_FALHAS", "3"))
+DRIVE_CIRCUITO_ABERTO_SEGUNDOS = int(os.getenv("DRIVE_CIRCUITO_ABERTO_SEGUNDOS", "300"))
+
 
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 ROOT_URLCONF = 'config.urls'
@@ -106,14 +180,45 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Conexões com o PostgreSQL:
+# - DB_POOL_MAX_SIZE > 0 liga o pool nativo do Django (psycopg 3 + psycopg_pool),
+#   um pool por worker com DB_POOL_MIN_SIZE conexões abertas no mínimo; o
+#   pool testa cada conexão antes de entregá-la (descarta as que caíram num
+#   restart do PgBouncer/servidor) e DB_POOL_TIMEOUT limita a espera por uma.
+# - sem pool, vale a conexão persistente por thread (DB_CONN_MAX_AGE) com
+#   CONN_HEALTH_CHECKS ligado.
+# Atrás do PgBouncer em modo transaction, use DB_DISABLE_SERVER_SIDE_CURSORS=true.
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "600"))
+DB_CONN_HEALTH_CHECKS = os.getenv("DB_CONN_HEALTH_CHECKS", "True").lower() == "true"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "600"))
+DB_DISABLE_SERVER_SIDE_CURSORS = (
+    os.getenv("DB_DISABLE_SERVER_SIDE_CURSORS", "False").lower() == "true"
+)
+
 if DATABASE_URL:
     DATABASES = {
         "default": dj_database_url.config(
             default=DATABASE_URL,
-            conn_max_age=600,
+            conn_max_age=0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+            conn_health_checks=DB_CONN_HEALTH_CHECKS and not DB_POOL_MAX_SIZE,
             ssl_require=not DEBUG,
         )
     }
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = DB_DISABLE_SERVER_SIDE_CURSORS
+
+    if DB_POOL_MAX_SIZE:
+        from psycopg_pool import ConnectionPool
+
+        DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+            "min_size": min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": DB_POOL_TIMEOUT,
+            "max_idle": DB_POOL_MAX_IDLE,
+            "check": ConnectionPool.check_connection,
+        }
 else:
     DATABASES = {
         "default": {
@@ -122,6 +227,74 @@ else:
         }
     }
 
+# Réplica de leitura opcional (ver core.db_router). Nos testes ela espelha o
+# banco default (TEST.MIRROR); aceita sqlite:/// para rodar local com dois bancos.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+DATABASE_REPLICA_ALIAS = "replica" if DATABASE_REPLICA_URL else None
+REPLICA_LAG_MAX_SEGUNDOS = float(os.getenv("REPLICA_LAG_MAX_SEGUNDOS", "5"))
+REPLICA_LAG_CHECAGEM_SEGUNDOS = float(os.getenv("REPLICA_LAG_CHECAGEM_SEGUNDOS", "5"))
+REPLICA_PIN_SEGUNDOS = int(os.getenv("REPLICA_PIN_SEGUNDOS", "10"))
+
+if DATABASE_REPLICA_URL:
+    DATABASES["replica"] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        conn_max_age=0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS and not DB_POOL_MAX_SIZE,
+        ssl_require=not DEBUG and DATABASE_REPLICA_URL.startswith("postgres"),
+    )
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    if "pool" in DATABASES["default"].get("OPTIONS", {}):
+        DATABASES["replica"].setdefault("OPTIONS", {})["pool"] = DATABASES["default"]["OPTIONS"]["pool"]
+
+DATABASE_ROUTERS = ["core.db_router.ReplicaRouter"]
+
+# Cache compartilhado entre os workers: Redis em produção (REDIS_URL); sem ele,
+# CACHE_DIR usa arquivos em disco e, por fim, LocMem (um cache por processo).
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_DIR = os.getenv("CACHE_DIR")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "oficina",
+        }
+    }
+elif CACHE_DIR:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Token exigido pelo /metrics (Authorization: Bearer <token>). Sem ele, o
+# endpoint só responde com DEBUG.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Profiling de requisições da /api/ (core.profiling): fração amostrada (0 a 1)
+# e limiar de latência em ms para guardar SQL/Drive (0 desliga).
+PROFILING_TAXA_AMOSTRAGEM = float(os.getenv("PROFILING_TAXA_AMOSTRAGEM", "0"))
+PROFILING_LIMIAR_MS = int(os.getenv("PROFILING_LIMIAR_MS", "0"))
+
+# Tracing (core.tracing): exporta os spans para um arquivo JSON-lines e/ou
+# para um coletor OTLP/HTTP (ex.: http://otel-collector:4318). Sem nenhum, desliga.
+TRACING_JSONL_PATH = os.getenv("TRACING_JSONL_PATH")
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT")
+# Traces aguardando envio ao coletor OTLP; acima disso são descartados
+TRACING_OTLP_FILA_MAX = int(os.getenv("TRACING_OTLP_FILA_MAX", "1000"))
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "oficina")
+
+# Validade padrão (em segundos) das entradas de core.services.cache
+CACHE_TTL_SEGUNDOS = int(os.getenv("CACHE_TTL_SEGUNDOS", "300"))
+
 
 
 
@@ -184,9 +357,15 @@ SIMPLE_JWT = {
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "filters": {
+        "trace": {
+            "()": "core.tracing.TraceLogFilter",
+        },
+    },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
+            "filters": ["trace"],
         },
     },
     "loggers": {
@@ -21,6 +21,7 @@ from django.conf.urls.static import static
 from django.shortcuts import render
 from django.views.generic import RedirectView, TemplateView
 from core.authentication import CustomTokenObtainPairView
+from core.views import metricas_view
 
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -95,6 +96,9 @@ urlpatterns = [
     # Rotas da API
     path('api/', include('core.api_urls')),
 
+    # Métricas Prometheus
+    path('metrics', metricas_view, name='metrics'),
+
     #painel
     path("painel/login/", TemplateView.as_view(template_name="painel/login.html"), name="painel_login"),
     path("painel/", painel_dashboard, name="painel_dashboard"),
@@ -1,5 +1,29 @@
-from django.contrib import admin
-from .models import Oficina, UsuarioOficina, Etapa, ConfigFoto, OS, FotoOS, OficinaDriveConfig
+from django.contrib import admin, messages
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import (
+    Oficina,
+    UsuarioOficina,
+    Etapa,
+    ConfigFoto,
+    OS,
+    FotoOS,
+    OficinaDriveConfig,
+    OSArquivada,
+    PerfilRequisicao,
+    SyncJob,
+    TarefaDrive,
+)
+from .profiling import montar_relatorio
+from .services.arquivamento import (
+    ConflitoReidratacao,
+    agendar_restauracao_arquivos,
+    reidratar_os,
+)
 
 
 
@@ -76,4 +100,87 @@ class FotoOSAdmin(admin.ModelAdmin):
 class OficinaDriveConfigAdmin(admin.ModelAdmin):
     list_display = ("oficina", "ativo", "root_folder_id", "atualizado_em")
     search_fields = ("oficina__nome", "root_folder_id")
-    list_filter = ("ativo",)
\ No newline at end of file
+    list_filter = ("ativo",)
+
+
+@admin.register(SyncJob)
+class SyncJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "oficina", "user", "status", "itens_processados", "total_itens", "criado_em")
+    list_filter = ("status", "oficina")
+    readonly_fields = ("resultados", "criado_em", "iniciado_em", "finalizado_em")
+
+
+@admin.register(TarefaDrive)
+class TarefaDriveAdmin(admin.ModelAdmin):
+    list_display = ("id", "oficina", "tipo", "status", "tentativas", "criado_em", "finalizado_em")
+    list_filter = ("status", "tipo", "oficina")
+    readonly_fields = ("parametros", "criado_em", "atualizado_em", "finalizado_em")
+
+
+@admin.register(OSArquivada)
+class OSArquivadaAdmin(admin.ModelAdmin):
+    list_display = ("codigo", "oficina", "placa", "nome_cliente", "data_saida", "arquivada_em")
+    list_filter = ("oficina",)
+    search_fields = ("codigo", "placa", "placa_normalizada", "nome_cliente")
+    exclude = ("dados",)
+    actions = ["reidratar"]
+
+    @admin.action(description="Reidratar OS selecionadas")
+    def reidratar(self, request, queryset):
+        total = 0
+        for arquivada in queryset:
+            try:
+                with transaction.atomic():
+                    os_obj = reidratar_os(arquivada, baixar_fotos=False)
+                    agendar_restauracao_arquivos(os_obj)
+            except ConflitoReidratacao as exc:
+                self.message_user(request, f"{arquivada.codigo}: {exc}", level=messages.ERROR)
+                continue
+            total += 1
+        self.message_user(request, f"{total} OS reidratada(s).")
+
+
+@admin.register(PerfilRequisicao)
+class PerfilRequisicaoAdmin(admin.ModelAdmin):
+    list_display = (
+        "request_id",
+        "metodo",
+        "caminho",
+        "status_code",
+        "duracao_ms",
+        "total_consultas",
+        "motivo",
+        "oficina",
+        "criado_em",
+        "download",
+    )
+    list_filter = ("motivo", "oficina", "view")
+    search_fields = ("request_id", "caminho", "view")
+    exclude = ("consultas", "chamadas_drive", "perfil")
+    readonly_fields = [f.name for f in PerfilRequisicao._meta.fields if f.name not in ("consultas", "chamadas_drive", "perfil")]
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<int:pk>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="core_perfilrequisicao_download",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    @admin.display(description="Relatório")
+    def download(self, obj):
+        url = reverse("admin:core_perfilrequisicao_download", args=[obj.pk])
+        return format_html('<a href="{}">baixar</a>', url)
+
+    def download_view(self, request, pk):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        perfil = get_object_or_404(PerfilRequisicao, pk=pk)
+        response = HttpResponse(montar_relatorio(perfil), content_type="text/plain; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="perfil-{perfil.request_id}.txt"'
+        return response
@@ -8,14 +8,19 @@ from .views import (
     AuthMeView,
     ConfigFotoViewSet,
     EtapaViewSet,
+    FotoOSUploadView,
     FotoOSViewSet,
     GoogleDriveAuthURLView,
     GoogleDriveOAuth2CallbackView,
+    OSArquivadaReidratarView,
     OSViewSet,
     OficinaDriveStatusView,
     OficinaViewSet,
     ProximaEtapaAPIView,
+    PwaBootstrapView,
+    PwaChangesView,
     PwaVeiculosEmProducaoView,
+    SyncJobDetailView,
     SyncView,
     UsuarioOficinaViewSet,
 )
@@ -35,7 +40,15 @@ router.register(r"fotos-os", FotoOSViewSet)
 urlpatterns = [
     # Operações gerais
     path("sync/", SyncView.as_view(), name="sync"),
+    path("sync/jobs/<int:pk>/", SyncJobDetailView.as_view(), name="sync-job-detail"),
+    # Antes do router: "upload" casaria com fotos-os/<pk>/
+    path("fotos-os/upload/", FotoOSUploadView.as_view(), name="fotos-os-upload"),
     path("dashboard-resumo/", DashboardResumoView.as_view(), name="dashboard-resumo"),
+    path(
+        "os-arquivadas/<int:os_id>/reidratar/",
+        OSArquivadaReidratarView.as_view(),
+        name="os-arquivada-reidratar",
+    ),
 
     # Autenticação
     path("auth/me/", AuthMeView.as_view(), name="auth-me"),
@@ -62,6 +75,8 @@ urlpatterns = [
         PwaVeiculosEmProducaoView.as_view(),
         name="pwa-veiculos-em-producao",
     ),
+    path("pwa/changes/", PwaChangesView.as_view(), name="pwa-changes"),
+    path("pwa/bootstrap/", PwaBootstrapView.as_view(), name="pwa-bootstrap"),
     path("etapas/proxima/", ProximaEtapaAPIView.as_view(), name="proxima-etapa"),
 ]
 
@@ -0,0 +1,150 @@
+"""
+Réplica de leitura (``DATABASE_REPLICA_URL``) para os endpoints só de leitura.
+
+Só vão para a réplica as views que pedem, via atributo na classe:
+
+- APIView: ``acoes_na_replica = ("get",)``;
+- ViewSet: ``acoes_na_replica = ("list",)``.
+
+Regras:
+- read-your-writes: qualquer escrita na requisição fixa as leituras seguintes
+  no primário; e o mesmo cliente (Authorization/sessão) continua no primário
+  por ``REPLICA_PIN_SEGUNDOS`` depois de escrever;
+- atraso: se a réplica estiver mais de ``REPLICA_LAG_MAX_SEGUNDOS`` atrás (ou
+  inacessível), as leituras voltam ao primário. O atraso é medido no máximo a
+  cada ``REPLICA_LAG_CHECAGEM_SEGUNDOS`` por processo.
+"""
+import hashlib
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+_leitura_na_replica: ContextVar[bool] = ContextVar("leitura_na_replica", default=False)
+_escreveu: ContextVar[bool] = ContextVar("escreveu_no_primario", default=False)
+
+_lock_atraso = threading.Lock()
+_estado_atraso = {"checado_em": None, "disponivel": False}
+
+SQL_ATRASO_POSTGRES = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def alias_replica():
+    return getattr(settings, "DATABASE_REPLICA_ALIAS", None)
+
+
+def medir_atraso_replica(alias: str) -> float:
+    """Atraso da réplica em segundos (0 fora do PostgreSQL, ex.: SQLite nos testes)."""
+    conexao = connections[alias]
+    if conexao.vendor != "postgresql":
+        return 0.0
+    with conexao.cursor() as cursor:
+        cursor.execute(SQL_ATRASO_POSTGRES)
+        return float(cursor.fetchone()[0] or 0)
+
+
+def replica_disponivel() -> bool:
+    alias = alias_replica()
+    if not alias:
+        return False
+
+    agora = time.monotonic()
+    intervalo = getattr(settings, "REPLICA_LAG_CHECAGEM_SEGUNDOS", 5)
+    checado_em = _estado_atraso["checado_em"]
+    if checado_em is not None and agora - checado_em < intervalo:
+        return _estado_atraso["disponivel"]
+
+    with _lock_atraso:
+        if _estado_atraso["checado_em"] != checado_em:
+            return _estado_atraso["disponivel"]
+        try:
+            atraso = medir_atraso_replica(alias)
+            disponivel = atraso <= getattr(settings, "REPLICA_LAG_MAX_SEGUNDOS", 5)
+            if not disponivel:
+                logger.warning("Réplica atrasada; leituras no primário", extra={"atraso_s": atraso})
+        except Exception:
+            logger.warning("Réplica inacessível; leituras no primário", exc_info=True)
+            disponivel = False
+        _estado_atraso.update(checado_em=agora, disponivel=disponivel)
+        return disponivel
+
+
+def lendo_da_replica() -> bool:
+    """True quando as leituras desta requisição estão indo para a réplica."""
+    return _leitura_na_replica.get() and not _escreveu.get() and replica_disponivel()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if lendo_da_replica():
+            return alias_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        _escreveu.set(True)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e primário têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != alias_replica()
+
+
+def _chave_pin(request):
+    identidade = request.META.get("HTTP_AUTHORIZATION") or request.COOKIES.get(
+        settings.SESSION_COOKIE_NAME
+    )
+    if not identidade:
+        return None
+    return "replica_pin:" + hashlib.sha256(identidade.encode()).hexdigest()[:32]
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    """Liga a leitura na réplica para as views marcadas com ``acoes_na_replica``."""
+
+    def process_request(self, request):
+        # Contextvars sobrevivem entre requisições da mesma thread do worker
+        _leitura_na_replica.set(False)
+        _escreveu.set(False)
+        request._replica_pin = None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not alias_replica():
+            return None
+
+        cls = getattr(view_func, "cls", None)
+        acoes = getattr(cls, "acoes_na_replica", ())
+        if not acoes:
+            return None
+
+        metodo = request.method.lower()
+        acao = (getattr(view_func, "actions", None) or {}).get(metodo, metodo)
+        if acao not in acoes:
+            return None
+
+        request._replica_pin = _chave_pin(request)
+        if request._replica_pin and cache.get(request._replica_pin):
+            return None
+
+        _leitura_na_replica.set(True)
+        return None
+
+    def process_response(self, request, response):
+        if _escreveu.get() and alias_replica():
+            chave = getattr(request, "_replica_pin", None) or _chave_pin(request)
+            if chave:
+                cache.set(chave, 1, getattr(settings, "REPLICA_PIN_SEGUNDOS", 10))
+        _leitura_na_replica.set(False)
+        return response
@@ -0,0 +1,629 @@
+"""
+Cliente assíncrono do Google Drive (REST v3 via httpx) para as views async.
+
+Cada chamada é um ``await`` em socket, sem prender thread: sob uvicorn um
+único processo mantém centenas de chamadas lentas ao Drive em andamento.
+Usa as mesmas credenciais salvas em OficinaDriveConfig (token, refresh_token,
+token_uri, client_id, client_secret); um 401 renova o token uma vez e grava o
+novo access token no banco. As appProperties, os nomes de pasta e o cache de
+subpastas são os mesmos de core.drive_service, então os dois caminhos
+enxergam as mesmas pastas.
+"""
+import asyncio
+import json
+import logging
+import mimetypes
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from core.drive_circuito import (
+    MOTIVO_AUTENTICACAO,
+    CircuitoDriveAberto,
+    circuito_aberto,
+    motivo_por_status,
+    permitir_chamada,
+    registrar_falha,
+    registrar_sucesso,
+)
+from core.drive_service import (
+    MIME_PASTA,
+    NOME_PASTA_LIVRES,
+    _chave_cache_subpasta,
+    _guardar_subpasta_no_cache,
+    nome_pasta_etapa,
+    nome_pasta_os,
+    propriedades_pasta_etapa,
+    propriedades_pasta_livres,
+    propriedades_pasta_os,
+    query_pasta,
+)
+from core.metricas import medir_chamada_drive
+from core.models import OS, FotoOS, OficinaDriveConfig
+
+logger = logging.getLogger(__name__)
+
+URL_ARQUIVOS = "https://www.googleapis.com/drive/v3/files"
+URL_UPLOAD = "https://www.googleapis.com/upload/drive/v3/files"
+TOKEN_URI_PADRAO = "https://oauth2.googleapis.com/token"
+
+
+class ErroDriveAsync(Exception):
+    pass
+
+
+# Falhas esperadas de uma chamada ao Drive (rede, HTTP, credenciais, resposta inesperada)
+ERROS_DRIVE = (httpx.HTTPError, ErroDriveAsync, CircuitoDriveAberto, KeyError, ValueError, OSError)
+
+
+class LimitadorTaxa:
+    """
+    Espaça as chamadas ao Drive deste processo em no máximo
+    ``DRIVE_REQUISICOES_POR_SEGUNDO`` (0 desliga). Cada chamada reserva o
+    próximo horário livre sob um lock de thread e espera com asyncio.sleep,
+    então vale entre threads e event loops diferentes do mesmo processo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._proxima = 0.0
+
+    async def aguardar(self):
+        taxa = float(getattr(settings, "DRIVE_REQUISICOES_POR_SEGUNDO", 0) or 0)
+        if taxa <= 0:
+            return
+
+        with self._lock:
+            agora = time.monotonic()
+            horario = max(agora, self._proxima)
+            self._proxima = horario + 1 / taxa
+
+        if horario > agora:
+            await asyncio.sleep(horario - agora)
+
+
+limitador_drive = LimitadorTaxa()
+
+
+class ClienteDriveAsync:
+    """
+    Uso::
+
+        async with ClienteDriveAsync(config) as drive:
+            pasta_id = await drive.obter_ou_criar_pasta(
+                "OS-1", config.root_folder_id, propriedades=propriedades_pasta_os(os_obj)
+            )
+    """
+
+    def __init__(self, config: OficinaDriveConfig, http: Optional[httpx.AsyncClient] = None):
+        self.config = config
+        self.credenciais = json.loads(config.credentials_json or "{}")
+        self._http = http
+        self._http_proprio = http is None
+
+    async def __aenter__(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=getattr(settings, "DRIVE_HTTP_TIMEOUT_SEGUNDOS", 30))
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._http_proprio and self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _renovar_token(self):
+        refresh_token = self.credenciais.get("refresh_token")
+        if not refresh_token:
+            await self._registrar_falha(MOTIVO_AUTENTICACAO)
+            raise ErroDriveAsync("Credenciais do Drive sem refresh_token.")
+
+        with medir_chamada_drive("token"):
+            resposta = await self._http.post(
+                self.credenciais.get("token_uri") or TOKEN_URI_PADRAO,
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": refresh_token,
+                    "client_id": self.credenciais.get("client_id"),
+                    "client_secret": self.credenciais.get("client_secret"),
+                },
+            )
+            if resposta.status_code in (400, 401):
+                # invalid_grant: refresh_token revogado ou expirado
+                await self._registrar_falha(MOTIVO_AUTENTICACAO)
+            resposta.raise_for_status()
+
+        self.credenciais["token"] = resposta.json()["access_token"]
+        self.config.credentials_json = json.dumps(self.credenciais)
+        await OficinaDriveConfig.objects.filter(pk=self.config.pk).aupdate(
+            credentials_json=self.config.credentials_json,
+            atualizado_em=timezone.now(),
+        )
+
+    async def _registrar_falha(self, motivo: str):
+        await sync_to_async(registrar_falha, thread_sensitive=False)(self.config.oficina_id, motivo)
+
+    async def _registrar_resultado(self, status_code: int, na_raiz: bool):
+        """Alimenta o circuito da oficina (core.drive_circuito)."""
+        if status_code < 400:
+            await sync_to_async(registrar_sucesso, thread_sensitive=False)(self.config.oficina_id)
+            return
+        motivo = motivo_por_status(status_code, na_raiz)
+        if motivo:
+            await self._registrar_falha(motivo)
+
+    def _na_raiz(self, parent_id: Optional[str]) -> bool:
+        return bool(parent_id) and parent_id == self.config.root_folder_id
+
+    async def _requisicao(
+        self, operacao: str, metodo: str, url: str, *, na_raiz: bool = False, **kwargs
+    ) -> dict:
+        """``na_raiz``: list/create direto na pasta raiz, onde um 404 abre o circuito."""
+        headers_extra = kwargs.pop("headers", {})
+        if not await sync_to_async(permitir_chamada, thread_sensitive=False)(self.config.oficina_id):
+            raise CircuitoDriveAberto(f"Circuito do Drive aberto para a oficina {self.config.oficina_id}.")
+        for tentativa in range(2):
+            headers = {
+                **headers_extra,
+                "Authorization": f"Bearer {self.credenciais.get('token') or ''}",
+            }
+            await limitador_drive.aguardar()
+            with medir_chamada_drive(operacao):
+                resposta = await self._http.request(metodo, url, headers=headers, **kwargs)
+                if resposta.status_code != 401 or tentativa:
+                    await self._registrar_resultado(resposta.status_code, na_raiz)
+                    resposta.raise_for_status()
+                    return resposta.json()
+            # Access token expirado: renova uma vez e repete
+            await self._renovar_token()
+
+    async def buscar_pasta(self, parent_id: str, propriedades: dict) -> Optional[str]:
+        dados = await self._requisicao(
+            "list",
+            "GET",
+            URL_ARQUIVOS,
+            params={
+                "q": query_pasta(parent_id, propriedades),
+                "fields": "files(id, name)",
+                "orderBy": "createdTime",
+                "spaces": "drive",
+            },
+            na_raiz=self._na_raiz(parent_id),
+        )
+        arquivos = dados.get("files", [])
+        return arquivos[0]["id"] if arquivos else None
+
+    async def criar_pasta(
+        self, nome: str, parent_id: Optional[str] = None, propriedades: Optional[dict] = None
+    ) -> str:
+        metadados = {"name": nome, "mimeType": MIME_PASTA}
+        if parent_id:
+            metadados["parents"] = [parent_id]
+        if propriedades:
+            metadados["appProperties"] = propriedades
+        dados = await self._requisicao(
+            "create",
+            "POST",
+            URL_ARQUIVOS,
+            params={"fields": "id"},
+            json=metadados,
+            na_raiz=self._na_raiz(parent_id),
+        )
+        return dados["id"]
+
+    async def obter_ou_criar_pasta(self, nome: str, parent_id: str, *, propriedades: dict) -> str:
+        """Pasta de parent_id com estas appProperties; ``nome`` só é usado ao criar."""
+        chave = await sync_to_async(_chave_cache_subpasta, thread_sensitive=False)(
+            propriedades.get("oficina_id"), parent_id, propriedades
+        )
+        if chave:
+            folder_id = await _cache_get(chave)
+            if folder_id:
+                return folder_id
+
+        folder_id = await self.buscar_pasta(parent_id, propriedades) or await self.criar_pasta(
+            nome, parent_id, propriedades
+        )
+        await sync_to_async(_guardar_subpasta_no_cache, thread_sensitive=False)(chave, folder_id)
+        return folder_id
+
+    async def listar_subpastas(self, parent_id: str) -> List[dict]:
+        """Subpastas de parent_id com nome e appProperties (todas as páginas)."""
+        pastas = []
+        pagina = None
+        while True:
+            params = {
+                "q": f"mimeType='{MIME_PASTA}' and '{parent_id}' in parents and trashed=false",
+                "fields": "nextPageToken, files(id, name, appProperties, createdTime)",
+                "orderBy": "createdTime",
+                "pageSize": 100,
+            }
+            if pagina:
+                params["pageToken"] = pagina
+            dados = await self._requisicao(
+                "list", "GET", URL_ARQUIVOS, params=params, na_raiz=self._na_raiz(parent_id)
+            )
+            pastas.extend(dados.get("files", []))
+            pagina = dados.get("nextPageToken")
+            if not pagina:
+                return pastas
+
+    async def atualizar_propriedades(self, file_id: str, propriedades: dict) -> None:
+        await self._requisicao(
+            "update",
+            "PATCH",
+            f"{URL_ARQUIVOS}/{file_id}",
+            params={"fields": "id"},
+            json={"appProperties": propriedades},
+        )
+
+    async def listar_pastas(self, propriedades: dict) -> List[dict]:
+        """Pastas com estas appProperties em qualquer lugar do Drive (todas as páginas)."""
+        pastas = []
+        pagina = None
+        while True:
+            params = {
+                "q": query_pasta(None, propriedades),
+                "fields": "nextPageToken, files(id, name)",
+                "pageSize": 100,
+                "spaces": "drive",
+            }
+            if pagina:
+                params["pageToken"] = pagina
+            dados = await self._requisicao("list", "GET", URL_ARQUIVOS, params=params)
+            pastas.extend(dados.get("files", []))
+            pagina = dados.get("nextPageToken")
+            if not pagina:
+                return pastas
+
+    async def renomear(self, file_id: str, nome: str) -> None:
+        await self._requisicao(
+            "update",
+            "PATCH",
+            f"{URL_ARQUIVOS}/{file_id}",
+            params={"fields": "id"},
+            json={"name": nome},
+        )
+
+    async def enviar_arquivo(self, conteudo: bytes, nome: str, parent_id: str, mime: str) -> str:
+        """Upload multipart (metadados + conteúdo numa única requisição)."""
+        fronteira = uuid.uuid4().hex
+        metadados = json.dumps({"name": nome, "parents": [parent_id]})
+        corpo = (
+            f"--{fronteira}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+            f"{metadados}\r\n--{fronteira}\r\nContent-Type: {mime}\r\n\r\n"
+        ).encode() + conteudo + f"\r\n--{fronteira}--".encode()
+
+        dados = await self._requisicao(
+            "upload",
+            "POST",
+            URL_UPLOAD,
+            params={"uploadType": "multipart", "fields": "id"},
+            content=corpo,
+            headers={"Content-Type": f"multipart/related; boundary={fronteira}"},
+        )
+        return dados["id"]
+
+
+async def _cache_get(chave: str):
+    from django.core.cache import cache
+
+    try:
+        return await cache.aget(chave)
+    except Exception:
+        logger.warning("Cache de pastas do Drive indisponível", exc_info=True)
+        return None
+
+
+async def obter_config_ativa(oficina_id) -> Optional[OficinaDriveConfig]:
+    return await OficinaDriveConfig.objects.filter(oficina_id=oficina_id, ativo=True).afirst()
+
+
+def _ler_arquivo(foto: FotoOS) -> bytes:
+    with foto.arquivo.open("rb") as arquivo:
+        return arquivo.read()
+
+
+async def garantir_pasta_os_async(drive: ClienteDriveAsync, os_obj: OS) -> str:
+    if os_obj.drive_folder_id:
+        return os_obj.drive_folder_id
+
+    folder_id = await drive.obter_ou_criar_pasta(
+        nome_pasta_os(os_obj), drive.config.root_folder_id, propriedades=propriedades_pasta_os(os_obj)
+    )
+    os_obj.drive_folder_id = folder_id
+    await OS.objects.filter(pk=os_obj.pk).aupdate(drive_folder_id=folder_id)
+    return folder_id
+
+
+async def enviar_foto_com_cliente(drive: ClienteDriveAsync, foto: FotoOS) -> str:
+    """Garante as pastas da OS e da etapa, envia o arquivo e grava foto.drive_file_id."""
+    os_obj = foto.os
+    pasta_os_id = await garantir_pasta_os_async(drive, os_obj)
+    pasta_etapa_id = await drive.obter_ou_criar_pasta(
+        nome_pasta_etapa(foto.etapa),
+        pasta_os_id,
+        propriedades=propriedades_pasta_etapa(os_obj, foto.etapa_id),
+    )
+    conteudo = await sync_to_async(_ler_arquivo, thread_sensitive=False)(foto)
+    file_id = await drive.enviar_arquivo(
+        conteudo,
+        foto.arquivo.name,
+        pasta_etapa_id,
+        mimetypes.guess_type(foto.arquivo.name)[0] or "image/jpeg",
+    )
+
+    foto.drive_file_id = file_id
+    await FotoOS.objects.filter(pk=foto.pk).aupdate(
+        drive_file_id=file_id, atualizado_em=timezone.now()
+    )
+    return file_id
+
+
+async def enviar_foto_drive_async(foto: FotoOS, http: Optional[httpx.AsyncClient] = None) -> Optional[str]:
+    """
+    Versão async de drive_service.upload_foto_para_drive: garante as pastas da
+    OS e da etapa, envia o arquivo e grava foto.drive_file_id.
+    ``foto`` deve vir com ``os`` e ``etapa`` carregados (select_related).
+    """
+    if foto.drive_file_id:
+        return foto.drive_file_id
+
+    os_obj = foto.os
+    extra_log = {"oficina_id": os_obj.oficina_id, "os_id": os_obj.id, "foto_id": foto.id}
+
+    if not foto.arquivo or foto.etapa is None:
+        logger.warning("Foto sem arquivo ou etapa para o Drive", extra=extra_log)
+        return None
+
+    config = await obter_config_ativa(os_obj.oficina_id)
+    if config is None or not config.root_folder_id:
+        logger.warning("Drive async sem configuração ativa", extra=extra_log)
+        return None
+    if await sync_to_async(circuito_aberto, thread_sensitive=False)(os_obj.oficina_id):
+        logger.warning("Drive com circuito aberto; foto fica para depois", extra=extra_log)
+        return None
+
+    try:
+        async with ClienteDriveAsync(config, http=http) as drive:
+            return await enviar_foto_com_cliente(drive, foto)
+    except ERROS_DRIVE:
+        logger.exception("Erro ao enviar foto para o Drive (async)", extra=extra_log)
+        return None
+
+
+async def enviar_fotos_drive_async(
+    fotos: List[FotoOS], http: Optional[httpx.AsyncClient] = None
+) -> List[Optional[str]]:
+    """
+    Envia um lote de fotos da mesma OS com um único cliente HTTP e no máximo
+    ``DRIVE_UPLOAD_CONCORRENCIA`` uploads simultâneos. A primeira foto sobe
+    sozinha: ela cria as pastas da OS/etapa, que as demais acham no cache em
+    vez de criar duplicadas em paralelo.
+    """
+    if not fotos:
+        return []
+
+    # Mesma instância de OS para todo o lote: a pasta criada pela primeira vale para as outras
+    os_obj = fotos[0].os
+    for foto in fotos:
+        if foto.os_id == os_obj.id:
+            foto.os = os_obj
+
+    limite = asyncio.Semaphore(max(1, getattr(settings, "DRIVE_UPLOAD_CONCORRENCIA", 4)))
+
+    async def enviar(foto: FotoOS, cliente: httpx.AsyncClient) -> Optional[str]:
+        async with limite:
+            return await enviar_foto_drive_async(foto, http=cliente)
+
+    async def enviar_lote(cliente: httpx.AsyncClient) -> List[Optional[str]]:
+        primeira = await enviar(fotos[0], cliente)
+        demais = await asyncio.gather(*(enviar(foto, cliente) for foto in fotos[1:]))
+        return [primeira, *demais]
+
+    if http is not None:
+        return await enviar_lote(http)
+    async with httpx.AsyncClient(timeout=getattr(settings, "DRIVE_HTTP_TIMEOUT_SEGUNDOS", 30)) as cliente:
+        return await enviar_lote(cliente)
+
+
+async def backfill_os_async(
+    config: OficinaDriveConfig,
+    os_lista: List[OS],
+    fotos_por_os: Dict[int, List[FotoOS]],
+    *,
+    concorrencia: int,
+    http: Optional[httpx.AsyncClient] = None,
+) -> Dict[str, int]:
+    """
+    Backfill de um lote de OS da mesma oficina (manage.py drive_backfill).
+
+    Primeiro cria a árvore de pastas de cada OS (pasta da OS e pastas das
+    etapas com fotos pendentes), depois envia as fotos; no máximo
+    ``concorrencia`` chamadas ficam em andamento, sob o limitador de taxa.
+    Falhas ficam sem drive_folder_id/drive_file_id e entram na próxima execução.
+    """
+    resultado = {"pastas_os": 0, "enviadas": 0, "falhas": 0}
+    limite = asyncio.Semaphore(max(1, concorrencia))
+
+    async with ClienteDriveAsync(config, http=http) as drive:
+
+        async def preparar_arvore(os_obj: OS) -> bool:
+            etapas = {foto.etapa_id: foto.etapa for foto in fotos_por_os.get(os_obj.id, [])}
+            async with limite:
+                try:
+                    tinha_pasta = bool(os_obj.drive_folder_id)
+                    pasta_os_id = await garantir_pasta_os_async(drive, os_obj)
+                    if not tinha_pasta:
+                        resultado["pastas_os"] += 1
+                    for etapa in etapas.values():
+                        await drive.obter_ou_criar_pasta(
+                            nome_pasta_etapa(etapa),
+                            pasta_os_id,
+                            propriedades=propriedades_pasta_etapa(os_obj, etapa.id),
+                        )
+                except ERROS_DRIVE:
+                    logger.exception(
+                        "Backfill do Drive: falha ao criar pastas",
+                        extra={"oficina_id": os_obj.oficina_id, "os_id": os_obj.id},
+                    )
+                    return False
+            return True
+
+        async def enviar(foto: FotoOS):
+            async with limite:
+                try:
+                    await enviar_foto_com_cliente(drive, foto)
+                except ERROS_DRIVE:
+                    logger.exception(
+                        "Backfill do Drive: falha ao enviar foto",
+                        extra={"oficina_id": foto.os.oficina_id, "os_id": foto.os_id, "foto_id": foto.id},
+                    )
+                    resultado["falhas"] += 1
+                else:
+                    resultado["enviadas"] += 1
+
+        prontas = await asyncio.gather(*(preparar_arvore(os_obj) for os_obj in os_lista))
+
+        fotos = []
+        for os_obj, pronta in zip(os_lista, prontas):
+            pendentes = fotos_por_os.get(os_obj.id, [])
+            if pronta:
+                fotos.extend(pendentes)
+            else:
+                resultado["falhas"] += len(pendentes)
+
+        await asyncio.gather(*(enviar(foto) for foto in fotos))
+
+    return resultado
+
+
+async def marcar_pastas_oficina_async(
+    config: OficinaDriveConfig,
+    os_lista: List[OS],
+    etapas: List,
+    *,
+    concorrencia: int,
+    http: Optional[httpx.AsyncClient] = None,
+) -> Dict[str, int]:
+    """
+    Migração única das pastas criadas antes das appProperties (manage.py
+    drive_marcar_pastas): marca a pasta de cada OS e as subpastas de etapa e
+    de fotos livres reconhecidas pelo nome. OS sem drive_folder_id são ligadas
+    à pasta de mesmo nome na raiz, se houver. Entre subpastas repetidas só a
+    mais antiga é marcada; as outras são contadas como duplicadas.
+    """
+    resultado = {"os": 0, "subpastas": 0, "duplicadas": 0, "falhas": 0}
+    limite = asyncio.Semaphore(max(1, concorrencia))
+
+    etapa_por_nome = {}
+    for etapa in etapas:
+        # Nome atual ("01 - Funilaria") e o antigo, só com o nome da etapa
+        etapa_por_nome.setdefault(nome_pasta_etapa(etapa), etapa.id)
+        etapa_por_nome.setdefault(etapa.nome, etapa.id)
+
+    async with ClienteDriveAsync(config, http=http) as drive:
+        sem_pasta = {nome_pasta_os(os_obj): os_obj for os_obj in os_lista if not os_obj.drive_folder_id}
+        if sem_pasta:
+            for pasta in await drive.listar_subpastas(config.root_folder_id):
+                os_obj = sem_pasta.pop(pasta["name"], None)
+                if os_obj is not None and not (pasta.get("appProperties") or {}).get("tipo"):
+                    os_obj.drive_folder_id = pasta["id"]
+                    await OS.objects.filter(pk=os_obj.pk).aupdate(drive_folder_id=pasta["id"])
+
+        async def marcar(os_obj: OS):
+            async with limite:
+                try:
+                    await drive.atualizar_propriedades(os_obj.drive_folder_id, propriedades_pasta_os(os_obj))
+                    vistas = set()
+                    for pasta in await drive.listar_subpastas(os_obj.drive_folder_id):
+                        if pasta["name"] == NOME_PASTA_LIVRES:
+                            chave, propriedades = "livres", propriedades_pasta_livres(os_obj)
+                        elif pasta["name"] in etapa_por_nome:
+                            chave = etapa_por_nome[pasta["name"]]
+                            propriedades = propriedades_pasta_etapa(os_obj, chave)
+                        else:
+                            continue
+
+                        if chave in vistas:
+                            resultado["duplicadas"] += 1
+                            continue
+                        vistas.add(chave)
+                        if (pasta.get("appProperties") or {}).get("tipo"):
+                            continue
+                        await drive.atualizar_propriedades(pasta["id"], propriedades)
+                        resultado["subpastas"] += 1
+                except ERROS_DRIVE:
+                    logger.exception(
+                        "Falha ao marcar pastas do Drive",
+                        extra={"oficina_id": os_obj.oficina_id, "os_id": os_obj.id},
+                    )
+                    resultado["falhas"] += 1
+                else:
+                    resultado["os"] += 1
+
+        await asyncio.gather(*(marcar(os_obj) for os_obj in os_lista if os_obj.drive_folder_id))
+
+    return resultado
+
+
+async def renomear_pastas_etapas_async(
+    config: OficinaDriveConfig,
+    etapas: List,
+    *,
+    concorrencia: int,
+    http: Optional[httpx.AsyncClient] = None,
+) -> Dict[str, int]:
+    """
+    Aplica o nome atual ("02 - Pintura") às subpastas já criadas destas etapas
+    em todas as OS da oficina. As pastas são achadas pelas appProperties
+    (uma listagem por etapa, não uma por OS) e só as de nome diferente são
+    renomeadas.
+    """
+    resultado = {"renomeadas": 0, "falhas": 0}
+    limite = asyncio.Semaphore(max(1, concorrencia))
+
+    async with ClienteDriveAsync(config, http=http) as drive:
+
+        async def renomear(pasta_id: str, nome: str, etapa_id):
+            async with limite:
+                try:
+                    await drive.renomear(pasta_id, nome)
+                except ERROS_DRIVE:
+                    logger.exception(
+                        "Falha ao renomear pasta de etapa no Drive",
+                        extra={"oficina_id": config.oficina_id, "etapa_id": etapa_id},
+                    )
+                    resultado["falhas"] += 1
+                else:
+                    resultado["renomeadas"] += 1
+
+        tarefas = []
+        for etapa in etapas:
+            nome = nome_pasta_etapa(etapa)
+            propriedades = {
+                "tipo": "etapa",
+                "oficina_id": str(config.oficina_id),
+                "etapa_id": str(etapa.id),
+            }
+            try:
+                pastas = await drive.listar_pastas(propriedades)
+            except ERROS_DRIVE:
+                logger.exception(
+                    "Falha ao listar pastas de etapa no Drive",
+                    extra={"oficina_id": config.oficina_id, "etapa_id": etapa.id},
+                )
+                resultado["falhas"] += 1
+                continue
+            tarefas += [
+                renomear(pasta["id"], nome, etapa.id) for pasta in pastas if pasta.get("name") != nome
+            ]
+
+        await asyncio.gather(*tarefas)
+
+    return resultado
@@ -0,0 +1,200 @@
+"""
+Disjuntor (circuit breaker) da integração com o Drive, por oficina.
+
+Token revogado ou pasta raiz apagada fazem toda chamada ao Drive falhar, cada
+uma depois de um timeout de rede. Depois de ``DRIVE_CIRCUITO_FALHAS`` falhas
+seguidas de autenticação (401, refresh recusado) ou de pasta raiz não
+encontrada (404 ao listar ou criar direto na root_folder_id), o circuito abre
+por ``DRIVE_CIRCUITO_ABERTO_SEGUNDOS``: nesse tempo nenhuma chamada à oficina
+sai do processo. Passado o prazo, uma única chamada (a
+sonda, de qualquer worker) é liberada; sucesso fecha o circuito, falha abre
+de novo.
+
+O estado fica no cache compartilhado (``CACHES``), então vale para todos os
+workers. Se o cache falhar, as chamadas seguem normalmente. Salvar a
+OficinaDriveConfig (ex.: reconectar o Drive) fecha o circuito.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.metricas import medir_chamada_drive
+
+logger = logging.getLogger(__name__)
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+MOTIVO_AUTENTICACAO = "autenticacao"
+MOTIVO_NAO_ENCONTRADO = "nao_encontrado"
+
+# Falhas seguidas esquecidas depois de um dia sem novas falhas
+TTL_FALHAS_SEGUNDOS = 24 * 60 * 60
+
+
+class CircuitoDriveAberto(Exception):
+    """Chamada ao Drive barrada porque o circuito da oficina está aberto."""
+
+
+def _chaves(oficina_id):
+    base = f"drive_circuito:{oficina_id}"
+    return f"{base}:falhas", f"{base}:aberto", f"{base}:sonda"
+
+
+def _limite_falhas() -> int:
+    return max(1, int(getattr(settings, "DRIVE_CIRCUITO_FALHAS", 3)))
+
+
+def circuito_aberto(oficina_id) -> bool:
+    """True enquanto o circuito está aberto (não consome a sonda)."""
+    if oficina_id is None:
+        return False
+    _, chave_aberto, _ = _chaves(oficina_id)
+    try:
+        return cache.get(chave_aberto) is not None
+    except Exception:
+        logger.warning("Cache do circuito do Drive indisponível", exc_info=True)
+        return False
+
+
+def permitir_chamada(oficina_id) -> bool:
+    """
+    Fechado: libera. Aberto: barra. Meio aberto (prazo vencido): libera só
+    para quem pegar a sonda.
+    """
+    if oficina_id is None:
+        return True
+    chave_falhas, chave_aberto, chave_sonda = _chaves(oficina_id)
+    try:
+        estado = cache.get_many([chave_falhas, chave_aberto])
+        if chave_aberto in estado:
+            return False
+        if (estado.get(chave_falhas) or 0) < _limite_falhas():
+            return True
+        janela = max(1, int(getattr(settings, "DRIVE_HTTP_TIMEOUT_SEGUNDOS", 30) * 2))
+        return cache.add(chave_sonda, 1, janela)
+    except Exception:
+        logger.warning("Cache do circuito do Drive indisponível", exc_info=True)
+        return True
+
+
+def registrar_sucesso(oficina_id):
+    if oficina_id is None:
+        return
+    chaves = _chaves(oficina_id)
+    try:
+        if cache.get(chaves[0]):
+            cache.delete_many(list(chaves))
+            logger.info("Circuito do Drive fechado", extra={"oficina_id": oficina_id})
+    except Exception:
+        logger.warning("Cache do circuito do Drive indisponível", exc_info=True)
+
+
+def registrar_falha(oficina_id, motivo: str):
+    if oficina_id is None:
+        return
+    chave_falhas, chave_aberto, chave_sonda = _chaves(oficina_id)
+    try:
+        if cache.add(chave_falhas, 1, TTL_FALHAS_SEGUNDOS):
+            falhas = 1
+        else:
+            falhas = cache.incr(chave_falhas)
+        if falhas < _limite_falhas():
+            return
+
+        duracao = int(getattr(settings, "DRIVE_CIRCUITO_ABERTO_SEGUNDOS", 300))
+        cache.set(
+            chave_aberto,
+            {"motivo": motivo, "falhas": falhas, "aberto_ate": time.time() + duracao},
+            duracao,
+        )
+        cache.delete(chave_sonda)
+        logger.warning(
+            "Circuito do Drive aberto",
+            extra={"oficina_id": oficina_id, "motivo": motivo, "falhas": falhas},
+        )
+    except ValueError:
+        # incr de chave que expirou entre o add e o incr
+        cache.set(chave_falhas, 1, TTL_FALHAS_SEGUNDOS)
+    except Exception:
+        logger.warning("Cache do circuito do Drive indisponível", exc_info=True)
+
+
+def fechar_circuito(oficina_id):
+    try:
+        cache.delete_many(list(_chaves(oficina_id)))
+    except Exception:
+        logger.warning("Cache do circuito do Drive indisponível", exc_info=True)
+
+
+def estado_circuito(oficina_id) -> dict:
+    """Estado para o painel (OficinaDriveStatusView)."""
+    chave_falhas, chave_aberto, _ = _chaves(oficina_id)
+    try:
+        dados = cache.get_many([chave_falhas, chave_aberto])
+    except Exception:
+        logger.warning("Cache do circuito do Drive indisponível", exc_info=True)
+        dados = {}
+
+    falhas = dados.get(chave_falhas) or 0
+    aberto = dados.get(chave_aberto)
+    if aberto is not None:
+        estado = ABERTO
+    elif falhas >= _limite_falhas():
+        estado = MEIO_ABERTO
+    else:
+        estado = FECHADO
+    return {
+        "estado": estado,
+        "falhas_consecutivas": falhas,
+        "motivo": aberto["motivo"] if aberto else None,
+        "nova_tentativa_em": (
+            time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(aberto["aberto_ate"])) if aberto else None
+        ),
+    }
+
+
+def motivo_por_status(status_code: Optional[int], na_raiz: bool = False) -> Optional[str]:
+    """
+    404 só conta nas operações sobre a pasta raiz da oficina: arquivo ou
+    subpasta apagados no Drive são problema daquele item, não da integração.
+    """
+    if status_code == 401:
+        return MOTIVO_AUTENTICACAO
+    if status_code == 404 and na_raiz:
+        return MOTIVO_NAO_ENCONTRADO
+    return None
+
+
+def motivo_falha_google(exc: Exception, na_raiz: bool = False) -> Optional[str]:
+    """Motivo de abertura para exceções do googleapiclient / google-auth."""
+    from google.auth.exceptions import RefreshError
+
+    if isinstance(exc, RefreshError):
+        return MOTIVO_AUTENTICACAO
+    return motivo_por_status(getattr(getattr(exc, "resp", None), "status", None), na_raiz)
+
+
+@contextmanager
+def chamada_drive(oficina_id, operacao: str, *, na_raiz: bool = False):
+    """
+    ``medir_chamada_drive`` com o circuito da oficina: barra a chamada com
+    CircuitoDriveAberto quando aberto e registra o resultado. ``na_raiz``
+    marca list/create direto na pasta raiz (onde um 404 conta como falha).
+    """
+    if not permitir_chamada(oficina_id):
+        raise CircuitoDriveAberto(f"Circuito do Drive aberto para a oficina {oficina_id}.")
+    try:
+        with medir_chamada_drive(operacao):
+            yield
+    except Exception as exc:
+        motivo = motivo_falha_google(exc, na_raiz)
+        if motivo:
+            registrar_falha(oficina_id, motivo)
+        raise
+    registrar_sucesso(oficina_id)
@@ -1,29 +1,74 @@
+import hashlib
+import io
 import json
 import logging
 import os
-from typing import Optional
-
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google.oauth2.credentials import Credentials
+from typing import TYPE_CHECKING, Optional
 
+# O cliente do Google (googleapiclient, google.oauth2) é importado dentro das
+# funções que falam com o Drive: carregá-lo custa caro e a maioria das
+# requisições, comandos e testes nunca chega a usá-lo.
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 from core.models import Etapa
 
 from django.conf import settings
+from django.core.cache import cache
 
+from .drive_circuito import chamada_drive, circuito_aberto
 from .models import OS, Etapa, FotoOS, OficinaDriveConfig
+from .services.cache import ESCOPO_DRIVE, montar_chave
 
 logger = logging.getLogger(__name__)
 
-from googleapiclient.http import MediaFileUpload
-import os
-
 
 class DriveNaoConfigurado(Exception):
     pass
 
 
+MIME_PASTA = "application/vnd.google-apps.folder"
+
+
+def nome_pasta_os(os_obj: OS) -> str:
+    return f"OS-{os_obj.codigo} - {os_obj.placa or ''} - {os_obj.modelo_veiculo or ''}".strip()
+
+
+def nome_pasta_etapa(etapa) -> str:
+    ordem = int(etapa.ordem or 0)
+    return f"{ordem:02d} - {etapa.nome}"
+
+
+NOME_PASTA_LIVRES = "00 - Livres"
+
+
+# As pastas criadas pela aplicação levam appProperties (visíveis só para este
+# app) e são encontradas por elas, não pelo nome: o nome pode mudar (placa,
+# modelo, etapa renomeada) e não entra mais na query do files().list.
+def propriedades_pasta_os(os_obj: OS) -> dict:
+    return {"tipo": "os", "oficina_id": str(os_obj.oficina_id), "os_id": str(os_obj.id)}
+
+
+def propriedades_pasta_etapa(os_obj: OS, etapa_id) -> dict:
+    return {**propriedades_pasta_os(os_obj), "tipo": "etapa", "etapa_id": str(etapa_id)}
+
+
+def propriedades_pasta_livres(os_obj: OS) -> dict:
+    return {**propriedades_pasta_os(os_obj), "tipo": "livres"}
+
+
+def query_pasta(parent_id: Optional[str], propriedades: dict) -> str:
+    """Query do files().list por appProperties; sem parent_id busca no Drive todo."""
+    filtros = [f"mimeType='{MIME_PASTA}'", "trashed=false"]
+    if parent_id:
+        filtros.insert(1, f"'{parent_id}' in parents")
+    filtros += [
+        f"appProperties has {{ key='{chave}' and value='{valor}' }}"
+        for chave, valor in sorted(propriedades.items())
+    ]
+    return " and ".join(filtros)
+
+
 def _get_oficina_drive_config(oficina) -> OficinaDriveConfig:
     try:
         config = oficina.drive_config
@@ -34,10 +79,12 @@ def _get_oficina_drive_config(oficina) -> OficinaDriveConfig:
     return config
 
 
-def _get_credentials(oficina) -> Credentials:
+def _get_credentials(oficina) -> "Credentials":
     """
     Constrói o objeto Credentials a partir do JSON salvo no banco.
     """
+    from google.oauth2.credentials import Credentials
+
     config = _get_oficina_drive_config(oficina)
     data = json.loads(config.credentials_json)
     # data deve conter os campos esperados pelo Credentials (token, refresh_token etc.)
@@ -47,17 +94,21 @@ def _get_credentials(oficina) -> Credentials:
 
 def get_drive_service(oficina):
     """
-    Retorna o client do Google Drive autenticado para a oficina.
+    Retorna o client do Google Drive autenticado para a oficina, ou None se
+    não der para criá-lo ou se o circuito da oficina estiver aberto.
     """
+    oficina_id = getattr(oficina, "id", None)
+    if circuito_aberto(oficina_id):
+        logger.warning("Drive com circuito aberto; chamada ignorada", extra={"oficina_id": oficina_id})
+        return None
     try:
+        from googleapiclient.discovery import build
+
         creds = _get_credentials(oficina)
         service = build('drive', 'v3', credentials=creds)
         return service
     except Exception:
-        logger.exception(
-            "Erro ao criar serviço do Drive",
-            extra={"oficina_id": getattr(oficina, "id", None)},
-        )
+        logger.exception("Erro ao criar serviço do Drive", extra={"oficina_id": oficina_id})
         return None
 
 
@@ -114,22 +165,18 @@ def criar_pasta_os(os_obj: OS) -> Optional[str]:
         return None
 
     # Monta os dados da pasta
-    nome_pasta = f"OS-{os_obj.codigo} - {os_obj.placa or ''} - {os_obj.modelo_veiculo or ''}".strip()
+    nome_pasta = nome_pasta_os(os_obj)
 
     # Busca pasta existente para idempotência
     try:
-        query = (
-            f"mimeType='application/vnd.google-apps.folder' "
-            f"and name='{nome_pasta}' "
-            f"and '{config.root_folder_id}' in parents "
-            f"and trashed=false"
-        )
-        response = service.files().list(
-            q=query,
-            fields="files(id, name, createdTime)",
-            orderBy="createdTime",
-            pageSize=10,
-        ).execute()
+        query = query_pasta(config.root_folder_id, propriedades_pasta_os(os_obj))
+        with chamada_drive(oficina.id, "list", na_raiz=True):
+            response = service.files().list(
+                q=query,
+                fields="files(id, name, createdTime)",
+                orderBy="createdTime",
+                pageSize=10,
+            ).execute()
         encontrados = response.get("files", [])
         if encontrados:
             folder_escolhida = encontrados[0]
@@ -157,8 +204,9 @@ def criar_pasta_os(os_obj: OS) -> Optional[str]:
 
     folder_metadata = {
         "name": nome_pasta,
-        "mimeType": "application/vnd.google-apps.folder",
+        "mimeType": MIME_PASTA,
         "parents": [config.root_folder_id],
+        "appProperties": propriedades_pasta_os(os_obj),
     }
     logger.debug(
         "Drive criar_pasta_os criando",
@@ -167,7 +215,8 @@ def criar_pasta_os(os_obj: OS) -> Optional[str]:
 
     # Chama API do Drive
     try:
-        folder = service.files().create(body=folder_metadata, fields="id").execute()
+        with chamada_drive(oficina.id, "create", na_raiz=True):
+            folder = service.files().create(body=folder_metadata, fields="id").execute()
         folder_id = folder.get("id")
         logger.info(
             "Drive criar_pasta_os criada",
@@ -201,62 +250,22 @@ def criar_pasta_os(os_obj: OS) -> Optional[str]:
 
 def _get_or_create_subpasta_etapa(os_obj: OS, etapa: Etapa) -> Optional[str]:
     """
-    Garante uma subpasta com o nome da etapa dentro da pasta da OS.
-    Retorna o ID da subpasta.
+    Garante a subpasta da etapa dentro da pasta da OS (a mesma de
+    obter_pasta_etapa). Retorna o ID da subpasta.
     """
-    oficina = os_obj.oficina
-    extra_log = {
-        "oficina_id": oficina.id,
-        "os_id": os_obj.id,
-        "etapa_id": etapa.id,
-    }
-
-    # Garante pasta principal da OS
     pasta_os_id = criar_pasta_os(os_obj)
     if not pasta_os_id:
         return None
 
-    service = get_drive_service(oficina)
+    service = get_drive_service(os_obj.oficina)
     if not service:
         logger.warning(
             "Drive subpasta etapa sem servico",
-            extra=extra_log,
+            extra={"oficina_id": os_obj.oficina_id, "os_id": os_obj.id, "etapa_id": etapa.id},
         )
         return None
 
-    # 1) Tenta localizar uma pasta com esse nome dentro da pasta da OS
-    try:
-        query = (
-            f"'{pasta_os_id}' in parents and "
-            f"name = '{etapa.nome}' and "
-            "mimeType = 'application/vnd.google-apps.folder' and "
-            "trashed = false"
-        )
-        response = service.files().list(q=query, fields="files(id, name)", spaces='drive').execute()
-        files = response.get('files', [])
-        if files:
-            return files[0]['id']
-    except Exception:
-        logger.exception(
-            "Drive subpasta etapa falha ao listar",
-            extra=extra_log,
-        )
-
-    # 2) Se não encontrou, cria
-    folder_metadata = {
-        'name': etapa.nome,
-        'mimeType': 'application/vnd.google-apps.folder',
-        'parents': [pasta_os_id],
-    }
-    try:
-        folder = service.files().create(body=folder_metadata, fields='id').execute()
-        return folder.get('id')
-    except Exception:
-        logger.exception(
-            "Drive subpasta etapa falha ao criar",
-            extra=extra_log,
-        )
-        return None
+    return obter_pasta_etapa(os_obj, etapa, service)
 
 
 def upload_foto_para_drive(foto: FotoOS) -> Optional[str]:
@@ -300,17 +309,20 @@ def upload_foto_para_drive(foto: FotoOS) -> Optional[str]:
         'name': os.path.basename(local_path),
         'parents': [subpasta_id],
     }
+    from googleapiclient.http import MediaFileUpload
+
     media = MediaFileUpload(local_path, resumable=True)
 
     try:
-        created = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id'
-        ).execute()
+        with chamada_drive(os_obj.oficina_id, "upload"):
+            created = service.files().create(
+                body=file_metadata,
+                media_body=media,
+                fields='id'
+            ).execute()
         file_id = created.get('id')
         foto.drive_file_id = file_id
-        foto.save(update_fields=['drive_file_id'])
+        foto.save(update_fields=['drive_file_id', 'atualizado_em'])
         return file_id
     except Exception as e:
         logger.exception(
@@ -330,12 +342,12 @@ def criar_subpastas_etapas(os_obj: OS, service):
     )
 
     for etapa in etapas:
-        ordem = int(etapa.ordem or 0)
-        nome_pasta = f"{ordem:02d} - {etapa.nome}"
+        nome_pasta = nome_pasta_etapa(etapa)
         subpasta_id = _get_or_create_subpasta(
             service=service,
             parent_id=os_obj.drive_folder_id,
             nome=nome_pasta,
+            propriedades=propriedades_pasta_etapa(os_obj, etapa.id),
             os_obj=os_obj,
             etapa_id=etapa.id,
         )
@@ -353,7 +365,8 @@ def criar_pasta_livres(os_obj: OS, service):
     subpasta_id = _get_or_create_subpasta(
         service=service,
         parent_id=os_obj.drive_folder_id,
-        nome="00 - Livres",
+        nome=NOME_PASTA_LIVRES,
+        propriedades=propriedades_pasta_livres(os_obj),
         os_obj=os_obj,
     )
     if not subpasta_id:
@@ -363,10 +376,12 @@ def criar_pasta_livres(os_obj: OS, service):
         )
 
 
-def _get_or_create_subpasta(service, parent_id: str, nome: str, *, os_obj: OS = None, etapa_id=None) -> Optional[str]:
+def _get_or_create_subpasta(
+    service, parent_id: str, nome: str, *, propriedades: dict, os_obj: OS = None, etapa_id=None
+) -> Optional[str]:
     """
-    Busca uma subpasta pelo nome dentro de parent_id.
-    Se não existir, cria.
+    Busca uma subpasta de parent_id pelas appProperties.
+    Se não existir, cria com ``nome`` e as propriedades.
     Retorna o folder_id.
     """
     extra_log = {
@@ -377,22 +392,26 @@ def _get_or_create_subpasta(service, parent_id: str, nome: str, *, os_obj: OS =
     if etapa_id:
         extra_log["etapa_id"] = etapa_id
 
-    query = (
-        f"mimeType='application/vnd.google-apps.folder' "
-        f"and name='{nome}' "
-        f"and '{parent_id}' in parents "
-        f"and trashed=false"
-    )
+    oficina_id = os_obj.oficina_id if os_obj else None
+    chave_cache = _chave_cache_subpasta(oficina_id, parent_id, propriedades)
+    if chave_cache:
+        folder_id = cache.get(chave_cache)
+        if folder_id:
+            return folder_id
+
+    query = query_pasta(parent_id, propriedades)
 
     try:
-        response = service.files().list(
-            q=query,
-            fields="files(id, name)",
-            pageSize=1,
-        ).execute()
+        with chamada_drive(oficina_id, "list"):
+            response = service.files().list(
+                q=query,
+                fields="files(id, name)",
+                pageSize=1,
+            ).execute()
 
         files = response.get("files", [])
         if files:
+            _guardar_subpasta_no_cache(chave_cache, files[0]["id"])
             return files[0]["id"]
     except Exception:
         logger.exception(
@@ -403,15 +422,17 @@ def _get_or_create_subpasta(service, parent_id: str, nome: str, *, os_obj: OS =
 
     folder_metadata = {
         "name": nome,
-        "mimeType": "application/vnd.google-apps.folder",
+        "mimeType": MIME_PASTA,
         "parents": [parent_id],
+        "appProperties": propriedades,
     }
 
     try:
-        folder = service.files().create(
-            body=folder_metadata,
-            fields="id",
-        ).execute()
+        with chamada_drive(oficina_id, "create"):
+            folder = service.files().create(
+                body=folder_metadata,
+                fields="id",
+            ).execute()
     except Exception:
         logger.exception(
             "Drive subpasta falha ao criar",
@@ -419,22 +440,51 @@ def _get_or_create_subpasta(service, parent_id: str, nome: str, *, os_obj: OS =
         )
         return None
 
+    _guardar_subpasta_no_cache(chave_cache, folder.get("id"))
     return folder.get("id")
 
+
+def _chave_cache_subpasta(oficina_id, parent_id: str, propriedades: dict) -> Optional[str]:
+    """
+    Mapa (pasta pai, appProperties) -> folder_id compartilhado entre os
+    workers, para não repetir o files().list a cada foto enviada.
+    """
+    if oficina_id is None or not parent_id:
+        return None
+    # Todas as appProperties entram na chave: as pastas de OS têm o mesmo
+    # pai (a raiz) e o mesmo tipo, só o os_id as diferencia.
+    identidade = hashlib.sha256(
+        json.dumps(propriedades, sort_keys=True).encode()
+    ).hexdigest()[:20]
+    try:
+        return montar_chave(oficina_id, (ESCOPO_DRIVE,), "drive_subpasta", parent_id, identidade)
+    except Exception:
+        logger.warning("Cache de pastas do Drive indisponível", exc_info=True)
+        return None
+
+
+def _guardar_subpasta_no_cache(chave: Optional[str], folder_id: Optional[str]):
+    if not chave or not folder_id:
+        return
+    try:
+        cache.set(chave, folder_id, getattr(settings, "CACHE_TTL_SEGUNDOS", 300))
+    except Exception:
+        logger.warning("Falha ao gravar pasta do Drive no cache", exc_info=True)
+
 def obter_pasta_etapa(os_obj: OS, etapa, service) -> Optional[str]:
     """
     Retorna o folder_id da subpasta da etapa dentro da OS.
     Cria se não existir.
     """
-    ordem = int(etapa.ordem or 0)
-    nome_pasta = f"{ordem:02d} - {etapa.nome}"
+    nome_pasta = nome_pasta_etapa(etapa)
 
     return _get_or_create_subpasta(
         service=service,
         parent_id=os_obj.drive_folder_id,
         nome=nome_pasta,
+        propriedades=propriedades_pasta_etapa(os_obj, etapa.id),
         os_obj=os_obj,
-        etapa_id=getattr(etapa, "id", None),
+        etapa_id=etapa.id,
     )
 
 def upload_foto_os_drive(
@@ -484,17 +534,20 @@ def upload_foto_os_drive(
         "parents": [pasta_etapa_id],
     }
 
+    from googleapiclient.http import MediaFileUpload
+
     media = MediaFileUpload(
         caminho_arquivo_local,
         resumable=False,
     )
 
     try:
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields="id",
-        ).execute()
+        with chamada_drive(os_obj.oficina_id, "upload"):
+            file = service.files().create(
+                body=file_metadata,
+                media_body=media,
+                fields="id",
+            ).execute()
         return file.get("id")
     except Exception:
         logger.exception(
@@ -502,3 +555,30 @@ def upload_foto_os_drive(
             extra={**extra_log, "arquivo": nome_arquivo},
         )
         return None
+
+
+def baixar_arquivo_drive(oficina, file_id: str) -> Optional[bytes]:
+    """
+    Baixa o conteúdo de um arquivo do Drive da oficina.
+    Usado para reidratar fotos cujo arquivo local foi removido no arquivamento.
+    """
+    extra_log = {"oficina_id": getattr(oficina, "id", None), "drive_file_id": file_id}
+
+    service = get_drive_service(oficina)
+    if not service:
+        logger.warning("Serviço do Drive indisponível", extra=extra_log)
+        return None
+
+    from googleapiclient.http import MediaIoBaseDownload
+
+    try:
+        buffer = io.BytesIO()
+        downloader = MediaIoBaseDownload(buffer, service.files().get_media(fileId=file_id))
+        concluido = False
+        with chamada_drive(getattr(oficina, "id", None), "download"):
+            while not concluido:
+                _, concluido = downloader.next_chunk()
+        return buffer.getvalue()
+    except Exception:
+        logger.exception("Erro ao baixar arquivo do Drive", extra=extra_log)
+        return None
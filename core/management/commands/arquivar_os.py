@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Oficina
+from core.services.arquivamento import arquivar_os_fechadas, os_para_arquivar
+
+
+class Command(BaseCommand):
+    help = "Move OS fechadas há mais de N dias para OSArquivada e libera fotos já enviadas ao Drive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=None, help="Padrão: ARQUIVAMENTO_OS_DIAS")
+        parser.add_argument("--oficina", type=int, default=None, help="ID da oficina")
+        parser.add_argument("--limite", type=int, default=None, help="Máximo de OS nesta execução")
+        parser.add_argument("--dry-run", action="store_true", help="Apenas conta as OS elegíveis")
+
+    def handle(self, *args, **options):
+        oficina = None
+        if options["oficina"]:
+            try:
+                oficina = Oficina.objects.get(id=options["oficina"])
+            except Oficina.DoesNotExist:
+                raise CommandError("Oficina não encontrada.")
+
+        if options["dry_run"]:
+            total = os_para_arquivar(options["dias"], oficina).count()
+            self.stdout.write(f"{total} OS elegível(is) para arquivamento")
+            return
+
+        total = arquivar_os_fechadas(
+            dias=options["dias"], oficina=oficina, limite=options["limite"]
+        )
+        self.stdout.write(f"{total} OS arquivada(s)")
@@ -0,0 +1,116 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+
+def _percentil(valores, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def _carga_de_sync(alias: str):
+    """Transação curta parecida com a de um item do /api/sync/: leituras de OS/etapas e da fila."""
+    from core.models import OS, Etapa, SyncJob
+
+    with transaction.atomic(using=alias):
+        list(OS.objects.using(alias).filter(aberta=True).values_list("id", flat=True)[:20])
+        Etapa.objects.using(alias).filter(ativa=True).count()
+        SyncJob.objects.using(alias).filter(status="PENDENTE").exists()
+
+
+def medir_aquisicao(alias: str, threads: int, iteracoes: int):
+    """
+    Cada thread repete: pega uma conexão (mede o tempo), roda a carga e devolve
+    a conexão (close: volta para o pool ou fecha de fato, sem pool).
+    Retorna (latências em ms, erros, duração total em s).
+    """
+    latencias = []
+    erros = []
+    lock = threading.Lock()
+    largada = threading.Barrier(threads)
+
+    def trabalhador():
+        conexao = connections[alias]
+        largada.wait()
+        try:
+            for _ in range(iteracoes):
+                inicio = time.perf_counter()
+                try:
+                    conexao.ensure_connection()
+                    aquisicao = (time.perf_counter() - inicio) * 1000
+                    _carga_de_sync(alias)
+                except Exception as exc:
+                    with lock:
+                        erros.append(repr(exc))
+                    continue
+                finally:
+                    conexao.close()
+                with lock:
+                    latencias.append(aquisicao)
+        finally:
+            connections.close_all()
+
+    inicio = time.perf_counter()
+    workers = [threading.Thread(target=trabalhador) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencias, erros, time.perf_counter() - inicio
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a latência para obter uma conexão do banco com várias threads "
+        "simulando carga de sync (compare com e sem DB_POOL_MAX_SIZE)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--iteracoes", type=int, default=50, help="Iterações por thread.")
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        if alias not in connections:
+            raise CommandError(f"Banco '{alias}' não configurado.")
+        if options["threads"] < 1 or options["iteracoes"] < 1:
+            raise CommandError("--threads e --iteracoes devem ser positivos.")
+
+        conexao = connections[alias]
+        pool = getattr(conexao, "pool", None)
+        modo = (
+            f"pool (min={pool.min_size}, max={pool.max_size})"
+            if pool is not None
+            else f"sem pool (CONN_MAX_AGE={conexao.settings_dict.get('CONN_MAX_AGE')})"
+        )
+        self.stdout.write(
+            f"{conexao.vendor} [{alias}] {modo}: {options['threads']} threads x "
+            f"{options['iteracoes']} iterações"
+        )
+
+        latencias, erros, duracao = medir_aquisicao(alias, options["threads"], options["iteracoes"])
+
+        self.stdout.write(
+            f"Aquisições: {len(latencias)} em {duracao:.2f}s "
+            f"({len(latencias) / duracao if duracao else 0:.0f}/s), erros: {len(erros)}"
+        )
+        if latencias:
+            self.stdout.write(
+                "Latência de aquisição (ms): "
+                f"média {statistics.fmean(latencias):.2f} | "
+                f"p50 {_percentil(latencias, 50):.2f} | "
+                f"p95 {_percentil(latencias, 95):.2f} | "
+                f"p99 {_percentil(latencias, 99):.2f} | "
+                f"máx {max(latencias):.2f}"
+            )
+        for erro in sorted(set(erros))[:5]:
+            self.stderr.write(f"  {erro}")
+        if pool is not None:
+            self.stdout.write(f"Pool: {pool.get_stats()}")
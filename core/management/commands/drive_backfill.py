@@ -0,0 +1,124 @@
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from core.drive_async import backfill_os_async
+from core.drive_circuito import circuito_aberto
+from core.models import OS, FotoOS, OficinaDriveConfig
+
+FOTO_SEM_DRIVE = Q(drive_file_id__isnull=True) | Q(drive_file_id="")
+OS_SEM_PASTA = Q(drive_folder_id__isnull=True) | Q(drive_folder_id="")
+
+
+def os_pendentes(oficina_id, a_partir_de: int = 0):
+    """Ids das OS da oficina sem pasta no Drive ou com fotos ainda não enviadas."""
+    com_fotos_pendentes = FotoOS.objects.filter(FOTO_SEM_DRIVE, etapa__isnull=False).values("os_id")
+    return list(
+        OS.objects.filter(oficina_id=oficina_id, id__gte=a_partir_de)
+        .filter(OS_SEM_PASTA | Q(id__in=com_fotos_pendentes))
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def carregar_lote(os_ids):
+    """OS do lote e suas fotos pendentes, apontando para as mesmas instâncias de OS."""
+    os_lista = list(OS.objects.filter(id__in=os_ids).order_by("id"))
+    por_id = {os_obj.id: os_obj for os_obj in os_lista}
+
+    fotos_por_os = {}
+    for foto in (
+        FotoOS.objects.select_related("etapa")
+        .filter(FOTO_SEM_DRIVE, os_id__in=os_ids, etapa__isnull=False)
+        .exclude(arquivo="")
+        .order_by("os_id", "id")
+    ):
+        foto.os = por_id[foto.os_id]
+        fotos_por_os.setdefault(foto.os_id, []).append(foto)
+    return os_lista, fotos_por_os
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria no Drive as pastas e envia as fotos das OS que ficaram sem ids do "
+        "Drive (ex.: oficina que conectou o Drive depois). Pode ser interrompido "
+        "e executado de novo: o que já subiu é ignorado"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--oficina", type=int, help="Só esta oficina (padrão: todas com Drive ativo).")
+        parser.add_argument("--lote", type=int, default=25, help="OS por lote.")
+        parser.add_argument(
+            "--concorrencia",
+            type=int,
+            default=None,
+            help="Chamadas simultâneas ao Drive (padrão: DRIVE_UPLOAD_CONCORRENCIA).",
+        )
+        parser.add_argument(
+            "--a-partir-de-os",
+            type=int,
+            default=0,
+            help="Retoma a partir deste id de OS (exige --oficina; ver a última linha de progresso).",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Só conta as pendências.")
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote deve ser positivo.")
+        if options["a_partir_de_os"] and not options["oficina"]:
+            # Os ids de OS são globais: sem --oficina, pularia OS de outras oficinas
+            raise CommandError("--a-partir-de-os exige --oficina.")
+        concorrencia = options["concorrencia"] or getattr(settings, "DRIVE_UPLOAD_CONCORRENCIA", 4)
+
+        configs = OficinaDriveConfig.objects.filter(ativo=True, root_folder_id__gt="")
+        if options["oficina"]:
+            configs = configs.filter(oficina_id=options["oficina"])
+            if not configs.exists():
+                raise CommandError(f"Oficina {options['oficina']} sem Drive ativo.")
+
+        totais = {"pastas_os": 0, "enviadas": 0, "falhas": 0}
+        inicio = time.perf_counter()
+
+        for config in configs.select_related("oficina").order_by("oficina_id"):
+            os_ids = os_pendentes(config.oficina_id, options["a_partir_de_os"])
+            fotos_pendentes = FotoOS.objects.filter(
+                FOTO_SEM_DRIVE, os_id__in=os_ids, etapa__isnull=False
+            ).exclude(arquivo="").count()
+            self.stdout.write(
+                f"Oficina {config.oficina_id} ({config.oficina.nome}): "
+                f"{len(os_ids)} OS e {fotos_pendentes} fotos pendentes"
+            )
+            if options["dry_run"] or not os_ids:
+                continue
+            if circuito_aberto(config.oficina_id):
+                self.stdout.write(self.style.WARNING("  Circuito do Drive aberto; oficina ignorada"))
+                continue
+
+            for posicao in range(0, len(os_ids), options["lote"]):
+                bloco = os_ids[posicao : posicao + options["lote"]]
+                os_lista, fotos_por_os = carregar_lote(bloco)
+
+                resultado = async_to_sync(backfill_os_async)(
+                    config, os_lista, fotos_por_os, concorrencia=concorrencia
+                )
+                for chave, valor in resultado.items():
+                    totais[chave] += valor
+
+                duracao = time.perf_counter() - inicio
+                self.stdout.write(
+                    f"  OS {posicao + len(bloco)}/{len(os_ids)} | "
+                    f"pastas {totais['pastas_os']} | fotos enviadas {totais['enviadas']} | "
+                    f"falhas {totais['falhas']} | {totais['enviadas'] / duracao if duracao else 0:.1f} fotos/s | "
+                    f"retomar com --oficina {config.oficina_id} --a-partir-de-os {bloco[-1] + 1}"
+                )
+
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backfill concluído em {duracao:.1f}s: {totais['pastas_os']} pastas de OS, "
+                f"{totais['enviadas']} fotos enviadas, {totais['falhas']} falhas"
+            )
+        )
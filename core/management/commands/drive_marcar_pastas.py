@@ -0,0 +1,52 @@
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.drive_async import marcar_pastas_oficina_async
+from core.models import OS, Etapa, OficinaDriveConfig
+
+
+class Command(BaseCommand):
+    help = (
+        "Migração única: grava appProperties (oficina_id, os_id, etapa_id) nas "
+        "pastas do Drive criadas antes delas, para que passem a ser encontradas "
+        "por id e não pelo nome. Rode antes de publicar a busca por appProperties; "
+        "pode ser repetida sem efeito nas pastas já marcadas"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--oficina", type=int, help="Só esta oficina (padrão: todas com Drive ativo).")
+        parser.add_argument(
+            "--concorrencia",
+            type=int,
+            default=None,
+            help="OS processadas em paralelo (padrão: DRIVE_UPLOAD_CONCORRENCIA).",
+        )
+
+    def handle(self, *args, **options):
+        concorrencia = options["concorrencia"] or getattr(settings, "DRIVE_UPLOAD_CONCORRENCIA", 4)
+
+        configs = OficinaDriveConfig.objects.filter(ativo=True, root_folder_id__gt="")
+        if options["oficina"]:
+            configs = configs.filter(oficina_id=options["oficina"])
+            if not configs.exists():
+                raise CommandError(f"Oficina {options['oficina']} sem Drive ativo.")
+
+        for config in configs.select_related("oficina").order_by("oficina_id"):
+            inicio = time.perf_counter()
+            os_lista = list(OS.objects.filter(oficina_id=config.oficina_id).order_by("id"))
+            etapas = list(Etapa.objects.filter(oficina_id=config.oficina_id).order_by("ordem", "id"))
+
+            resultado = async_to_sync(marcar_pastas_oficina_async)(
+                config, os_lista, etapas, concorrencia=concorrencia
+            )
+
+            duracao = time.perf_counter() - inicio
+            self.stdout.write(
+                f"Oficina {config.oficina_id} ({config.oficina.nome}): "
+                f"{resultado['os']} OS e {resultado['subpastas']} subpastas marcadas, "
+                f"{resultado['duplicadas']} subpastas duplicadas, {resultado['falhas']} falhas "
+                f"em {duracao:.1f}s"
+            )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Oficina
+from core.services.pwa import limpar_registros_excluidos
+
+
+class Command(BaseCommand):
+    help = "Apaga os tombstones (RegistroExcluido) mais velhos que PWA_EXCLUIDOS_RETENCAO_DIAS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--oficina", type=int, default=None, help="ID da oficina")
+        parser.add_argument("--dry-run", action="store_true", help="Apenas conta os registros elegíveis")
+
+    def handle(self, *args, **options):
+        oficina = None
+        if options["oficina"]:
+            try:
+                oficina = Oficina.objects.get(id=options["oficina"])
+            except Oficina.DoesNotExist:
+                raise CommandError("Oficina não encontrada.")
+
+        total = limpar_registros_excluidos(oficina=oficina, dry_run=options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(f"{total} registro(s) excluído(s) elegível(is) para limpeza")
+            return
+        self.stdout.write(f"{total} registro(s) excluído(s) apagado(s)")
@@ -0,0 +1,83 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Pacotes que não podem ser carregados no boot (só quando o Drive é usado).
+MODULOS_PROIBIDOS_NO_BOOT = ("googleapiclient", "google.oauth2", "google_auth_oauthlib")
+
+SCRIPT_BOOT = (
+    "import django; django.setup(); "
+    "import config.urls, core.views, core.drive_service, core.admin"
+)
+
+LINHA_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def medir_boot():
+    """
+    Roda o boot da aplicação em um processo novo com ``python -X importtime``.
+    Retorna a lista de (modulo, proprio_us, acumulado_us, nivel).
+    """
+    ambiente = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings")}
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT_BOOT],
+        capture_output=True,
+        text=True,
+        env=ambiente,
+    )
+    if processo.returncode != 0:
+        raise CommandError(f"Falha ao importar a aplicação:\n{processo.stderr[-2000:]}")
+
+    modulos = []
+    for linha in processo.stderr.splitlines():
+        match = LINHA_IMPORTTIME.match(linha)
+        if match:
+            proprio, acumulado, recuo, modulo = match.groups()
+            modulos.append((modulo, int(proprio), int(acumulado), (len(recuo) - 1) // 2))
+    return modulos
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o tempo de importação do boot (python -X importtime) e falha se o "
+        "cliente do Google for carregado antes de ser usado"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=15, help="Quantos pacotes de topo listar.")
+        parser.add_argument(
+            "--limite-ms",
+            type=float,
+            default=None,
+            help="Falha se o tempo total de importação passar deste valor.",
+        )
+
+    def handle(self, *args, **options):
+        modulos = medir_boot()
+
+        raizes = [m for m in modulos if m[3] == 0]
+        total_ms = sum(m[2] for m in raizes) / 1000
+
+        self.stdout.write(f"Importação do boot: {total_ms:.1f} ms em {len(modulos)} módulos")
+        for modulo, _, acumulado, _ in sorted(raizes, key=lambda m: m[2], reverse=True)[: options["top"]]:
+            self.stdout.write(f"  {acumulado / 1000:8.1f} ms  {modulo}")
+
+        proibidos = sorted(
+            {
+                modulo
+                for modulo, *_ in modulos
+                if modulo.startswith(MODULOS_PROIBIDOS_NO_BOOT)
+            }
+        )
+        if proibidos:
+            raise CommandError(
+                "Cliente do Google carregado no boot: " + ", ".join(proibidos[:10])
+            )
+
+        if options["limite_ms"] is not None and total_ms > options["limite_ms"]:
+            raise CommandError(
+                f"Importação do boot levou {total_ms:.1f} ms (limite {options['limite_ms']:.1f} ms)"
+            )
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services.sync_jobs import processar_sync_jobs_pendentes
+
+
+class Command(BaseCommand):
+    help = "Processa as sincronizações assíncronas (SyncJob) pendentes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Continua aguardando novos jobs em vez de sair quando a fila esvazia.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=2.0,
+            help="Segundos de espera entre consultas à fila no modo --loop.",
+        )
+        parser.add_argument(
+            "--limite",
+            type=int,
+            default=None,
+            help="Quantidade máxima de jobs por rodada.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processados = processar_sync_jobs_pendentes(limite=options["limite"])
+            if processados:
+                self.stdout.write(f"{processados} sync job(s) processado(s)")
+
+            if not options["loop"]:
+                return
+
+            if not processados:
+                time.sleep(options["intervalo"])
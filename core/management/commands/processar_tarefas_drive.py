@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services.tarefas_drive import processar_tarefas_pendentes
+
+
+class Command(BaseCommand):
+    help = (
+        "Retoma as tarefas do Drive (TarefaDrive) que um worker não concluiu: envio "
+        "de fotos em lote, restauração de OS reidratada e renomeação de pastas"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Continua aguardando novas tarefas em vez de sair quando a fila esvazia.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=30.0,
+            help="Segundos de espera entre consultas no modo --loop.",
+        )
+        parser.add_argument(
+            "--limite",
+            type=int,
+            default=None,
+            help="Quantidade máxima de tarefas por rodada.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processadas = processar_tarefas_pendentes(limite=options["limite"])
+            if processadas:
+                self.stdout.write(f"{processadas} tarefa(s) do Drive processada(s)")
+
+            if not options["loop"]:
+                return
+
+            if not processadas:
+                time.sleep(options["intervalo"])
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import OSArquivada
+from core.services.arquivamento import ConflitoReidratacao, reidratar_os
+
+
+class Command(BaseCommand):
+    help = "Restaura uma OS arquivada para as tabelas ativas (e baixa as fotos do Drive)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("os_id", type=int, help="ID original da OS")
+        parser.add_argument(
+            "--sem-fotos",
+            action="store_true",
+            help="Não baixa do Drive os arquivos que não estão no disco.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            arquivada = OSArquivada.objects.get(os_id_original=options["os_id"])
+        except OSArquivada.DoesNotExist:
+            raise CommandError("OS arquivada não encontrada.")
+
+        try:
+            os_obj = reidratar_os(arquivada, baixar_fotos=not options["sem_fotos"])
+        except ConflitoReidratacao as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f"OS {os_obj.codigo} reidratada (id={os_obj.id})")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.models import OS, normalizar_identificador
+from core.services.busca_os import reindexar_todas
+
+
+class Command(BaseCommand):
+    help = "Recalcula placa/código normalizados e reconstrói o índice de busca de OS"
+
+    def handle(self, *args, **options):
+        atualizadas = 0
+        for os_obj in OS.objects.only("id", "placa", "codigo", "placa_normalizada", "codigo_normalizado").iterator():
+            placa = normalizar_identificador(os_obj.placa)
+            codigo = normalizar_identificador(os_obj.codigo)
+            if placa != os_obj.placa_normalizada or codigo != os_obj.codigo_normalizado:
+                OS.objects.filter(pk=os_obj.pk).update(
+                    placa_normalizada=placa, codigo_normalizado=codigo
+                )
+                atualizadas += 1
+
+        indexadas = reindexar_todas()
+        self.stdout.write(
+            f"{atualizadas} OS normalizada(s); {indexadas} OS no índice FTS"
+        )
@@ -0,0 +1,264 @@
+"""
+Métricas no formato Prometheus, expostas em /metrics.
+
+Sob gunicorn com vários workers, defina ``PROMETHEUS_MULTIPROC_DIR`` (um
+diretório vazio a cada boot) antes de subir o servidor: cada worker grava suas
+séries em arquivos ali e o /metrics agrega todos. Sem a variável, cada processo
+expõe apenas as próprias métricas (suficiente em dev/testes).
+
+As profundidades de fila (SyncJob pendentes, fotos sem Drive) são calculadas
+no momento da coleta, direto do banco.
+"""
+import logging
+import os
+import time
+from contextlib import ExitStack, contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+from core.profiling import registrar_chamada_drive
+from core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+REQUISICAO_DURACAO = Histogram(
+    "http_request_duration_seconds",
+    "Latência das requisições por view.",
+    ["view", "method", "status"],
+)
+DB_CONSULTAS_POR_REQUISICAO = Histogram(
+    "db_queries_per_request",
+    "Quantidade de consultas SQL por requisição.",
+    ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, float("inf")),
+)
+DB_TEMPO_POR_REQUISICAO = Histogram(
+    "db_query_seconds_per_request",
+    "Tempo total em SQL por requisição.",
+    ["view"],
+)
+DRIVE_DURACAO = Histogram(
+    "drive_call_duration_seconds",
+    "Latência das chamadas à API do Google Drive.",
+    ["operacao", "resultado"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf")),
+)
+SYNC_ITENS = Counter(
+    "sync_items_total",
+    "Itens (OS) processados pelo /api/sync/.",
+    ["status"],
+)
+SYNC_FOTOS = Counter(
+    "sync_photos_total",
+    "Fotos processadas pelo /api/sync/.",
+    ["resultado"],
+)
+FOTOS_BYTES = Counter(
+    "photo_bytes_ingested_total",
+    "Bytes de fotos recebidos.",
+    ["origem"],
+)
+
+# Pool de conexões (DB_POOL_MAX_SIZE): uma série por worker (pid) em modo multiprocesso
+DB_POOL_CONEXOES = Gauge(
+    "db_pool_connections",
+    "Conexões do pool deste worker (tamanho, disponíveis, mínimo, máximo).",
+    ["alias", "estado"],
+    multiprocess_mode="liveall",
+)
+DB_POOL_ESPERANDO = Gauge(
+    "db_pool_requests_waiting",
+    "Threads deste worker esperando uma conexão do pool.",
+    ["alias"],
+    multiprocess_mode="liveall",
+)
+DB_POOL_PEDIDOS = Counter(
+    "db_pool_requests_total",
+    "Conexões pedidas ao pool.",
+    ["alias"],
+)
+DB_POOL_ESPERA = Counter(
+    "db_pool_wait_seconds_total",
+    "Tempo total esperando conexão do pool (só pedidos que entraram na fila).",
+    ["alias"],
+)
+DB_POOL_ERROS = Counter(
+    "db_pool_errors_total",
+    "Pedidos ao pool que falharam (timeout) e conexões descartadas pelo health check.",
+    ["alias", "tipo"],
+)
+
+
+@contextmanager
+def medir_chamada_drive(operacao: str):
+    """
+    Mede uma chamada ao Drive (métrica, profiling e span de tracing); exceções
+    contam como ``erro`` e seguem adiante.
+    """
+    inicio = time.perf_counter()
+    resultado = "erro"
+    try:
+        with span(f"drive.{operacao}"):
+            yield
+        resultado = "ok"
+    finally:
+        duracao = time.perf_counter() - inicio
+        DRIVE_DURACAO.labels(operacao=operacao, resultado=resultado).observe(duracao)
+        registrar_chamada_drive(operacao, resultado, duracao)
+
+
+def registrar_bytes_foto(tamanho, origem: str):
+    if tamanho:
+        FOTOS_BYTES.labels(origem=origem).inc(tamanho)
+
+
+def registrar_metricas_pool():
+    """
+    Publica as estatísticas do pool de conexões deste worker. ``pop_stats``
+    zera os contadores do psycopg_pool, então cada chamada soma só o delta.
+    """
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is None:
+            continue
+        try:
+            stats = pool.pop_stats()
+        except Exception:
+            logger.warning("Falha ao ler estatísticas do pool", extra={"alias": alias}, exc_info=True)
+            continue
+
+        for estado, chave in (
+            ("tamanho", "pool_size"),
+            ("disponiveis", "pool_available"),
+            ("minimo", "pool_min"),
+            ("maximo", "pool_max"),
+        ):
+            DB_POOL_CONEXOES.labels(alias=alias, estado=estado).set(stats.get(chave, 0))
+        DB_POOL_ESPERANDO.labels(alias=alias).set(stats.get("requests_waiting", 0))
+        DB_POOL_PEDIDOS.labels(alias=alias).inc(stats.get("requests_num", 0))
+        DB_POOL_ESPERA.labels(alias=alias).inc(stats.get("requests_wait_ms", 0) / 1000)
+        DB_POOL_ERROS.labels(alias=alias, tipo="timeout").inc(stats.get("requests_errors", 0))
+        DB_POOL_ERROS.labels(alias=alias, tipo="conexao_perdida").inc(stats.get("connections_lost", 0))
+
+
+class FilasCollector:
+    """Profundidade das filas de trabalho, lida do banco a cada coleta."""
+
+    def collect(self):
+        from core.models import FotoOS, SyncJob
+
+        try:
+            jobs = SyncJob.objects.filter(status="PENDENTE").count()
+            fotos = FotoOS.objects.filter(
+                drive_file_id__isnull=True,
+                os__oficina__drive_config__ativo=True,
+            ).count()
+        except Exception:
+            logger.warning("Falha ao medir filas para /metrics", exc_info=True)
+            return
+
+        yield GaugeMetricFamily("sync_jobs_pending", "SyncJobs aguardando processamento.", value=jobs)
+        yield GaugeMetricFamily(
+            "drive_uploads_pending",
+            "Fotos de oficinas com Drive ativo ainda sem drive_file_id.",
+            value=fotos,
+        )
+
+
+class _RegistroDoProcesso:
+    """Repassa o registro global do processo (modo sem multiprocessamento)."""
+
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def gerar_metricas():
+    """Retorna (conteúdo, content_type) para o /metrics."""
+    registrar_metricas_pool()
+    registry = CollectorRegistry()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_RegistroDoProcesso())
+    registry.register(FilasCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricasMiddleware:
+    """
+    Mede latência, quantidade e tempo de SQL de cada requisição, agrupados
+    pelo nome da rota (não pelo path, para não explodir a cardinalidade).
+
+    Sob ASGI as consultas rodam em threads do sync_to_async, fora da conexão
+    vista aqui; nesse modo só a latência é medida.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if request.path == "/metrics":
+            return self.get_response(request)
+
+        consultas = {"total": 0, "tempo": 0.0}
+
+        def medir_sql(execute, sql, params, many, context):
+            inicio = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                consultas["total"] += 1
+                consultas["tempo"] += time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        # Todos os aliases: leituras das views marcadas vão para a réplica
+        with ExitStack() as pilha:
+            for alias in connections:
+                pilha.enter_context(connections[alias].execute_wrapper(medir_sql))
+            response = self.get_response(request)
+        duracao = time.perf_counter() - inicio
+
+        view = self._observar(request, response, duracao)
+        DB_CONSULTAS_POR_REQUISICAO.labels(view=view).observe(consultas["total"])
+        DB_TEMPO_POR_REQUISICAO.labels(view=view).observe(consultas["tempo"])
+        registrar_metricas_pool()
+        return response
+
+    async def __acall__(self, request):
+        if request.path == "/metrics":
+            return await self.get_response(request)
+
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        self._observar(request, response, time.perf_counter() - inicio)
+        return response
+
+    def _observar(self, request, response, duracao) -> str:
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else None) or "sem_rota"
+
+        REQUISICAO_DURACAO.labels(
+            view=view, method=request.method, status=str(response.status_code)
+        ).observe(duracao)
+        return view
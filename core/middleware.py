@@ -0,0 +1,147 @@
+import io
+import logging
+import zlib
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # Brotli é opcional; sem ele as respostas saem em gzip.
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class CorpoDescompactadoGrandeDemais(Exception):
+    pass
+
+
+def descompactar_gzip(dados: bytes, limite: int) -> bytes:
+    """
+    Descompacta um corpo gzip sem nunca materializar mais que ``limite`` bytes,
+    evitando que um zip bomb estoure a memória do worker.
+    """
+    descompactador = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    corpo = descompactador.decompress(dados, limite + 1)
+    if len(corpo) > limite or descompactador.unconsumed_tail:
+        raise CorpoDescompactadoGrandeDemais()
+    if not descompactador.eof:
+        raise zlib.error("gzip truncado")
+    return corpo
+
+
+class GzipRequestMiddleware(MiddlewareMixin):
+    """
+    Aceita corpos com ``Content-Encoding: gzip`` nos endpoints que recebem
+    fotos (sync em base64 e upload de FotoOS). O limite de tamanho vale para o
+    corpo já descompactado.
+    """
+
+    caminhos = ("/api/sync/", "/api/fotos-os/")
+
+    def process_request(self, request):
+        encoding = request.META.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if encoding == "gzip" and request.path.startswith(self.caminhos):
+            return self._descompactar(request)
+        return None
+
+    def _descompactar(self, request):
+        limite = getattr(settings, "API_CORPO_DESCOMPACTADO_MAX_BYTES", 50 * 1024 * 1024)
+
+        try:
+            if int(request.META.get("CONTENT_LENGTH") or 0) > limite:
+                raise CorpoDescompactadoGrandeDemais()
+            # read() em vez de .body: .body aplicaria DATA_UPLOAD_MAX_MEMORY_SIZE
+            # ao gzip; aqui o limite vale para o conteúdo já descompactado.
+            corpo = descompactar_gzip(request.read(), limite)
+        except CorpoDescompactadoGrandeDemais:
+            logger.warning(
+                "Corpo gzip excede o limite após descompactar",
+                extra={"path": request.path, "limite": limite},
+            )
+            return JsonResponse(
+                {"detail": "Corpo da requisição excede o tamanho máximo permitido."},
+                status=413,
+            )
+        except (zlib.error, EOFError):
+            return JsonResponse({"detail": "Corpo gzip inválido."}, status=400)
+
+        request._body = corpo
+        request._stream = io.BytesIO(corpo)
+        request.META["CONTENT_LENGTH"] = str(len(corpo))
+        del request.META["HTTP_CONTENT_ENCODING"]
+        return None
+
+
+def aceita_encoding(cabecalho: str, encoding: str) -> bool:
+    """
+    True se o Accept-Encoding aceita ``encoding`` com q > 0, nomeado ou via
+    ``*`` (ex.: ``br;q=0, *`` recusa br).
+    """
+    curinga = None
+    for item in cabecalho.split(","):
+        nome, _, parametros = item.partition(";")
+        nome = nome.strip().lower()
+        q = 1.0
+        for parametro in parametros.split(";"):
+            chave, _, valor = parametro.partition("=")
+            if chave.strip().lower() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if nome == encoding:
+            return q > 0
+        if nome == "*":
+            curinga = q > 0
+    return bool(curinga)
+
+
+class ApiCompressionMiddleware(GZipMiddleware):
+    """
+    Compacta as respostas JSON da /api/ com brotli quando o cliente aceita
+    (e o pacote está instalado) ou com gzip nos demais casos. A qualidade do
+    brotli (API_BROTLI_QUALIDADE) é a de conteúdo dinâmico: o padrão da
+    biblioteca (11) é para arquivos estáticos e custa centenas de ms numa
+    lista grande.
+    """
+
+    tamanho_minimo = 200
+
+    def process_response(self, request, response):
+        if not request.path.startswith("/api/"):
+            return response
+
+        if not response.get("Content-Type", "").startswith("application/json"):
+            return response
+
+        aceita = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if (
+            brotli is None
+            or not aceita_encoding(aceita, "br")
+            or response.streaming
+            or response.has_header("Content-Encoding")
+            or len(response.content) < self.tamanho_minimo
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compactado = brotli.compress(
+            response.content, quality=getattr(settings, "API_BROTLI_QUALIDADE", 5)
+        )
+        if len(compactado) >= len(response.content):
+            return response
+
+        response.content = compactado
+        response.headers["Content-Length"] = str(len(compactado))
+        response.headers["Content-Encoding"] = "br"
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+
+        return response
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_osetapastatus'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDO', 'Concluído'), ('ERRO', 'Erro')], default='PENDENTE', max_length=12)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('total_itens', models.PositiveIntegerField(default=0)),
+                ('itens_processados', models.PositiveIntegerField(default=0)),
+                ('resultados', models.JSONField(blank=True, default=list)),
+                ('erro', models.TextField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('oficina', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_jobs', to='core.oficina')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sincronização assíncrona',
+                'verbose_name_plural': 'Sincronizações assíncronas',
+                'ordering': ('-criado_em',),
+            },
+        ),
+    ]
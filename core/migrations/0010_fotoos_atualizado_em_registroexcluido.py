@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_syncjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fotoos",
+            name="atualizado_em",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name="RegistroExcluido",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "modelo",
+                    models.CharField(
+                        choices=[
+                            ("OS", "Ordem de Serviço"),
+                            ("FotoOS", "Foto da OS"),
+                            ("OSEtapaStatus", "Status da etapa da OS"),
+                            ("ObservacaoEtapaOS", "Observação da Etapa"),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                ("objeto_id", models.BigIntegerField()),
+                ("os_id_original", models.BigIntegerField(blank=True, null=True)),
+                ("excluido_em", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "oficina",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="registros_excluidos",
+                        to="core.oficina",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Registro excluído",
+                "verbose_name_plural": "Registros excluídos",
+                "ordering": ("excluido_em", "id"),
+            },
+        ),
+    ]
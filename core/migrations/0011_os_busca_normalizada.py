@@ -0,0 +1,98 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:50
+
+import re
+
+from django.db import migrations, models
+
+
+def _normalizar(valor):
+    if not valor:
+        return ""
+    return re.sub(r"[\s\-]+", "", str(valor)).upper()
+
+
+def preencher_campos_normalizados(apps, schema_editor):
+    OS = apps.get_model("core", "OS")
+    for os_obj in OS.objects.only("id", "placa", "codigo").iterator():
+        OS.objects.filter(pk=os_obj.pk).update(
+            placa_normalizada=_normalizar(os_obj.placa),
+            codigo_normalizado=_normalizar(os_obj.codigo),
+        )
+
+
+def criar_indices_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS os_placa_norm_trgm_idx "
+            "ON core_os USING gin (placa_normalizada gin_trgm_ops)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS os_codigo_norm_trgm_idx "
+            "ON core_os USING gin (codigo_normalizado gin_trgm_ops)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS os_nome_cliente_trgm_idx "
+            "ON core_os USING gin ((UPPER(nome_cliente::text)) gin_trgm_ops)"
+        )
+    elif vendor == "sqlite":
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS core_os_busca "
+                "USING fts5(placa, codigo, nome_cliente, tokenize='trigram')"
+            )
+        except Exception:
+            # SQLite sem FTS5/trigram (< 3.34): a busca usa LIKE.
+            return
+        schema_editor.execute(
+            "INSERT INTO core_os_busca (rowid, placa, codigo, nome_cliente) "
+            "SELECT id, placa_normalizada, codigo_normalizado, COALESCE(nome_cliente, '') "
+            "FROM core_os"
+        )
+
+
+def remover_indices_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS os_placa_norm_trgm_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS os_codigo_norm_trgm_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS os_nome_cliente_trgm_idx")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS core_os_busca")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_fotoos_atualizado_em_registroexcluido"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="os",
+            name="codigo_normalizado",
+            field=models.CharField(blank=True, default="", editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="os",
+            name="placa_normalizada",
+            field=models.CharField(blank=True, default="", editable=False, max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name="os",
+            index=models.Index(
+                fields=["oficina", "placa_normalizada"], name="os_oficina_placa_norm_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="os",
+            index=models.Index(
+                fields=["oficina", "codigo_normalizado"], name="os_oficina_codigo_norm_idx"
+            ),
+        ),
+        migrations.RunPython(preencher_campos_normalizados, migrations.RunPython.noop),
+        migrations.RunPython(criar_indices_busca, remover_indices_busca),
+    ]
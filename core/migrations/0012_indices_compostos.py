@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_os_busca_normalizada"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="configfoto",
+            index=models.Index(condition=models.Q(("ativa", True), ("obrigatoria", True)), fields=["oficina", "etapa"], name="configfoto_obrigatorias_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="etapa",
+            index=models.Index(condition=models.Q(("ativa", True)), fields=["oficina", "ordem"], name="etapa_ativas_ordem_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="fotoos",
+            index=models.Index(fields=["os", "etapa", "tirada_em"], name="fotoos_os_etapa_tirada_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="os",
+            index=models.Index(condition=models.Q(("aberta", True)), fields=["oficina", "etapa_atual"], name="os_abertas_etapa_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="os",
+            index=models.Index(fields=["oficina", "-data_entrada", "-criado_em"], name="os_oficina_entrada_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="os",
+            index=models.Index(condition=models.Q(("aberta", True)), fields=["oficina", "-atualizado_em"], name="os_abertas_atualizado_idx"),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:52
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_indices_compostos"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OSArquivada",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("os_id_original", models.BigIntegerField(unique=True)),
+                ("codigo", models.CharField(max_length=50)),
+                ("placa", models.CharField(blank=True, max_length=10, null=True)),
+                ("placa_normalizada", models.CharField(blank=True, default="", max_length=10)),
+                ("nome_cliente", models.CharField(blank=True, max_length=255, null=True)),
+                ("data_entrada", models.DateTimeField(blank=True, null=True)),
+                ("data_saida", models.DateTimeField(blank=True, null=True)),
+                ("dados", models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ("arquivada_em", models.DateTimeField(auto_now_add=True)),
+                ("oficina", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="os_arquivadas", to="core.oficina")),
+            ],
+            options={
+                "verbose_name": "OS arquivada",
+                "verbose_name_plural": "OS arquivadas",
+                "ordering": ("-arquivada_em",),
+                "indexes": [models.Index(fields=["oficina", "placa_normalizada"], name="osarq_oficina_placa_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_osarquivada"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PerfilRequisicao",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("request_id", models.CharField(db_index=True, max_length=64)),
+                ("motivo", models.CharField(choices=[("AMOSTRA", "Amostragem"), ("CABECALHO", "Cabeçalho X-Profile"), ("LATENCIA", "Acima do limiar de latência")], max_length=10)),
+                ("metodo", models.CharField(max_length=10)),
+                ("caminho", models.CharField(max_length=500)),
+                ("view", models.CharField(blank=True, default="", max_length=200)),
+                ("status_code", models.PositiveSmallIntegerField()),
+                ("duracao_ms", models.FloatField()),
+                ("total_consultas", models.PositiveIntegerField(default=0)),
+                ("tempo_sql_ms", models.FloatField(default=0)),
+                ("consultas", models.JSONField(blank=True, default=list)),
+                ("chamadas_drive", models.JSONField(blank=True, default=list)),
+                ("perfil", models.TextField(blank=True, default="")),
+                ("criado_em", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("oficina", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="perfis_requisicao", to="core.oficina")),
+                ("user", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="perfis_requisicao", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "verbose_name": "Perfil de requisição",
+                "verbose_name_plural": "Perfis de requisição",
+                "ordering": ("-criado_em",),
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_perfilrequisicao"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="os",
+            name="timeline_snapshot",
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="os",
+            name="timeline_versao",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
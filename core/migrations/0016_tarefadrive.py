@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_os_timeline_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaDrive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('ENVIAR_FOTOS', 'Enviar fotos ao Drive'), ('RESTAURAR_ARQUIVOS', 'Restaurar arquivos da OS reidratada'), ('RENOMEAR_PASTAS', 'Renomear pastas de etapa')], max_length=20)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDA', 'Concluída'), ('ERRO', 'Erro')], default='PENDENTE', max_length=12)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('erro', models.TextField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('oficina', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tarefas_drive', to='core.oficina')),
+            ],
+            options={
+                'verbose_name': 'Tarefa do Drive',
+                'verbose_name_plural': 'Tarefas do Drive',
+                'ordering': ('criado_em', 'id'),
+                'indexes': [models.Index(fields=['status', 'atualizado_em'], name='tarefadrive_status_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,16 @@
+import re
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def normalizar_identificador(valor) -> str:
+    """Placa/código para busca: maiúsculas, sem hífen nem espaços."""
+    if not valor:
+        return ""
+    return re.sub(r"[\s\-]+", "", str(valor)).upper()
 
 
 class Oficina(models.Model):
@@ -70,6 +80,14 @@ class Etapa(models.Model):
         verbose_name = "Etapa"
         verbose_name_plural = "Etapas"
         ordering = ('ordem',)
+        indexes = [
+            # Filtros booleanos viram "WHERE ativa" no SQL: índice parcial em vez de coluna
+            models.Index(
+                fields=['oficina', 'ordem'],
+                condition=models.Q(ativa=True),
+                name='etapa_ativas_ordem_idx',
+            ),
+        ]
 
     def __str__(self):
         prefixo = "Check-in - " if self.is_checkin else ""
@@ -96,6 +114,13 @@ class ConfigFoto(models.Model):
         verbose_name = "Configuração de foto"
         verbose_name_plural = "Configurações de fotos"
         ordering = ('ordem',)
+        indexes = [
+            models.Index(
+                fields=['oficina', 'etapa'],
+                condition=models.Q(obrigatoria=True, ativa=True),
+                name='configfoto_obrigatorias_idx',
+            ),
+        ]
 
     def clean(self):
         # Garante regra de negócio: só permitir configuração de fotos na etapa de check-in
@@ -130,6 +155,9 @@ class OS(models.Model):
 
     # Dados do veículo
     placa = models.CharField(max_length=10, blank=True, null=True)
+    # Placa e código em maiúsculas e sem hífen/espaços, usados pela busca
+    placa_normalizada = models.CharField(max_length=10, blank=True, default="", editable=False)
+    codigo_normalizado = models.CharField(max_length=50, blank=True, default="", editable=False)
     modelo_veiculo = models.CharField(max_length=100, blank=True, null=True)
     cor_veiculo = models.CharField(max_length=50, blank=True, null=True)
 
@@ -155,6 +183,11 @@ class OS(models.Model):
 
     aberta = models.BooleanField(default=True)
 
+    # Timeline materializada (core.services.timeline): recalculada só quando
+    # muda um OSEtapaStatus da OS ou as etapas da oficina.
+    timeline_snapshot = models.JSONField(null=True, blank=True, editable=False)
+    timeline_versao = models.PositiveIntegerField(default=0, editable=False)
+
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
@@ -164,6 +197,39 @@ class OS(models.Model):
         verbose_name_plural = "Ordens de Serviço"
         ordering = ('-criado_em',)
         unique_together = ('oficina', 'codigo')
+        indexes = [
+            models.Index(fields=['oficina', 'placa_normalizada'], name='os_oficina_placa_norm_idx'),
+            models.Index(fields=['oficina', 'codigo_normalizado'], name='os_oficina_codigo_norm_idx'),
+            # Dashboard: OS abertas por etapa
+            models.Index(
+                fields=['oficina', 'etapa_atual'],
+                condition=models.Q(aberta=True),
+                name='os_abertas_etapa_idx',
+            ),
+            # Ordenação padrão da lista de OS
+            models.Index(fields=['oficina', '-data_entrada', '-criado_em'], name='os_oficina_entrada_idx'),
+            # Lista de veículos em produção do PWA (só OS abertas)
+            models.Index(
+                fields=['oficina', '-atualizado_em'],
+                condition=models.Q(aberta=True),
+                name='os_abertas_atualizado_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.placa_normalizada = normalizar_identificador(self.placa)
+        self.codigo_normalizado = normalizar_identificador(self.codigo)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'placa' in update_fields:
+                update_fields.add('placa_normalizada')
+            if 'codigo' in update_fields:
+                update_fields.add('codigo_normalizado')
+            kwargs['update_fields'] = update_fields
+
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"OS {self.codigo} - {self.placa or ''} - {self.oficina.nome}"
@@ -231,12 +297,16 @@ class FotoOS(models.Model):
         related_name='fotos_tiradas'
     )
     tirada_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
 
     class Meta:
         verbose_name = "Foto da OS"
         verbose_name_plural = "Fotos da OS"
         ordering = ('tirada_em',)
+        indexes = [
+            models.Index(fields=['os', 'etapa', 'tirada_em'], name='fotoos_os_etapa_tirada_idx'),
+        ]
 
     def clean(self):
         """
@@ -327,6 +397,64 @@ class OSEtapaStatus(models.Model):
         return f"OS {self.os.codigo} - {self.etapa.nome} ({status})"
 
 
+class RegistroExcluido(models.Model):
+    """
+    Tombstone de exclusões para o delta sync do PWA (/api/pwa/changes/).
+    Gravado pelos sinais de post_delete de OS, FotoOS, OSEtapaStatus e
+    ObservacaoEtapaOS.
+    """
+    MODELO_CHOICES = (
+        ('OS', 'Ordem de Serviço'),
+        ('FotoOS', 'Foto da OS'),
+        ('OSEtapaStatus', 'Status da etapa da OS'),
+        ('ObservacaoEtapaOS', 'Observação da Etapa'),
+    )
+
+    oficina = models.ForeignKey(Oficina, on_delete=models.CASCADE, related_name='registros_excluidos')
+    modelo = models.CharField(max_length=30, choices=MODELO_CHOICES)
+    objeto_id = models.BigIntegerField()
+    os_id_original = models.BigIntegerField(blank=True, null=True)
+    excluido_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Registro excluído"
+        verbose_name_plural = "Registros excluídos"
+        ordering = ('excluido_em', 'id')
+
+    def __str__(self):
+        return f"{self.modelo} {self.objeto_id} excluído"
+
+
+class OSArquivada(models.Model):
+    """
+    OS fechada há mais de ARQUIVAMENTO_OS_DIAS, retirada das tabelas quentes.
+    ``dados`` guarda o snapshot serializado da OS, fotos, observações e status
+    de etapas para a reidratação.
+    """
+    oficina = models.ForeignKey(Oficina, on_delete=models.CASCADE, related_name='os_arquivadas')
+    os_id_original = models.BigIntegerField(unique=True)
+    codigo = models.CharField(max_length=50)
+    placa = models.CharField(max_length=10, blank=True, null=True)
+    placa_normalizada = models.CharField(max_length=10, blank=True, default="")
+    nome_cliente = models.CharField(max_length=255, blank=True, null=True)
+    data_entrada = models.DateTimeField(blank=True, null=True)
+    data_saida = models.DateTimeField(blank=True, null=True)
+
+    dados = models.JSONField(encoder=DjangoJSONEncoder)
+    arquivada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "OS arquivada"
+        verbose_name_plural = "OS arquivadas"
+        ordering = ('-arquivada_em',)
+        indexes = [
+            models.Index(fields=['oficina', 'placa_normalizada'], name='osarq_oficina_placa_idx'),
+        ]
+
+    def __str__(self):
+        return f"OS {self.codigo} (arquivada) - {self.oficina.nome}"
+
+
 class OficinaDriveConfig(models.Model):
     """
     Configuração de integração com o Google Drive para uma oficina.
@@ -354,4 +482,123 @@ class OficinaDriveConfig(models.Model):
         verbose_name_plural = "Configurações Google Drive"
 
     def __str__(self):
-        return f"Drive {self.oficina.nome} ({'Ativo' if self.ativo else 'Inativo'})"
\ No newline at end of file
+        return f"Drive {self.oficina.nome} ({'Ativo' if self.ativo else 'Inativo'})"
+
+class SyncJob(models.Model):
+    """
+    Sincronização do PWA recebida em modo assíncrono.
+    O payload fica salvo até um worker processá-lo com o SyncService.
+    """
+    STATUS_CHOICES = (
+        ('PENDENTE', 'Pendente'),
+        ('PROCESSANDO', 'Processando'),
+        ('CONCLUIDO', 'Concluído'),
+        ('ERRO', 'Erro'),
+    )
+
+    oficina = models.ForeignKey(Oficina, on_delete=models.CASCADE, related_name='sync_jobs')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_jobs')
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='PENDENTE')
+
+    payload = models.JSONField(default=dict, blank=True)
+    total_itens = models.PositiveIntegerField(default=0)
+    itens_processados = models.PositiveIntegerField(default=0)
+    resultados = models.JSONField(default=list, blank=True)
+    erro = models.TextField(blank=True, null=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(blank=True, null=True)
+    finalizado_em = models.DateTimeField(blank=True, null=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Sincronização assíncrona"
+        verbose_name_plural = "Sincronizações assíncronas"
+        ordering = ('-criado_em',)
+
+    def __str__(self):
+        return f"SyncJob {self.id} - {self.oficina.nome} ({self.status})"
+
+
+class PerfilRequisicao(models.Model):
+    """
+    Relatório de profiling de uma requisição (core.profiling): cProfile,
+    SQL executado e chamadas ao Drive. Baixado pelo admin.
+    """
+    MOTIVO_CHOICES = (
+        ('AMOSTRA', 'Amostragem'),
+        ('CABECALHO', 'Cabeçalho X-Profile'),
+        ('LATENCIA', 'Acima do limiar de latência'),
+    )
+
+    request_id = models.CharField(max_length=64, db_index=True)
+    motivo = models.CharField(max_length=10, choices=MOTIVO_CHOICES)
+    metodo = models.CharField(max_length=10)
+    caminho = models.CharField(max_length=500)
+    view = models.CharField(max_length=200, blank=True, default='')
+    status_code = models.PositiveSmallIntegerField()
+    duracao_ms = models.FloatField()
+
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True, related_name='perfis_requisicao'
+    )
+    oficina = models.ForeignKey(
+        Oficina, on_delete=models.SET_NULL, blank=True, null=True, related_name='perfis_requisicao'
+    )
+
+    total_consultas = models.PositiveIntegerField(default=0)
+    tempo_sql_ms = models.FloatField(default=0)
+    consultas = models.JSONField(default=list, blank=True)
+    chamadas_drive = models.JSONField(default=list, blank=True)
+    perfil = models.TextField(blank=True, default='')
+
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Perfil de requisição"
+        verbose_name_plural = "Perfis de requisição"
+        ordering = ('-criado_em',)
+
+    def __str__(self):
+        return f"{self.metodo} {self.caminho} ({self.duracao_ms:.0f} ms) [{self.request_id}]"
+
+
+class TarefaDrive(models.Model):
+    """
+    Trabalho de fundo do Drive (core.services.tarefas_drive), gravado na mesma
+    transação que o originou. Uma thread executa logo após o commit; o que um
+    worker reiniciado perder fica aqui para ``manage.py processar_tarefas_drive``.
+    """
+    TIPO_CHOICES = (
+        ('ENVIAR_FOTOS', 'Enviar fotos ao Drive'),
+        ('RESTAURAR_ARQUIVOS', 'Restaurar arquivos da OS reidratada'),
+        ('RENOMEAR_PASTAS', 'Renomear pastas de etapa'),
+    )
+    STATUS_CHOICES = (
+        ('PENDENTE', 'Pendente'),
+        ('PROCESSANDO', 'Processando'),
+        ('CONCLUIDA', 'Concluída'),
+        ('ERRO', 'Erro'),
+    )
+
+    oficina = models.ForeignKey(Oficina, on_delete=models.CASCADE, related_name='tarefas_drive')
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='PENDENTE')
+    parametros = models.JSONField(default=dict, blank=True)
+    tentativas = models.PositiveIntegerField(default=0)
+    erro = models.TextField(blank=True, null=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    finalizado_em = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Tarefa do Drive"
+        verbose_name_plural = "Tarefas do Drive"
+        ordering = ('criado_em', 'id')
+        indexes = [
+            models.Index(fields=['status', 'atualizado_em'], name='tarefadrive_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"TarefaDrive {self.id} - {self.tipo} ({self.status})"
@@ -0,0 +1,240 @@
+"""
+Profiling sob demanda das requisições da /api/.
+
+Uma requisição é perfilada quando:
+- cai na amostragem (``PROFILING_TAXA_AMOSTRAGEM``, de 0 a 1);
+- um superusuário envia ``X-Profile: 1`` (o usuário é resolvido antes da view,
+  inclusive pelo JWT da API: para os demais o cabeçalho é ignorado);
+- passa de ``PROFILING_LIMIAR_MS`` (neste caso só há SQL e Drive, sem cProfile:
+  o profiler teria de ficar ligado em todas as requisições).
+
+O relatório (cProfile, SQL com tempos e chamadas ao Drive) vai para
+PerfilRequisicao, identificado pelo X-Request-ID, e é baixado pelo admin.
+"""
+import cProfile
+import io
+import logging
+import pstats
+import random
+import time
+import uuid
+from contextlib import ExitStack
+from contextvars import ContextVar
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+MAX_CONSULTAS_NO_RELATORIO = 500
+LINHAS_PSTATS = 60
+
+_coleta_atual: ContextVar[Optional["ColetaPerfil"]] = ContextVar("coleta_perfil", default=None)
+
+
+class ColetaPerfil:
+    def __init__(self, com_cprofile: bool):
+        self.consultas = []
+        self.total_consultas = 0
+        self.tempo_sql = 0.0
+        self.chamadas_drive = []
+        self.profiler = cProfile.Profile() if com_cprofile else None
+
+    def medir_sql(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.total_consultas += 1
+            self.tempo_sql += duracao
+            if len(self.consultas) < MAX_CONSULTAS_NO_RELATORIO:
+                self.consultas.append({
+                    "sql": sql,
+                    "ms": round(duracao * 1000, 3),
+                    "many": many,
+                    "alias": context["connection"].alias,
+                })
+
+    def texto_pstats(self) -> str:
+        if self.profiler is None:
+            return ""
+        saida = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=saida)
+        stats.sort_stats("cumulative").print_stats(LINHAS_PSTATS)
+        return saida.getvalue()
+
+
+def registrar_chamada_drive(operacao: str, resultado: str, duracao: float):
+    """Chamado por core.metricas.medir_chamada_drive."""
+    coleta = _coleta_atual.get()
+    if coleta is not None:
+        coleta.chamadas_drive.append(
+            {"operacao": operacao, "resultado": resultado, "ms": round(duracao * 1000, 3)}
+        )
+
+
+def montar_relatorio(perfil) -> str:
+    """Relatório em texto de um PerfilRequisicao, para download."""
+    linhas = [
+        f"Request ID: {perfil.request_id}",
+        f"{perfil.metodo} {perfil.caminho} -> {perfil.status_code} ({perfil.view or '-'})",
+        f"Motivo: {perfil.get_motivo_display()}",
+        f"Duração: {perfil.duracao_ms:.1f} ms",
+        f"Usuário: {perfil.user or '-'} | Oficina: {perfil.oficina or '-'}",
+        f"Criado em: {perfil.criado_em.isoformat()}",
+        "",
+        f"== SQL: {perfil.total_consultas} consultas, {perfil.tempo_sql_ms:.1f} ms ==",
+    ]
+    for consulta in perfil.consultas:
+        linhas.append(f"[{consulta['ms']:.3f} ms] {consulta['sql']}")
+    if perfil.total_consultas > len(perfil.consultas):
+        linhas.append(f"... {perfil.total_consultas - len(perfil.consultas)} consultas omitidas")
+
+    linhas += ["", f"== Drive: {len(perfil.chamadas_drive)} chamadas =="]
+    for chamada in perfil.chamadas_drive:
+        linhas.append(f"[{chamada['ms']:.3f} ms] {chamada['operacao']} ({chamada['resultado']})")
+
+    linhas += ["", "== cProfile ==", perfil.perfil or "(sem cProfile: capturado por latência)"]
+    return "\n".join(linhas)
+
+
+class ProfilingMiddleware:
+    """
+    Sob ASGI as consultas e as views sync rodam em threads do sync_to_async,
+    fora do alcance do cProfile e do execute_wrapper desta thread: nesse modo
+    o relatório traz só a latência e as chamadas ao Drive.
+    """
+
+    caminhos = ("/api/",)
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _gatilhos(self, request):
+        taxa = getattr(settings, "PROFILING_TAXA_AMOSTRAGEM", 0.0)
+        limiar_ms = getattr(settings, "PROFILING_LIMIAR_MS", 0)
+        pediu_cabecalho = request.META.get("HTTP_X_PROFILE", "").strip() in ("1", "true")
+        amostrada = taxa > 0 and random.random() < taxa
+        return amostrada, pediu_cabecalho, limiar_ms
+
+    @staticmethod
+    def _superusuario(request) -> bool:
+        user = getattr(request, "user", None)
+        if getattr(user, "is_superuser", False):
+            return True
+        if not request.META.get("HTTP_AUTHORIZATION"):
+            return False
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+
+        try:
+            autenticado = JWTAuthentication().authenticate(request)
+        except Exception:
+            return False
+        return bool(autenticado and autenticado[0].is_superuser)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not request.path.startswith(self.caminhos):
+            return self.get_response(request)
+
+        amostrada, pediu_cabecalho, limiar_ms = self._gatilhos(request)
+        pediu_cabecalho = pediu_cabecalho and self._superusuario(request)
+        if not (amostrada or pediu_cabecalho or limiar_ms):
+            return self.get_response(request)
+
+        coleta = ColetaPerfil(com_cprofile=amostrada or pediu_cabecalho)
+        token = _coleta_atual.set(coleta)
+        inicio = time.perf_counter()
+        try:
+            # Todos os aliases: leituras das views marcadas vão para a réplica
+            with ExitStack() as pilha:
+                for alias in connections:
+                    pilha.enter_context(connections[alias].execute_wrapper(coleta.medir_sql))
+                if coleta.profiler is not None:
+                    coleta.profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if coleta.profiler is not None:
+                        coleta.profiler.disable()
+        finally:
+            _coleta_atual.reset(token)
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+
+        self._registrar(request, response, coleta, amostrada, pediu_cabecalho, limiar_ms, duracao_ms)
+        return response
+
+    async def __acall__(self, request):
+        if not request.path.startswith(self.caminhos):
+            return await self.get_response(request)
+
+        amostrada, pediu_cabecalho, limiar_ms = self._gatilhos(request)
+        pediu_cabecalho = pediu_cabecalho and await sync_to_async(self._superusuario)(request)
+        if not (amostrada or pediu_cabecalho or limiar_ms):
+            return await self.get_response(request)
+
+        coleta = ColetaPerfil(com_cprofile=False)
+        token = _coleta_atual.set(coleta)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _coleta_atual.reset(token)
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+
+        await sync_to_async(self._registrar)(
+            request, response, coleta, amostrada, pediu_cabecalho, limiar_ms, duracao_ms
+        )
+        return response
+
+    def _registrar(self, request, response, coleta, amostrada, pediu_cabecalho, limiar_ms, duracao_ms):
+        if amostrada:
+            motivo = "AMOSTRA"
+        elif pediu_cabecalho:
+            motivo = "CABECALHO"
+        elif limiar_ms and duracao_ms >= limiar_ms:
+            motivo = "LATENCIA"
+        else:
+            return
+
+        request_id = request.META.get("HTTP_X_REQUEST_ID") or uuid.uuid4().hex
+        self._salvar(request, response, coleta, motivo, request_id, duracao_ms)
+        response["X-Request-ID"] = request_id
+
+    def _salvar(self, request, response, coleta, motivo, request_id, duracao_ms):
+        from core.models import PerfilRequisicao
+        from core.utils import get_oficina_do_usuario
+
+        user = getattr(request, "user", None)
+        if not getattr(user, "is_authenticated", False):
+            user = None
+
+        match = getattr(request, "resolver_match", None)
+        try:
+            PerfilRequisicao.objects.create(
+                request_id=request_id[:64],
+                motivo=motivo,
+                metodo=request.method,
+                caminho=request.get_full_path()[:500],
+                view=(match.view_name if match else "") or "",
+                status_code=response.status_code,
+                duracao_ms=duracao_ms,
+                user=user,
+                oficina=get_oficina_do_usuario(user) if user else None,
+                total_consultas=coleta.total_consultas,
+                tempo_sql_ms=coleta.tempo_sql * 1000,
+                consultas=coleta.consultas,
+                chamadas_drive=coleta.chamadas_drive,
+                perfil=coleta.texto_pstats(),
+            )
+        except Exception:
+            logger.exception("Falha ao salvar perfil da requisição", extra={"request_id": request_id})
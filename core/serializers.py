@@ -1,6 +1,7 @@
 import base64
 import uuid
 import imghdr
+from django.conf import settings
 from django.core.files.base import ContentFile
 from rest_framework import serializers
 from .models import (
@@ -12,7 +13,9 @@ from .models import (
     FotoOS,
     ObservacaoEtapaOS,
     OSEtapaStatus,
+    SyncJob,
 )
+from .services.timeline import obter_timeline
 from .utils import get_oficina_do_usuario
 
 
@@ -257,6 +260,23 @@ class OSSerializer(serializers.ModelSerializer):
             },
         }
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # Na lista, os ids de todas as fotos (uma consulta por OS) dão lugar
+        # ao resumo por etapa calculado para a página inteira
+        if 'resumo_fotos' in self.context:
+            fields.pop('fotos', None)
+        return fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'resumo_fotos' in self.context:
+            data['resumo_fotos'] = self.context['resumo_fotos'].get(instance.id, [])
+        # ?incluir=timeline na lista: lê o snapshot materializado da OS
+        if self.context.get('incluir_timeline'):
+            data['timeline'] = obter_timeline(instance)
+        return data
+
     def get_observacoes_etapas(self, obj):
         qs = getattr(obj, 'observacoes_etapas', None)
         if qs is None:
@@ -333,6 +353,25 @@ class SyncRequestSerializer(serializers.Serializer):
     osPendentes = SyncOSPayloadSerializer(many=True, required=False, default=list)
 
 
+class SyncJobSerializer(serializers.ModelSerializer):
+    results = serializers.JSONField(source='resultados', read_only=True)
+
+    class Meta:
+        model = SyncJob
+        fields = [
+            'id',
+            'status',
+            'total_itens',
+            'itens_processados',
+            'results',
+            'erro',
+            'criado_em',
+            'iniciado_em',
+            'finalizado_em',
+        ]
+        read_only_fields = fields
+
+
 class PwaEtapaAtualSerializer(serializers.Serializer):
     id = serializers.IntegerField(allow_null=True)
     nome = serializers.CharField(allow_null=True, allow_blank=True)
@@ -454,6 +493,8 @@ class FotoOSSerializer(serializers.ModelSerializer):
         if not os_obj:
             raise serializers.ValidationError({'os': 'OS é obrigatória.'})
 
+        self.validar_oficina_da_os(os_obj, user)
+
         if etapa is None:
             if self.instance:
                 etapa = getattr(self.instance, 'etapa', None)
@@ -466,17 +507,26 @@ class FotoOSSerializer(serializers.ModelSerializer):
                 {'detail': 'OS não possui etapa atual para associar a foto.'}
             )
 
+        self.validar_regras_foto(os_obj, etapa, tipo, config_foto)
+
+        attrs['tipo'] = tipo
+        attrs['etapa'] = etapa
+        return attrs
+
+    @staticmethod
+    def validar_oficina_da_os(os_obj, user):
+        """A OS precisa ser da oficina do usuário (superusuário vê todas)."""
         if user and user.is_authenticated and not user.is_superuser:
             oficina_usuario = get_oficina_do_usuario(user)
             if not oficina_usuario or os_obj.oficina_id != oficina_usuario.id:
                 raise serializers.ValidationError({'os': 'OS não encontrada para esta oficina.'})
 
+    @staticmethod
+    def validar_regras_foto(os_obj, etapa, tipo, config_foto):
+        """Etapa, tipo e ConfigFoto de uma foto (também usado pelo upload em lote)."""
         if etapa and etapa.oficina_id != os_obj.oficina_id:
             raise serializers.ValidationError({'etapa': 'Etapa não encontrada para esta oficina.'})
 
-        attrs['tipo'] = tipo
-        attrs['etapa'] = etapa
-
         if tipo == 'PADRAO':
             if not etapa:
                 raise serializers.ValidationError({'etapa': 'Fotos PADRÃO precisam de etapa.'})
@@ -492,4 +542,88 @@ class FotoOSSerializer(serializers.ModelSerializer):
         else:
             raise serializers.ValidationError({'tipo': 'Tipo de foto inválido.'})
 
+
+class FotoOSLoteSerializer(serializers.Serializer):
+    """
+    Várias fotos de uma OS/etapa num único multipart (POST /api/fotos-os/lote/).
+
+    ``config_foto`` é opcional e, quando enviado, alinhado por posição com
+    ``arquivos``: id da ConfigFoto para foto PADRÃO, vazio para foto LIVRE.
+    OS, etapa, vínculo do usuário e ConfigFoto são buscados uma vez para o lote.
+    """
+    os = serializers.PrimaryKeyRelatedField(
+        queryset=OS.objects.select_related('oficina', 'etapa_atual')
+    )
+    etapa = serializers.PrimaryKeyRelatedField(
+        queryset=Etapa.objects.all(), required=False, allow_null=True
+    )
+    arquivos = serializers.ListField(child=serializers.FileField(), allow_empty=False)
+    config_foto = serializers.ListField(
+        child=serializers.CharField(allow_blank=True), required=False, default=list
+    )
+
+    def validate_arquivos(self, value):
+        limite = getattr(settings, 'FOTOS_LOTE_MAX_ARQUIVOS', 30)
+        if len(value) > limite:
+            raise serializers.ValidationError(f'Envie no máximo {limite} fotos por lote.')
+        return value
+
+    def validate(self, attrs):
+        os_obj = attrs['os']
+        arquivos = attrs['arquivos']
+        configs_enviadas = attrs.get('config_foto') or []
+
+        request = self.context.get('request') if self.context else None
+        user = getattr(request, 'user', None)
+
+        # Mesma resolução de oficina e mesmas regras do POST /api/fotos-os/
+        FotoOSSerializer.validar_oficina_da_os(os_obj, user)
+        usuario_oficina = None
+        if user and user.is_authenticated and not user.is_superuser:
+            usuario_oficina = UsuarioOficina.objects.filter(
+                user=user, oficina_id=os_obj.oficina_id, ativo=True
+            ).first()
+
+        etapa = attrs.get('etapa') or os_obj.etapa_atual
+        if etapa is None:
+            raise serializers.ValidationError(
+                {'detail': 'OS não possui etapa atual para associar a foto.'}
+            )
+
+        if configs_enviadas and len(configs_enviadas) != len(arquivos):
+            raise serializers.ValidationError(
+                {'config_foto': 'Informe uma config_foto (ou vazio) para cada arquivo.'}
+            )
+
+        try:
+            config_ids = [int(valor) if valor else None for valor in configs_enviadas]
+        except ValueError:
+            raise serializers.ValidationError({'config_foto': 'Id de ConfigFoto inválido.'})
+
+        configs = ConfigFoto.objects.in_bulk({i for i in config_ids if i is not None})
+        if any(config_id not in configs for config_id in config_ids if config_id is not None):
+            raise serializers.ValidationError({'config_foto': 'ConfigFoto deve ser da mesma oficina da OS.'})
+
+        # Validação de campo e regras de FotoOSSerializer, arquivo a arquivo
+        campo_arquivo = FotoOSSerializer().fields['arquivo']
+        config_ids = config_ids or [None] * len(arquivos)
+        erros = {}
+        for indice, (arquivo, config_id) in enumerate(zip(arquivos, config_ids)):
+            config_foto = configs.get(config_id) if config_id else None
+            try:
+                campo_arquivo.run_validation(arquivo)
+                FotoOSSerializer.validar_regras_foto(
+                    os_obj, etapa, 'PADRAO' if config_foto else 'LIVRE', config_foto
+                )
+            except serializers.ValidationError as exc:
+                erros[indice] = exc.detail
+        if erros:
+            raise serializers.ValidationError({'arquivos': erros})
+
+        attrs['etapa'] = etapa
+        attrs['usuario_oficina'] = usuario_oficina
+        attrs['itens'] = [
+            (arquivo, configs.get(config_id) if config_id else None)
+            for arquivo, config_id in zip(arquivos, config_ids)
+        ]
         return attrs
@@ -0,0 +1,220 @@
+"""
+Arquivamento de OS fechadas.
+
+As OS fechadas há mais de ARQUIVAMENTO_OS_DIAS saem das tabelas quentes (OS,
+FotoOS, ObservacaoEtapaOS, OSEtapaStatus) para um snapshot em OSArquivada.
+Arquivos locais de fotos que já têm ``drive_file_id`` são removidos do
+MEDIA_ROOT; a reidratação recria as linhas com os ids originais e baixa do
+Drive os arquivos que não estiverem mais no disco.
+"""
+import logging
+from datetime import timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.core import serializers
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.drive_service import baixar_arquivo_drive
+from core.models import (
+    ConfigFoto,
+    Etapa,
+    FotoOS,
+    OS,
+    OSArquivada,
+    OSEtapaStatus,
+    ObservacaoEtapaOS,
+    UsuarioOficina,
+)
+from core.services.tarefas_drive import RESTAURAR_ARQUIVOS, agendar_tarefa
+
+logger = logging.getLogger(__name__)
+
+
+class ConflitoReidratacao(Exception):
+    """A OS arquivada não pode voltar: o código (ou o id) já está em uso."""
+
+
+def _serializar(objetos) -> List[dict]:
+    return serializers.serialize("python", objetos)
+
+
+def os_para_arquivar(dias: Optional[int] = None, oficina=None):
+    if dias is None:
+        dias = getattr(settings, "ARQUIVAMENTO_OS_DIAS", 180)
+    limite = timezone.now() - timedelta(days=dias)
+
+    qs = OS.objects.filter(aberta=False).filter(
+        Q(data_saida__lt=limite) | Q(data_saida__isnull=True, atualizado_em__lt=limite)
+    )
+    if oficina is not None:
+        qs = qs.filter(oficina=oficina)
+    return qs.order_by("id")
+
+
+def _remover_arquivos_locais(nomes: List[str]):
+    for nome in nomes:
+        try:
+            default_storage.delete(nome)
+        except Exception:
+            logger.warning("Falha ao remover arquivo local arquivado", extra={"arquivo": nome}, exc_info=True)
+
+
+def arquivar_os(os_obj: OS) -> OSArquivada:
+    with transaction.atomic():
+        fotos = list(FotoOS.objects.filter(os=os_obj))
+        dados = {
+            "os": _serializar([os_obj])[0],
+            "status_etapas": _serializar(OSEtapaStatus.objects.filter(os=os_obj)),
+            "observacoes": _serializar(ObservacaoEtapaOS.objects.filter(os=os_obj)),
+            "fotos": _serializar(fotos),
+        }
+
+        arquivada = OSArquivada.objects.create(
+            oficina_id=os_obj.oficina_id,
+            os_id_original=os_obj.id,
+            codigo=os_obj.codigo,
+            placa=os_obj.placa,
+            placa_normalizada=os_obj.placa_normalizada,
+            nome_cliente=os_obj.nome_cliente,
+            data_entrada=os_obj.data_entrada,
+            data_saida=os_obj.data_saida,
+            dados=dados,
+        )
+        os_obj.delete()
+
+        # Só sai do disco o que já está confirmado no Drive.
+        arquivos_no_drive = [f.arquivo.name for f in fotos if f.drive_file_id and f.arquivo]
+        transaction.on_commit(lambda: _remover_arquivos_locais(arquivos_no_drive))
+
+    logger.info(
+        "OS arquivada",
+        extra={
+            "oficina_id": arquivada.oficina_id,
+            "os_id": arquivada.os_id_original,
+            "fotos_removidas_do_disco": len(arquivos_no_drive),
+        },
+    )
+    return arquivada
+
+
+def arquivar_os_fechadas(dias: Optional[int] = None, oficina=None, limite: Optional[int] = None) -> int:
+    ids = list(os_para_arquivar(dias, oficina).values_list("id", flat=True)[:limite])
+    total = 0
+    for os_obj in OS.objects.filter(id__in=ids).select_related("oficina"):
+        arquivar_os(os_obj)
+        total += 1
+    return total
+
+
+def _ajustar_fk(campos: dict, campo: str, validos: set, obrigatorio: bool = False) -> bool:
+    """
+    Anula FKs para registros que deixaram de existir desde o arquivamento.
+    Retorna False quando a FK é obrigatória e o registro deve ser descartado.
+    """
+    valor = campos.get(campo)
+    if valor is None or valor in validos:
+        return True
+    if obrigatorio:
+        return False
+    campos[campo] = None
+    return True
+
+
+def reidratar_os(arquivada: OSArquivada, baixar_fotos: bool = True) -> OS:
+    dados = arquivada.dados
+    oficina_id = arquivada.oficina_id
+
+    etapas = set(Etapa.objects.filter(oficina_id=oficina_id).values_list("id", flat=True))
+    configs = set(ConfigFoto.objects.filter(oficina_id=oficina_id).values_list("id", flat=True))
+    usuarios = set(UsuarioOficina.objects.filter(oficina_id=oficina_id).values_list("id", flat=True))
+
+    registro_os = dados["os"]
+    _ajustar_fk(registro_os["fields"], "etapa_atual", etapas)
+
+    registros = [registro_os]
+    for registro in dados.get("status_etapas", []):
+        if _ajustar_fk(registro["fields"], "etapa", etapas, obrigatorio=True):
+            registros.append(registro)
+    for registro in dados.get("observacoes", []):
+        if _ajustar_fk(registro["fields"], "etapa", etapas, obrigatorio=True):
+            _ajustar_fk(registro["fields"], "criado_por", usuarios)
+            registros.append(registro)
+    for registro in dados.get("fotos", []):
+        campos = registro["fields"]
+        _ajustar_fk(campos, "etapa", etapas)
+        _ajustar_fk(campos, "config_foto", configs)
+        _ajustar_fk(campos, "tirada_por", usuarios)
+        registros.append(registro)
+
+    codigo = registro_os["fields"].get("codigo")
+    if OS.objects.filter(pk=arquivada.os_id_original).exists() or OS.objects.filter(
+        oficina_id=oficina_id, codigo=codigo
+    ).exists():
+        raise ConflitoReidratacao(
+            f"Já existe uma OS ativa com o código {codigo} nesta oficina; "
+            "altere o código dela antes de reidratar."
+        )
+
+    agora = timezone.now()
+    try:
+        os_obj = _gravar_reidratacao(arquivada, registros, agora)
+    except IntegrityError as exc:
+        # OS com o mesmo código criada entre a checagem e a gravação
+        raise ConflitoReidratacao(f"Já existe uma OS ativa com o código {codigo} nesta oficina.") from exc
+
+    if baixar_fotos:
+        restaurar_arquivos_locais(os_obj)
+
+    logger.info("OS reidratada", extra={"oficina_id": oficina_id, "os_id": os_obj.id})
+    return os_obj
+
+
+def _gravar_reidratacao(arquivada: OSArquivada, registros: List[dict], agora) -> OS:
+    with transaction.atomic():
+        for objeto in serializers.deserialize("python", registros, ignorenonexistent=True):
+            objeto.save()
+
+        os_obj = OS.objects.select_related("oficina").get(pk=arquivada.os_id_original)
+
+        # Reaparece no delta sync do PWA mesmo com cursor posterior ao arquivamento.
+        OS.objects.filter(pk=os_obj.pk).update(atualizado_em=agora)
+        FotoOS.objects.filter(os=os_obj).update(atualizado_em=agora)
+        OSEtapaStatus.objects.filter(os=os_obj).update(atualizado_em=agora)
+        ObservacaoEtapaOS.objects.filter(os=os_obj).update(atualizado_em=agora)
+
+        arquivada.delete()
+    return os_obj
+
+
+def restaurar_arquivos_locais(os_obj: OS) -> int:
+    """Baixa do Drive os arquivos de fotos que não estão mais no disco."""
+    restaurados = 0
+    fotos = FotoOS.objects.filter(os=os_obj).exclude(drive_file_id__isnull=True).exclude(drive_file_id="")
+    for foto in fotos:
+        if not foto.arquivo or default_storage.exists(foto.arquivo.name):
+            continue
+
+        conteudo = baixar_arquivo_drive(os_obj.oficina, foto.drive_file_id)
+        if conteudo is None:
+            continue
+
+        nome = default_storage.save(foto.arquivo.name, ContentFile(conteudo))
+        if nome != foto.arquivo.name:
+            FotoOS.objects.filter(pk=foto.pk).update(arquivo=nome)
+        restaurados += 1
+
+    return restaurados
+
+
+def agendar_restauracao_arquivos(os_obj: OS):
+    """
+    Agenda (TarefaDrive) o download do Drive dos arquivos da OS reidratada,
+    feito depois do commit: uma chamada ao Drive por foto não cabe numa
+    requisição HTTP. Chame na mesma transação da reidratação.
+    """
+    agendar_tarefa(RESTAURAR_ARQUIVOS, os_obj.oficina_id, {"os_id": os_obj.id})
@@ -0,0 +1,138 @@
+"""
+Busca de OS por código, placa e nome do cliente.
+
+- PostgreSQL: filtros LIKE atendidos pelos índices GIN ``pg_trgm`` criados na
+  migração 0011 sobre os campos normalizados e ``UPPER(nome_cliente)``.
+- SQLite: tabela FTS5 ``core_os_busca`` (tokenizer trigram), mantida pelos
+  sinais de OS; termos com menos de 3 caracteres caem no LIKE.
+
+Placa e código são comparados normalizados (maiúsculas, sem hífen/espaços), e
+o resultado é ordenado por relevância: igual > começa com > contém.
+"""
+import logging
+
+from django.db import DatabaseError, connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from core.models import OS, normalizar_identificador
+
+logger = logging.getLogger(__name__)
+
+TABELA_FTS = "core_os_busca"
+
+_fts_disponivel_cache = {}
+
+
+def _usa_fts() -> bool:
+    if connection.vendor != "sqlite":
+        return False
+
+    chave = str(connection.settings_dict.get("NAME"))
+    if chave not in _fts_disponivel_cache:
+        _fts_disponivel_cache[chave] = TABELA_FTS in connection.introspection.table_names()
+    return _fts_disponivel_cache[chave]
+
+
+def _expressao_fts(*termos) -> str:
+    frases = []
+    for termo in termos:
+        if termo and len(termo) >= 3:
+            frases.append('"{}"'.format(termo.replace('"', '""')))
+    return " OR ".join(dict.fromkeys(frases))
+
+
+def buscar_os(qs, termo: str):
+    """
+    Filtra ``qs`` pelo termo e anota ``relevancia_busca`` (menor = melhor).
+    """
+    termo = (termo or "").strip()
+    normalizado = normalizar_identificador(termo)
+
+    expressao = _expressao_fts(normalizado, termo)
+    if expressao and _usa_fts():
+        qs = qs.filter(
+            id__in=RawSQL(
+                f"SELECT rowid FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s",
+                [expressao],
+            )
+        )
+    else:
+        filtro = Q(nome_cliente__icontains=termo)
+        if normalizado:
+            filtro |= Q(placa_normalizada__contains=normalizado)
+            filtro |= Q(codigo_normalizado__contains=normalizado)
+        qs = qs.filter(filtro)
+
+    if not normalizado:
+        return qs.annotate(relevancia_busca=Value(2, output_field=IntegerField()))
+
+    return qs.annotate(
+        relevancia_busca=Case(
+            When(Q(placa_normalizada=normalizado) | Q(codigo_normalizado=normalizado), then=Value(0)),
+            When(
+                Q(placa_normalizada__startswith=normalizado)
+                | Q(codigo_normalizado__startswith=normalizado),
+                then=Value(1),
+            ),
+            default=Value(2),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def indexar_os(os_obj):
+    if not _usa_fts():
+        return
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABELA_FTS} WHERE rowid = %s", [os_obj.pk])
+            cursor.execute(
+                f"INSERT INTO {TABELA_FTS} (rowid, placa, codigo, nome_cliente) "
+                "VALUES (%s, %s, %s, %s)",
+                [
+                    os_obj.pk,
+                    os_obj.placa_normalizada,
+                    os_obj.codigo_normalizado,
+                    os_obj.nome_cliente or "",
+                ],
+            )
+    except DatabaseError:
+        logger.exception("Falha ao indexar OS na busca", extra={"os_id": os_obj.pk})
+
+
+def remover_os_do_indice(os_id):
+    if not _usa_fts():
+        return
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABELA_FTS} WHERE rowid = %s", [os_id])
+    except DatabaseError:
+        logger.exception("Falha ao remover OS da busca", extra={"os_id": os_id})
+
+
+def reindexar_todas():
+    """Reconstrói o índice FTS do SQLite (ex.: após ``QuerySet.update``)."""
+    if not _usa_fts():
+        return 0
+
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_FTS}")
+        for os_obj in OS.objects.only(
+            "id", "placa_normalizada", "codigo_normalizado", "nome_cliente"
+        ).iterator():
+            cursor.execute(
+                f"INSERT INTO {TABELA_FTS} (rowid, placa, codigo, nome_cliente) "
+                "VALUES (%s, %s, %s, %s)",
+                [
+                    os_obj.pk,
+                    os_obj.placa_normalizada,
+                    os_obj.codigo_normalizado,
+                    os_obj.nome_cliente or "",
+                ],
+            )
+            total += 1
+    return total
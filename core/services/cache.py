@@ -0,0 +1,134 @@
+"""
+Cache compartilhado com namespace por oficina e invalidação por versão.
+
+Cada escopo (``os``, ``etapas``, ``config_fotos``, ``fotos``, ``drive``) tem um
+contador de versão por oficina no backend configurado em ``CACHES``. As chaves
+das entradas embutem as versões dos escopos de que dependem; invalidar é só
+incrementar o contador, e as entradas antigas expiram sozinhas pelo TTL.
+
+Os sinais de OS, Etapa, ConfigFoto, FotoOS e OficinaDriveConfig chamam
+``invalidar`` (ver core/signals.py). Alterações via ``QuerySet.update`` não
+disparam sinais: nesses casos chame ``invalidar`` explicitamente.
+"""
+import logging
+import time
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.db_router import lendo_da_replica
+
+logger = logging.getLogger(__name__)
+
+ESCOPO_OS = "os"
+ESCOPO_ETAPAS = "etapas"
+ESCOPO_CONFIG_FOTOS = "config_fotos"
+ESCOPO_FOTOS = "fotos"
+ESCOPO_DRIVE = "drive"
+
+TODOS_ESCOPOS = (ESCOPO_OS, ESCOPO_ETAPAS, ESCOPO_CONFIG_FOTOS, ESCOPO_FOTOS, ESCOPO_DRIVE)
+
+# Namespace das consultas sem filtro de oficina (superusuário).
+GLOBAL = "todas"
+
+_VAZIO = object()
+
+
+def _namespace(oficina_id) -> str:
+    return GLOBAL if oficina_id is None else str(oficina_id)
+
+
+def _chave_versao(oficina_id, escopo: str) -> str:
+    return f"versao:{_namespace(oficina_id)}:{escopo}"
+
+
+def _versao_inicial() -> int:
+    # Baseada no relógio para não reaproveitar versões de um contador despejado.
+    return int(time.time() * 1000)
+
+
+def obter_versoes(oficina_id, escopos: Iterable[str]) -> dict:
+    chaves = {_chave_versao(oficina_id, escopo): escopo for escopo in escopos}
+    encontradas = cache.get_many(list(chaves))
+
+    versoes = {}
+    for chave, escopo in chaves.items():
+        versao = encontradas.get(chave)
+        if versao is None:
+            cache.add(chave, _versao_inicial(), None)
+            versao = cache.get(chave) or _versao_inicial()
+        versoes[escopo] = versao
+    return versoes
+
+
+def obter_versao(oficina_id, escopo: str) -> int:
+    return obter_versoes(oficina_id, [escopo])[escopo]
+
+
+def montar_chave(oficina_id, escopos: Iterable[str], nome: str, *partes) -> str:
+    escopos = sorted(set(escopos))
+    versoes = obter_versoes(oficina_id, escopos)
+    assinatura = ".".join(f"{escopo}{versoes[escopo]}" for escopo in escopos)
+    sufixo = ":".join(str(parte) for parte in partes)
+    return f"{nome}:{_namespace(oficina_id)}:{assinatura}:{sufixo}"
+
+
+def obter_ou_calcular(
+    oficina_id,
+    escopos: Iterable[str],
+    nome: str,
+    calcular: Callable[[], object],
+    *partes,
+    timeout: Optional[int] = None,
+):
+    """
+    Devolve o valor em cache para (oficina, escopos, nome, partes) ou calcula,
+    grava e devolve. Falhas do backend caem no cálculo direto.
+    """
+    if timeout is None:
+        timeout = getattr(settings, "CACHE_TTL_SEGUNDOS", 300)
+
+    try:
+        chave = montar_chave(oficina_id, escopos, nome, *partes)
+        valor = cache.get(chave, _VAZIO)
+    except Exception:
+        logger.warning("Cache indisponível; calculando sem cache", extra={"nome": nome}, exc_info=True)
+        return calcular()
+
+    if valor is not _VAZIO:
+        return valor
+
+    valor = calcular()
+    if lendo_da_replica():
+        # Calculado na réplica: pode estar atrás da versão que acabou de
+        # ser invalidada, então não fica no cache além do atraso tolerado.
+        timeout = min(timeout, int(getattr(settings, "REPLICA_LAG_MAX_SEGUNDOS", 5)) or 1)
+    try:
+        cache.set(chave, valor, timeout)
+    except Exception:
+        logger.warning("Falha ao gravar no cache", extra={"nome": nome}, exc_info=True)
+    return valor
+
+
+def invalidar(oficina_id, *escopos: str):
+    """
+    Incrementa a versão dos escopos da oficina e do namespace global, que
+    agrega os dados de todas as oficinas.
+    """
+    escopos = escopos or TODOS_ESCOPOS
+    alvos = [None] if oficina_id is None else [oficina_id, None]
+
+    for alvo in alvos:
+        for escopo in escopos:
+            chave = _chave_versao(alvo, escopo)
+            try:
+                cache.incr(chave)
+            except ValueError:
+                cache.set(chave, _versao_inicial(), None)
+            except Exception:
+                logger.warning(
+                    "Falha ao invalidar cache",
+                    extra={"oficina_id": oficina_id, "escopo": escopo},
+                    exc_info=True,
+                )
@@ -0,0 +1,44 @@
+"""
+Renomeação, em segundo plano, das subpastas de etapa já criadas no Drive.
+
+O nome da subpasta ("01 - Funilaria") sai de ``Etapa.ordem`` e ``Etapa.nome``.
+As pastas são encontradas pelas appProperties, então renomear ou reordenar
+etapas não quebra os uploads; isto só mantém o nome visível no Drive em dia.
+
+Salvar várias etapas na mesma transação (ex.: reordenar o fluxo) agenda uma
+única TarefaDrive por oficina, executada depois do commit.
+"""
+import logging
+from typing import Dict, Iterable
+
+from django.conf import settings
+
+from core.models import Etapa, OficinaDriveConfig
+from core.services.tarefas_drive import agendar_renomeacao
+
+logger = logging.getLogger(__name__)
+
+
+def renomear_pastas_etapas(oficina_id: int, etapa_ids: Iterable[int]) -> Dict[str, int]:
+    """Renomeia no Drive as subpastas destas etapas em todas as OS da oficina."""
+    from asgiref.sync import async_to_sync
+
+    from core.drive_async import renomear_pastas_etapas_async
+
+    config = OficinaDriveConfig.objects.filter(
+        oficina_id=oficina_id, ativo=True, root_folder_id__gt=""
+    ).first()
+    etapas = list(Etapa.objects.filter(oficina_id=oficina_id, id__in=list(etapa_ids)).order_by("ordem", "id"))
+    if config is None or not etapas:
+        return {"renomeadas": 0, "falhas": 0}
+
+    resultado = async_to_sync(renomear_pastas_etapas_async)(
+        config, etapas, concorrencia=getattr(settings, "DRIVE_UPLOAD_CONCORRENCIA", 4)
+    )
+    logger.info("Pastas de etapa renomeadas no Drive", extra={"oficina_id": oficina_id, **resultado})
+    return resultado
+
+
+def agendar_renomeacao_pastas_etapa(oficina_id: int, etapa_id: int):
+    """Agenda (TarefaDrive) a renomeação da subpasta desta etapa em todas as OS."""
+    agendar_renomeacao(oficina_id, etapa_id)
@@ -0,0 +1,107 @@
+"""
+Grafo de etapas por oficina (ordem das etapas ativas, check-in, próxima/anterior).
+
+Mantido em memória no processo e validado contra a versão do escopo ``etapas``
+no cache compartilhado, que os sinais de Etapa/Oficina incrementam: uma
+alteração feita em um worker invalida o grafo de todos. O TTL cobre
+alterações feitas por ``QuerySet.update``. Grafos lidos da réplica não são guardados.
+As instâncias de Etapa devolvidas são compartilhadas: trate-as como somente leitura.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from core.db_router import lendo_da_replica
+from core.services.cache import ESCOPO_ETAPAS, obter_versao
+
+
+class GrafoEtapas:
+    def __init__(self, oficina_id: int, etapas: List):
+        self.oficina_id = oficina_id
+        self.por_id: Dict[int, object] = {etapa.id: etapa for etapa in etapas}
+        self.ativas: List = sorted(
+            (etapa for etapa in etapas if etapa.ativa), key=lambda e: (e.ordem, e.id)
+        )
+        self._ordens = [etapa.ordem for etapa in self.ativas]
+        self.checkin = next((etapa for etapa in self.ativas if etapa.is_checkin), None)
+
+        self.proxima_por_id: Dict[int, Optional[object]] = {}
+        self.anterior_por_id: Dict[int, Optional[object]] = {}
+        for etapa in etapas:
+            self.proxima_por_id[etapa.id] = self.proxima_apos_ordem(etapa.ordem)
+            self.anterior_por_id[etapa.id] = self.anterior_a_ordem(etapa.ordem)
+
+    @property
+    def primeira(self):
+        return self.ativas[0] if self.ativas else None
+
+    def proxima_apos_ordem(self, ordem: int):
+        """Primeira etapa ativa com ordem estritamente maior."""
+        indice = bisect_right(self._ordens, ordem)
+        return self.ativas[indice] if indice < len(self.ativas) else None
+
+    def anterior_a_ordem(self, ordem: int):
+        """Última etapa ativa com ordem estritamente menor."""
+        indice = bisect_left(self._ordens, ordem)
+        return self.ativas[indice - 1] if indice > 0 else None
+
+    def proxima(self, etapa):
+        if etapa is None:
+            return None
+        if etapa.id in self.proxima_por_id:
+            return self.proxima_por_id[etapa.id]
+        return self.proxima_apos_ordem(etapa.ordem)
+
+    def anterior(self, etapa):
+        if etapa is None:
+            return None
+        if etapa.id in self.anterior_por_id:
+            return self.anterior_por_id[etapa.id]
+        return self.anterior_a_ordem(etapa.ordem)
+
+
+_grafos: Dict[int, tuple] = {}
+_lock = threading.Lock()
+
+
+def _carregar_grafo(oficina_id: int) -> GrafoEtapas:
+    from core.models import Etapa
+
+    return GrafoEtapas(oficina_id, list(Etapa.objects.filter(oficina_id=oficina_id)))
+
+
+def obter_grafo_etapas(oficina) -> GrafoEtapas:
+    oficina_id = getattr(oficina, "id", oficina)
+    ttl = getattr(settings, "ETAPAS_CACHE_TTL_SEGUNDOS", 300)
+    agora = time.monotonic()
+
+    try:
+        versao = obter_versao(oficina_id, ESCOPO_ETAPAS)
+    except Exception:
+        versao = None
+
+    entrada = _grafos.get(oficina_id)
+    if entrada is not None:
+        grafo, versao_local, carregado_em = entrada
+        if versao_local == versao and agora - carregado_em < ttl:
+            return grafo
+
+    grafo = _carregar_grafo(oficina_id)
+    if lendo_da_replica():
+        # Lido da réplica pode estar atrasado: usa, mas não guarda (os
+        # caminhos de escrita, no primário, reaproveitariam o grafo velho)
+        return grafo
+    with _lock:
+        _grafos[oficina_id] = (grafo, versao, agora)
+    return grafo
+
+
+def invalidar_grafo_etapas(oficina_id: Optional[int] = None):
+    with _lock:
+        if oficina_id is None:
+            _grafos.clear()
+        else:
+            _grafos.pop(oficina_id, None)
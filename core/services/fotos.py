@@ -1,10 +1,18 @@
 import base64
 import logging
-from typing import Dict, Optional, Tuple
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Count, Max
 
+from core.metricas import registrar_bytes_foto
 from core.models import ConfigFoto, FotoOS
+from core.services.cache import ESCOPO_FOTOS, invalidar
+from core.services.etapas import obter_grafo_etapas
+from core.services.tarefas_drive import ENVIAR_FOTOS, agendar_tarefa
+from core.tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -42,12 +50,16 @@ def criar_foto_os(
         conteudo_base64 = conteudo_base64.split(",", 1)[1]
 
     try:
-        conteudo = base64.b64decode(conteudo_base64)
+        with span("foto.decodificar", tamanho_base64=len(conteudo_base64)) as span_foto:
+            conteudo = base64.b64decode(conteudo_base64)
+            span_foto.definir(bytes=len(conteudo))
     except Exception:
         message = "[SYNC] Foto ignorada: base64 inválido."
         logger.warning(message, extra=extra_log)
         return None, message
 
+    registrar_bytes_foto(len(conteudo), "sync")
+
     extensao = (foto.get("extensao") or "").lower().strip().lstrip(".")
     if not extensao and header:
         if "image/png" in header:
@@ -98,18 +110,162 @@ def criar_foto_os(
             return None, message
 
     try:
-        foto_obj = FotoOS.objects.create(
-            os=os_obj,
-            etapa=etapa,
-            tipo=tipo,
-            config_foto=config_foto_obj,
-            arquivo=arquivo,
-            titulo=foto.get("nome") or None,
-            tirada_por=usuario_oficina,
-        )
+        with span("foto.salvar", tipo=tipo):
+            foto_obj = FotoOS.objects.create(
+                os=os_obj,
+                etapa=etapa,
+                tipo=tipo,
+                config_foto=config_foto_obj,
+                arquivo=arquivo,
+                titulo=foto.get("nome") or None,
+                tirada_por=usuario_oficina,
+            )
     except Exception as e:
         message = f"[SYNC] Falha ao criar FotoOS: {e}"
         logger.exception(message, extra=extra_log)
         return None, message
 
     return foto_obj, None
+
+
+def montar_resumo_fotos(os_lista) -> Dict[int, List[dict]]:
+    """
+    Resumo das fotos por etapa de uma página de OS, em três consultas fixas
+    (independente do tamanho da página): total e última foto por etapa, e as
+    configs obrigatórias ainda sem foto PADRAO.
+    Retorna {os_id: [{etapa, etapa_nome, total, ultima_foto, configs_pendentes}]}.
+    """
+    os_ids = [os_obj.id for os_obj in os_lista]
+    if not os_ids:
+        return {}
+
+    contagens = defaultdict(dict)
+    for linha in (
+        FotoOS.objects.filter(os_id__in=os_ids)
+        .values("os_id", "etapa_id")
+        .annotate(total=Count("id"), ultima=Max("id"))
+        .order_by()
+    ):
+        contagens[linha["os_id"]][linha["etapa_id"]] = linha
+
+    configs_com_foto = set(
+        FotoOS.objects.filter(os_id__in=os_ids, tipo="PADRAO", config_foto__isnull=False)
+        .values_list("os_id", "config_foto_id")
+        .distinct()
+    )
+
+    obrigatorias = defaultdict(lambda: defaultdict(list))
+    for config_id, etapa_id, oficina_id in (
+        ConfigFoto.objects.filter(
+            oficina_id__in={os_obj.oficina_id for os_obj in os_lista},
+            obrigatoria=True,
+            ativa=True,
+        )
+        .order_by("ordem", "id")
+        .values_list("id", "etapa_id", "oficina_id")
+    ):
+        obrigatorias[oficina_id][etapa_id].append(config_id)
+
+    resumo = {}
+    for os_obj in os_lista:
+        grafo = obter_grafo_etapas(os_obj.oficina_id)
+        por_etapa = contagens.get(os_obj.id, {})
+        configs_oficina = obrigatorias.get(os_obj.oficina_id, {})
+
+        def ordem_etapa(etapa_id):
+            etapa = grafo.por_id.get(etapa_id)
+            return (etapa is None, getattr(etapa, "ordem", 0), etapa_id or 0)
+
+        itens = []
+        for etapa_id in sorted(set(por_etapa) | set(configs_oficina), key=ordem_etapa):
+            etapa = grafo.por_id.get(etapa_id)
+            linha = por_etapa.get(etapa_id, {})
+            itens.append(
+                {
+                    "etapa": etapa_id,
+                    "etapa_nome": getattr(etapa, "nome", None),
+                    "total": linha.get("total", 0),
+                    "ultima_foto": linha.get("ultima"),
+                    "configs_pendentes": [
+                        config_id
+                        for config_id in configs_oficina.get(etapa_id, [])
+                        if (os_obj.id, config_id) not in configs_com_foto
+                    ],
+                }
+            )
+        resumo[os_obj.id] = itens
+    return resumo
+
+
+def criar_fotos_em_lote(*, os_obj, etapa, itens, usuario_oficina=None) -> List[FotoOS]:
+    """
+    Grava os arquivos no storage (em blocos, sem carregar o lote na memória) e
+    insere as FotoOS com um único ``bulk_create``. ``itens`` são pares
+    (arquivo enviado, ConfigFoto ou None), já validados por FotoOSLoteSerializer.
+
+    ``bulk_create`` não dispara sinais: o cache de fotos é invalidado aqui.
+    """
+    fotos = []
+    try:
+        for arquivo, config_foto in itens:
+            foto = FotoOS(
+                os=os_obj,
+                etapa=etapa,
+                tipo="PADRAO" if config_foto else "LIVRE",
+                config_foto=config_foto,
+                tirada_por=usuario_oficina,
+            )
+            with span("foto.salvar", tipo=foto.tipo):
+                foto.arquivo.save(arquivo.name, arquivo, save=False)
+            fotos.append(foto)
+
+        with transaction.atomic():
+            FotoOS.objects.bulk_create(fotos)
+    except Exception:
+        # Sem as linhas no banco os arquivos já gravados ficariam órfãos
+        for foto in fotos:
+            foto.arquivo.delete(save=False)
+        raise
+
+    for arquivo, _ in itens:
+        registrar_bytes_foto(arquivo.size, "upload")
+
+    invalidar(os_obj.oficina_id, ESCOPO_FOTOS)
+    transaction.on_commit(lambda: invalidar(os_obj.oficina_id, ESCOPO_FOTOS))
+    return fotos
+
+
+def enviar_fotos_drive(foto_ids: List[int]) -> int:
+    """Envia ao Drive, de uma vez, as fotos de um lote. Retorna quantas subiram."""
+    from asgiref.sync import async_to_sync
+
+    from core.drive_async import enviar_fotos_drive_async
+
+    fotos = list(
+        FotoOS.objects.select_related("os", "etapa")
+        .filter(id__in=foto_ids, drive_file_id__isnull=True, etapa__isnull=False)
+        .order_by("id")
+    )
+    if not fotos:
+        return 0
+
+    file_ids = async_to_sync(enviar_fotos_drive_async)(fotos)
+    enviados = sum(1 for file_id in file_ids if file_id)
+    if enviados < len(fotos):
+        logger.warning(
+            "Fotos do lote sem upload no Drive",
+            extra={"os_id": fotos[0].os_id, "pendentes": len(fotos) - enviados},
+        )
+    return enviados
+
+
+def enfileirar_envio_drive(foto_ids: List[int], oficina_id: int):
+    """
+    Agenda (TarefaDrive) o envio ao Drive das fotos do lote, feito depois do
+    commit e fora da resposta. Fotos que não subirem continuam com
+    ``drive_file_id`` vazio.
+    """
+    foto_ids = list(foto_ids)
+    if not foto_ids:
+        return
+    agendar_tarefa(ENVIAR_FOTOS, oficina_id, {"foto_ids": foto_ids})
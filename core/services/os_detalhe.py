@@ -0,0 +1,150 @@
+"""
+Detalhe agregado da OS para o painel (/api/os/<id>/detalhe-painel/).
+
+Substitui as quatro chamadas da tela (OS, timeline, observações e fotos) por
+uma só, em número fixo de consultas:
+
+1. a OS (com oficina e etapa atual) já anotada com o carimbo de versão;
+2. observações da OS (com etapa e autor);
+3. fotos da OS (com etapa, ConfigFoto e autor);
+4. status das etapas, só quando o snapshot da timeline foi invalidado.
+
+O carimbo (``versao``) sai da própria linha da OS e de agregados das fotos e
+observações, então dá para responder 304 ou servir do cache antes de montar
+qualquer coisa.
+"""
+import hashlib
+
+from django.db.models import (
+    Count,
+    IntegerField,
+    Max,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    prefetch_related_objects,
+)
+from django.db.models.functions import Coalesce
+
+from core.models import FotoOS, ObservacaoEtapaOS
+from core.serializers import FotoOSSerializer, OSSerializer
+from core.services.cache import ESCOPO_CONFIG_FOTOS, obter_ou_calcular, obter_versao
+from core.services.timeline import obter_timeline
+
+
+def _iso(valor) -> str:
+    return valor.isoformat() if valor else ""
+
+
+def _agregado(modelo, funcao, campo, output_field=None):
+    subconsulta = (
+        modelo.objects.filter(os_id=OuterRef("pk"))
+        .order_by()
+        .values("os_id")
+        .annotate(valor=funcao(campo))
+        .values("valor")
+    )
+    return Subquery(subconsulta, output_field=output_field)
+
+
+def anotar_versao_detalhe(queryset):
+    """Anota na consulta da OS os agregados que compõem o carimbo de versão."""
+    return queryset.annotate(
+        detalhe_fotos_total=Coalesce(_agregado(FotoOS, Count, "id", IntegerField()), 0),
+        detalhe_fotos_alteradas_em=_agregado(FotoOS, Max, "atualizado_em"),
+        detalhe_obs_total=Coalesce(_agregado(ObservacaoEtapaOS, Count, "id", IntegerField()), 0),
+        detalhe_obs_alteradas_em=_agregado(ObservacaoEtapaOS, Max, "atualizado_em"),
+    )
+
+
+def versao_detalhe(os_obj) -> str:
+    """
+    Carimbo de versão do detalhe de uma OS vinda de ``anotar_versao_detalhe``.
+
+    Muda quando a OS, a oficina, a timeline (status ou etapas da oficina), as
+    fotos, as observações ou as ConfigFoto mudam. Contagens cobrem exclusões.
+    """
+    partes = [
+        os_obj.pk,
+        _iso(os_obj.atualizado_em),
+        _iso(os_obj.oficina.atualizado_em),
+        os_obj.timeline_versao,
+        os_obj.detalhe_fotos_total,
+        _iso(os_obj.detalhe_fotos_alteradas_em),
+        os_obj.detalhe_obs_total,
+        _iso(os_obj.detalhe_obs_alteradas_em),
+        obter_versao(os_obj.oficina_id, ESCOPO_CONFIG_FOTOS),
+    ]
+    conteudo = "|".join(str(parte) for parte in partes)
+    return hashlib.sha256(conteudo.encode()).hexdigest()[:20]
+
+
+def agrupar_fotos_por_etapa(fotos_serializadas, fotos) -> list:
+    """Fotos agrupadas na ordem das etapas; as sem etapa ficam no fim."""
+    grupos = {}
+    for foto, dados in zip(fotos, fotos_serializadas):
+        etapa = foto.etapa
+        grupo = grupos.get(foto.etapa_id)
+        if grupo is None:
+            grupo = grupos[foto.etapa_id] = {
+                "etapa": foto.etapa_id,
+                "etapa_nome": etapa.nome if etapa else None,
+                "ordem": etapa.ordem if etapa else None,
+                "fotos": [],
+            }
+        grupo["fotos"].append(
+            {**dados, "thumb_url": dados.get("drive_thumb_url") or dados.get("arquivo")}
+        )
+
+    return sorted(
+        grupos.values(),
+        key=lambda g: (g["etapa"] is None, g["ordem"] or 0, g["etapa"] or 0),
+    )
+
+
+def _montar(os_obj, request) -> dict:
+    prefetch_related_objects(
+        [os_obj],
+        Prefetch(
+            "observacoes_etapas",
+            queryset=ObservacaoEtapaOS.objects.select_related("etapa", "criado_por__user").order_by(
+                "etapa__ordem", "etapa_id"
+            ),
+        ),
+        Prefetch(
+            "fotos",
+            queryset=FotoOS.objects.select_related("etapa", "config_foto", "tirada_por__user").order_by(
+                "etapa__ordem", "tirada_em", "id"
+            ),
+        ),
+    )
+
+    context = {"request": request}
+    dados_os = OSSerializer(os_obj, context=context).data
+    fotos = list(os_obj.fotos.all())
+
+    return {
+        "os": dados_os,
+        "timeline": obter_timeline(os_obj),
+        "observacoes": dados_os["observacoes_etapas"],
+        "fotos_total": len(fotos),
+        "fotos_por_etapa": agrupar_fotos_por_etapa(
+            FotoOSSerializer(fotos, many=True, context=context).data, fotos
+        ),
+    }
+
+
+def montar_detalhe_painel(os_obj, request, versao: str) -> dict:
+    """
+    Detalhe agregado da OS, em cache pela ``versao`` (ver ``versao_detalhe``).
+    As URLs de arquivo são absolutas, por isso a origem entra na chave.
+    """
+    return obter_ou_calcular(
+        os_obj.oficina_id,
+        (),
+        "os_detalhe_painel",
+        lambda: _montar(os_obj, request),
+        os_obj.pk,
+        versao,
+        request.build_absolute_uri("/"),
+    )
@@ -0,0 +1,213 @@
+import hashlib
+import json
+from datetime import timedelta
+from typing import List, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from core.models import ConfigFoto, Etapa, FotoOS, OS, RegistroExcluido
+from core.serializers import (
+    ConfigFotoSerializer,
+    EtapaSerializer,
+    OficinaSerializer,
+    PwaVeiculoEmProducaoSerializer,
+)
+from core.services.cache import (
+    ESCOPO_CONFIG_FOTOS,
+    ESCOPO_ETAPAS,
+    ESCOPO_FOTOS,
+    ESCOPO_OS,
+    obter_ou_calcular,
+)
+from core.services.etapas import obter_grafo_etapas
+from core.utils import get_oficina_do_usuario, get_papel_do_usuario
+
+
+def limite_retencao_excluidos():
+    """Cursor mais antigo que ainda tem todos os tombstones no banco."""
+    return timezone.now() - timedelta(days=getattr(settings, "PWA_EXCLUIDOS_RETENCAO_DIAS", 30))
+
+
+def limpar_registros_excluidos(oficina=None, lote: int = 5000, dry_run: bool = False) -> int:
+    """
+    Apaga os RegistroExcluido mais velhos que PWA_EXCLUIDOS_RETENCAO_DIAS, em
+    lotes para não segurar a tabela numa transação longa.
+    """
+    qs = RegistroExcluido.objects.filter(excluido_em__lt=limite_retencao_excluidos())
+    if oficina is not None:
+        qs = qs.filter(oficina=oficina)
+    if dry_run:
+        return qs.count()
+
+    total = 0
+    while True:
+        ids = list(qs.order_by("id").values_list("id", flat=True)[:lote])
+        if not ids:
+            return total
+        total += RegistroExcluido.objects.filter(id__in=ids).delete()[0]
+
+
+def montar_dados_usuario(user, token=None) -> dict:
+    """Payload do /api/auth/me/."""
+    payload = {
+        "id": user.id,
+        "username": user.username,
+        "full_name": user.get_full_name() or user.username,
+    }
+
+    oficina = get_oficina_do_usuario(user)
+    if oficina is not None:
+        payload["oficina_id"] = oficina.id
+
+    papel = get_papel_do_usuario(user, token)
+    if papel:
+        payload["papel"] = papel
+
+    return payload
+
+
+def montar_veiculos_em_producao(user) -> List[dict]:
+    """
+    Lista do /api/pwa/veiculos-em-producao/ para o usuário. O resultado é o
+    mesmo para todos os usuários da oficina e fica no cache compartilhado.
+    """
+    if user.is_superuser:
+        oficina_id = None
+    else:
+        oficina = get_oficina_do_usuario(user)
+        if oficina is None:
+            return []
+        oficina_id = oficina.id
+
+    return obter_ou_calcular(
+        oficina_id,
+        (ESCOPO_OS, ESCOPO_ETAPAS, ESCOPO_CONFIG_FOTOS, ESCOPO_FOTOS),
+        "veiculos_em_producao",
+        lambda: _calcular_veiculos_em_producao(oficina_id),
+    )
+
+
+def _calcular_veiculos_em_producao(oficina_id) -> List[dict]:
+    queryset = OS.objects.select_related("etapa_atual", "oficina").filter(aberta=True)
+    if oficina_id is not None:
+        queryset = queryset.filter(oficina_id=oficina_id)
+
+    ordens = list(queryset.order_by("-atualizado_em"))
+
+    if not ordens:
+        return []
+
+    os_ids = [os_obj.id for os_obj in ordens]
+    fotos_por_os = {}
+
+    for foto in FotoOS.objects.filter(os_id__in=os_ids).select_related("etapa"):
+        fotos_por_os.setdefault(foto.os_id, []).append(foto)
+
+    configs_cache = {}
+
+    def obter_etapa_atual(os_obj):
+        if os_obj.etapa_atual:
+            return os_obj.etapa_atual
+        return obter_grafo_etapas(os_obj.oficina_id).primeira
+
+    def obter_configs(oficina_id, etapa_id):
+        chave = (oficina_id, etapa_id)
+        if chave not in configs_cache:
+            if etapa_id is None:
+                configs_cache[chave] = []
+            else:
+                configs_cache[chave] = list(
+                    ConfigFoto.objects.filter(
+                        oficina_id=oficina_id,
+                        etapa_id=etapa_id,
+                        obrigatoria=True,
+                        ativa=True,
+                    ).values_list("id", flat=True)
+                )
+        return configs_cache[chave]
+
+    def build_drive_thumb(drive_file_id):
+        if not drive_file_id:
+            return None
+        return f"https://drive.google.com/thumbnail?id={drive_file_id}&sz=w800"
+
+    resposta = []
+
+    for os_obj in ordens:
+        etapa = obter_etapa_atual(os_obj)
+        etapa_id = etapa.id if etapa else None
+        config_ids = obter_configs(os_obj.oficina_id, etapa_id)
+        fotos_da_os = fotos_por_os.get(os_obj.id, [])
+
+        configs_atendidos = {
+            foto.config_foto_id
+            for foto in fotos_da_os
+            if foto.config_foto_id in config_ids
+        }
+        faltantes = max(len(config_ids) - len(configs_atendidos), 0)
+
+        thumb_url = None
+        if etapa_id is not None:
+            fotos_na_etapa = [f for f in fotos_da_os if f.etapa_id == etapa_id]
+            if fotos_na_etapa:
+                ultima_foto = max(fotos_na_etapa, key=lambda f: (f.tirada_em, f.id))
+                thumb_url = build_drive_thumb(ultima_foto.drive_file_id)
+
+        resposta.append(
+            {
+                "os_id": os_obj.id,
+                "codigo": os_obj.codigo,
+                "placa": os_obj.placa,
+                "modelo_veiculo": os_obj.modelo_veiculo,
+                "etapa_atual": {
+                    "id": etapa_id,
+                    "nome": etapa.nome if etapa else None,
+                },
+                "faltam_fotos_obrigatorias": faltantes,
+                "thumb_url": thumb_url,
+            }
+        )
+
+    serializer = PwaVeiculoEmProducaoSerializer(data=resposta, many=True)
+    serializer.is_valid(raise_exception=True)
+    return [dict(item) for item in serializer.data]
+
+
+def montar_bootstrap(request) -> Tuple[dict, str]:
+    """
+    Pacote de inicialização do PWA: usuário, oficina, etapas ativas,
+    ConfigFoto ativas e veículos em produção.
+
+    Retorna (bundle, versao); a versão é o hash do conteúdo e muda sempre que
+    qualquer parte do pacote muda.
+    """
+    user = request.user
+    oficina = get_oficina_do_usuario(user)
+
+    etapas = Etapa.objects.select_related("oficina").filter(ativa=True)
+    configs = ConfigFoto.objects.select_related("oficina", "etapa").filter(ativa=True)
+    if oficina is not None:
+        etapas = etapas.filter(oficina=oficina)
+        configs = configs.filter(oficina=oficina)
+    elif not user.is_superuser:
+        etapas = etapas.none()
+        configs = configs.none()
+
+    context = {"request": request}
+    bundle = {
+        "usuario": montar_dados_usuario(user, getattr(request, "auth", None)),
+        "oficina": OficinaSerializer(oficina, context=context).data if oficina else None,
+        "etapas": EtapaSerializer(
+            etapas.order_by("ordem", "id"), many=True, context=context
+        ).data,
+        "config_fotos": ConfigFotoSerializer(
+            configs.order_by("etapa__ordem", "ordem", "id"), many=True, context=context
+        ).data,
+        "veiculos_em_producao": montar_veiculos_em_producao(user),
+    }
+
+    conteudo = json.dumps(bundle, sort_keys=True, cls=DjangoJSONEncoder)
+    versao = hashlib.sha256(conteudo.encode()).hexdigest()[:20]
+    return bundle, versao
@@ -1,11 +1,16 @@
 import hashlib
 import logging
-from typing import List, Optional, Tuple
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, List, Optional, Tuple
 
-from django.db import transaction
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
 from django.utils import timezone
 from rest_framework import serializers
 
+from core.metricas import SYNC_FOTOS, SYNC_ITENS
 from core.models import Etapa, FotoOS, OS, Oficina, UsuarioOficina
 from core.serializers import (
     OSSerializer,
@@ -13,7 +18,9 @@ from core.serializers import (
     SyncOSPayloadSerializer,
     SyncRequestSerializer,
 )
+from core.services.etapas import obter_grafo_etapas
 from core.services.fotos import criar_foto_os
+from core.tracing import span
 from core.utils import get_oficina_do_usuario
 from core.drive_service import criar_pasta_os, upload_foto_para_drive
 
@@ -21,10 +28,21 @@ logger = logging.getLogger("core.views")
 
 
 class SyncService:
-    def __init__(self, user, request=None):
+    def __init__(
+        self,
+        user,
+        request=None,
+        tamanho_lote: Optional[int] = None,
+        oficina: Optional[Oficina] = None,
+    ):
         self.user = user
         self.request = request
-        self.oficina = self._definir_oficina()
+        if tamanho_lote is None:
+            tamanho_lote = getattr(settings, "SYNC_TAMANHO_LOTE", 1)
+        self.tamanho_lote = max(int(tamanho_lote or 1), 1)
+        self.oficina = oficina or self._definir_oficina()
+        # Fotos (e seus arquivos no storage) gravadas e ainda não commitadas
+        self._fotos_gravadas: List[FotoOS] = []
 
     def _definir_oficina(self) -> Optional[Oficina]:
         oficina = get_oficina_do_usuario(self.user)
@@ -32,7 +50,11 @@ class SyncService:
             oficina = Oficina.objects.first()
         return oficina
 
-    def processar(self, payload: dict) -> Tuple[List[dict], Optional[dict]]:
+    def processar(
+        self,
+        payload: dict,
+        progresso: Optional[Callable[[List[dict]], None]] = None,
+    ) -> Tuple[List[dict], Optional[dict]]:
         if not self.oficina:
             return [], {
                 "detail": "Usuário não está vinculado a nenhuma oficina ativa e nenhuma oficina padrão foi encontrada.",
@@ -42,15 +64,102 @@ class SyncService:
         serializer.is_valid(raise_exception=True)
         itens = serializer.validated_data.get("osPendentes", [])
 
-        resultados = []
-        for item in itens:
-            resultado = self._processar_item(item)
-            resultados.append(resultado)
+        with span(
+            "sync.processar",
+            oficina_id=self.oficina.id,
+            itens=len(itens),
+            tamanho_lote=self.tamanho_lote,
+        ):
+            if self.tamanho_lote <= 1:
+                resultados = []
+                for item in itens:
+                    resultado = self._processar_item_isolado(item)
+                    self._fotos_gravadas.clear()
+                    resultados.append(resultado)
+                    if progresso:
+                        progresso(resultados)
+            else:
+                resultados = self._processar_em_lotes(itens, progresso)
+
+        for resultado in resultados:
+            SYNC_ITENS.labels(status=resultado.get("status") or "desconhecido").inc()
 
         return resultados, None
 
+    def _processar_em_lotes(
+        self,
+        itens: List[dict],
+        progresso: Optional[Callable[[List[dict]], None]] = None,
+    ) -> List[dict]:
+        """
+        Agrupa ``tamanho_lote`` itens por transação. O ``atomic`` de cada item
+        vira um savepoint dentro do lote: um item que falha volta apenas ao
+        próprio savepoint e os demais seguem para o mesmo commit. As chamadas
+        ao Drive dos itens e o ``progresso`` só saem depois do commit do lote.
+        """
+        resultados = []
+        for inicio in range(0, len(itens), self.tamanho_lote):
+            lote = itens[inicio:inicio + self.tamanho_lote]
+            with self._removendo_arquivos_se_falhar(), transaction.atomic():
+                for item in lote:
+                    resultados.append(self._processar_item_isolado(item))
+            self._fotos_gravadas.clear()
+            # Fora da transação do lote: o progresso só conta itens já
+            # commitados e fica visível para quem consulta o job
+            if progresso:
+                progresso(resultados)
+
+        return resultados
+
+    @contextmanager
+    def _removendo_arquivos_se_falhar(self):
+        """
+        O rollback não alcança o storage: apaga os arquivos de foto gravados
+        dentro do bloco (item ou lote) que falhou.
+        """
+        inicio = len(self._fotos_gravadas)
+        try:
+            yield
+        except Exception:
+            for foto in self._fotos_gravadas[inicio:]:
+                try:
+                    default_storage.delete(foto.arquivo.name)
+                except Exception:
+                    logger.warning("[SYNC] Falha ao remover arquivo de item revertido", exc_info=True)
+            del self._fotos_gravadas[inicio:]
+            raise
+
+    def _processar_item_isolado(self, item: dict) -> dict:
+        """
+        Erro de banco num item vira resultado ``error`` do próprio item, com ou
+        sem lote: a transação (ou savepoint) do item já foi desfeita e os
+        demais itens seguem.
+        """
+        try:
+            return self._processar_item(item)
+        except DatabaseError as exc:
+            local_id = item.get("local_id") or item.get("id")
+            logger.warning(
+                "[SYNC] Item revertido",
+                exc_info=True,
+                extra={"oficina_id": self.oficina.id, "local_id": local_id},
+            )
+            return {
+                "local_id": local_id,
+                "status": "error",
+                "os_id": None,
+                "errors": {"detail": str(exc)},
+                "photo_errors": [],
+            }
+
     def _processar_item(self, item: dict) -> dict:
         local_id = item.get("local_id") or item.get("id")
+        with span("sync.item", local_id=local_id) as span_item:
+            resultado = self._executar_item(item, local_id)
+            span_item.definir(status=resultado["status"], os_id=resultado["os_id"])
+        return resultado
+
+    def _executar_item(self, item: dict, local_id) -> dict:
         try:
             os_payload = self._converter_payload_pwa(item)
         except serializers.ValidationError as exc:
@@ -66,8 +175,9 @@ class SyncService:
         photo_errors: List[str] = []
         status_item = "created"
 
-        with transaction.atomic():
-            os_obj, status_item, errors = self._salvar_os(os_payload)
+        with self._removendo_arquivos_se_falhar(), transaction.atomic():
+            with span("sync.salvar_os", codigo=os_payload.get("codigo")):
+                os_obj, status_item, errors = self._salvar_os(os_payload)
             if errors:
                 return {
                     "local_id": local_id,
@@ -77,7 +187,20 @@ class SyncService:
                     "photo_errors": [],
                 }
 
-            photo_errors = self._salvar_fotos(os_obj, item)
+            inicio = len(self._fotos_gravadas)
+            with span("sync.salvar_fotos", os_id=os_obj.id):
+                photo_errors = self._salvar_fotos(os_obj, item)
+            fotos_do_item = self._fotos_gravadas[inicio:]
+
+            if self.tamanho_lote > 1:
+                # Em lote, Drive só depois do commit: sem segurar os locks do
+                # lote durante a rede e sem subir nada de um item desfeito.
+                # Falhas ficam só no log.
+                transaction.on_commit(partial(self._enviar_para_drive, os_obj, fotos_do_item))
+
+        if self.tamanho_lote <= 1:
+            # Sem lote o item já foi gravado: falhas do Drive vão para o resultado
+            photo_errors.extend(self._enviar_para_drive(os_obj, fotos_do_item))
 
         return {
             "local_id": local_id,
@@ -163,6 +286,15 @@ class SyncService:
             os_obj = serializer.save(oficina=self.oficina)
             status_item = "created"
 
+        return os_obj, status_item, None
+
+    def _enviar_para_drive(self, os_obj: OS, fotos: List[FotoOS]) -> List[str]:
+        """
+        Pasta da OS e fotos do item no Drive, depois de gravado o item.
+        Devolve as mensagens das fotos que falharam (que ficam sem
+        drive_file_id).
+        """
+        photo_errors: List[str] = []
         try:
             criar_pasta_os(os_obj)
         except Exception:
@@ -173,7 +305,18 @@ class SyncService:
                 extra={"oficina_id": self.oficina.id, "os_id": os_obj.id},
             )
 
-        return os_obj, status_item, None
+        for foto_obj in fotos:
+            try:
+                upload_foto_para_drive(foto_obj)
+            except Exception as e:
+                message = f"[SYNC] Erro ao enviar foto {foto_obj.id} para o Drive: {e}"
+                logger.warning(
+                    message,
+                    exc_info=True,
+                    extra={"oficina_id": os_obj.oficina_id, "os_id": os_obj.id, "foto_id": foto_obj.id},
+                )
+                photo_errors.append(message)
+        return photo_errors
 
     def _resolver_etapa_para_payload(
         self, payload: dict, os_existente: Optional[OS]
@@ -181,8 +324,13 @@ class SyncService:
         etapa_valor = payload.get("etapa_atual")
         etapa_id = getattr(etapa_valor, "id", etapa_valor)
 
+        grafo = obter_grafo_etapas(self.oficina.id)
+
         if etapa_id is not None:
-            etapa_obj = Etapa.objects.filter(id=etapa_id, oficina=self.oficina).first()
+            try:
+                etapa_obj = grafo.por_id.get(int(etapa_id))
+            except (TypeError, ValueError):
+                etapa_obj = None
             if not etapa_obj:
                 return None, {"etapa_atual": ["Etapa não encontrada para esta oficina."]}
 
@@ -191,11 +339,7 @@ class SyncService:
         if os_existente and os_existente.etapa_atual_id:
             return os_existente.etapa_atual, None
 
-        etapa_checkin = (
-            Etapa.objects.filter(oficina=self.oficina, is_checkin=True, ativa=True)
-            .order_by("ordem", "id")
-            .first()
-        )
+        etapa_checkin = grafo.checkin
 
         if etapa_checkin:
             logger.info(
@@ -219,11 +363,7 @@ class SyncService:
 
         etapa = os_obj.etapa_atual
         if etapa is None:
-            etapa = (
-                Etapa.objects.filter(oficina=os_obj.oficina, is_checkin=True, ativa=True)
-                .order_by("ordem", "id")
-                .first()
-            )
+            etapa = obter_grafo_etapas(os_obj.oficina_id).checkin
         if etapa is None:
             message = "[SYNC] OS sem etapa para associar fotos. Fotos ignoradas."
             logger.warning(
@@ -270,27 +410,16 @@ class SyncService:
             )
 
             if error_message:
+                SYNC_FOTOS.labels(resultado="erro").inc()
                 photo_errors.append(error_message)
                 continue
 
+            SYNC_FOTOS.labels(resultado="ok").inc()
+            self._fotos_gravadas.append(foto_obj)
+
             if assinatura:
                 assinaturas_existentes.add(assinatura)
 
-            try:
-                upload_foto_para_drive(foto_obj)
-            except Exception as e:
-                message = f"[SYNC] Erro ao enviar foto {foto_obj.id} para o Drive: {e}"
-                logger.warning(
-                    message,
-                    extra={
-                        "user_id": self.user.id,
-                        "oficina_id": os_obj.oficina_id,
-                        "os_codigo": os_obj.codigo,
-                        "foto_idx": idx,
-                    },
-                )
-                photo_errors.append(message)
-
         return photo_errors
 
     def _assinatura_foto_payload(self, foto: dict) -> Optional[Tuple[str, str]]:
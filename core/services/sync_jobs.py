@@ -0,0 +1,134 @@
+import logging
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import SyncJob
+from core.serializers import SyncRequestSerializer
+from core.services.sync import SyncService
+from core.tracing import span
+
+logger = logging.getLogger("core.views")
+
+
+def criar_sync_job(user, payload: dict) -> Tuple[Optional[SyncJob], Optional[dict]]:
+    """
+    Valida e persiste o payload do /api/sync/ para processamento em background.
+
+    Retorna (job, erro) no mesmo formato do SyncService.processar: erro é o
+    corpo do 400 quando o usuário não tem oficina.
+    """
+    service = SyncService(user)
+    if not service.oficina:
+        return None, {
+            "detail": "Usuário não está vinculado a nenhuma oficina ativa e nenhuma oficina padrão foi encontrada.",
+        }
+
+    serializer = SyncRequestSerializer(data=payload)
+    serializer.is_valid(raise_exception=True)
+
+    job = SyncJob.objects.create(
+        oficina=service.oficina,
+        user=user,
+        payload=payload,
+        total_itens=len(serializer.validated_data.get("osPendentes", [])),
+    )
+    logger.info(
+        "[SYNC] job enfileirado",
+        extra={"oficina_id": service.oficina.id, "job_id": job.id, "total_itens": job.total_itens},
+    )
+    return job, None
+
+
+def encerrar_jobs_abandonados() -> int:
+    """
+    Passa para ERRO os jobs em PROCESSANDO sem progresso há mais de
+    ``SYNC_JOB_TIMEOUT_SEGUNDOS`` (o worker caiu ou foi morto no meio). Não
+    são reenfileirados: um job que derruba o worker derrubaria o próximo; o
+    PWA mantém os itens pendentes e reenvia.
+    """
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "SYNC_JOB_TIMEOUT_SEGUNDOS", 900))
+    agora = timezone.now()
+    encerrados = SyncJob.objects.filter(status="PROCESSANDO", atualizado_em__lt=limite).update(
+        status="ERRO",
+        erro="Processamento interrompido (worker encerrado). Envie a sincronização novamente.",
+        finalizado_em=agora,
+        atualizado_em=agora,
+    )
+    if encerrados:
+        logger.warning("[SYNC] jobs abandonados encerrados", extra={"total": encerrados})
+    return encerrados
+
+
+def reservar_proximo_job() -> Optional[SyncJob]:
+    """
+    Marca o job pendente mais antigo como PROCESSANDO.
+    ``skip_locked`` permite vários workers concorrentes no PostgreSQL.
+    """
+    with transaction.atomic():
+        job = (
+            SyncJob.objects.select_for_update(skip_locked=True)
+            .filter(status="PENDENTE")
+            .order_by("criado_em", "id")
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = "PROCESSANDO"
+        job.iniciado_em = timezone.now()
+        job.save(update_fields=["status", "iniciado_em", "atualizado_em"])
+
+    return job
+
+
+def executar_sync_job(job: SyncJob) -> SyncJob:
+    extra_log = {"oficina_id": job.oficina_id, "job_id": job.id}
+
+    # Chamado depois de cada item (ou lote) commitado: os resultados parciais
+    # ficam no job mesmo que ele termine em ERRO
+    def progresso(resultados: List[dict]):
+        job.itens_processados = len(resultados)
+        job.resultados = list(resultados)
+        job.save(update_fields=["itens_processados", "resultados", "atualizado_em"])
+
+    try:
+        with span("sync.job", job_id=job.id, oficina_id=job.oficina_id):
+            # A oficina do job, não a atual do usuário (o vínculo pode ter mudado)
+            resultados, erro = SyncService(job.user, oficina=job.oficina).processar(
+                job.payload, progresso=progresso
+            )
+    except Exception as exc:
+        logger.exception("[SYNC] job falhou", extra=extra_log)
+        job.status = "ERRO"
+        job.erro = str(exc)
+    else:
+        if erro:
+            job.status = "ERRO"
+            job.erro = erro.get("detail")
+        else:
+            job.status = "CONCLUIDO"
+            job.resultados = resultados
+            job.itens_processados = len(resultados)
+            # As fotos em base64 já foram gravadas; não há por que manter o payload.
+            job.payload = {}
+
+    job.finalizado_em = timezone.now()
+    job.save()
+    logger.info("[SYNC] job finalizado", extra={**extra_log, "status": job.status})
+    return job
+
+
+def processar_sync_jobs_pendentes(limite: Optional[int] = None) -> int:
+    encerrar_jobs_abandonados()
+    processados = 0
+    while limite is None or processados < limite:
+        job = reservar_proximo_job()
+        if job is None:
+            break
+        executar_sync_job(job)
+        processados += 1
+    return processados
@@ -0,0 +1,148 @@
+"""
+Tarefas de fundo do Drive persistidas em TarefaDrive.
+
+Envio das fotos de um upload em lote, restauração dos arquivos de uma OS
+reidratada e renomeação das subpastas de etapa saem da requisição. A tarefa é
+gravada na transação que a originou e uma thread a executa logo após o commit;
+se o worker reiniciar antes ou durante, ``manage.py processar_tarefas_drive``
+retoma o que ficou para trás. As três são idempotentes (fotos já enviadas,
+arquivos já no disco e nomes já certos são ignorados), então repetir uma
+tarefa interrompida é seguro.
+"""
+import logging
+import threading
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.models import OS, TarefaDrive
+
+logger = logging.getLogger(__name__)
+
+ENVIAR_FOTOS = "ENVIAR_FOTOS"
+RESTAURAR_ARQUIVOS = "RESTAURAR_ARQUIVOS"
+RENOMEAR_PASTAS = "RENOMEAR_PASTAS"
+
+
+def agendar_tarefa(tipo: str, oficina_id: int, parametros: dict) -> TarefaDrive:
+    """Grava a tarefa e agenda a execução numa thread depois do commit."""
+    tarefa = TarefaDrive.objects.create(oficina_id=oficina_id, tipo=tipo, parametros=parametros)
+    transaction.on_commit(
+        lambda: threading.Thread(target=_executar_em_thread, args=(tarefa.id,), daemon=True).start()
+    )
+    return tarefa
+
+
+def agendar_renomeacao(oficina_id: int, etapa_id: int) -> TarefaDrive:
+    """
+    Junta a etapa à renomeação da oficina que ainda não começou (ex.: várias
+    etapas reordenadas na mesma transação) ou cria uma nova.
+    """
+    with transaction.atomic():
+        tarefa = (
+            TarefaDrive.objects.select_for_update()
+            .filter(oficina_id=oficina_id, tipo=RENOMEAR_PASTAS, status="PENDENTE")
+            .order_by("id")
+            .first()
+        )
+        if tarefa is None:
+            return agendar_tarefa(RENOMEAR_PASTAS, oficina_id, {"etapa_ids": [etapa_id]})
+
+        etapa_ids = set(tarefa.parametros.get("etapa_ids", []))
+        if etapa_id not in etapa_ids:
+            tarefa.parametros = {"etapa_ids": sorted(etapa_ids | {etapa_id})}
+            tarefa.save(update_fields=["parametros", "atualizado_em"])
+        return tarefa
+
+
+def _filtro_retomaveis(agora) -> Q:
+    """
+    PENDENTE que a thread não pegou, PROCESSANDO abandonada e ERRO com
+    tentativas restantes (com o mesmo atraso entre tentativas).
+    """
+    atraso = timedelta(seconds=getattr(settings, "TAREFAS_DRIVE_ATRASO_SEGUNDOS", 120))
+    timeout = timedelta(seconds=getattr(settings, "TAREFAS_DRIVE_TIMEOUT_SEGUNDOS", 900))
+    max_tentativas = getattr(settings, "TAREFAS_DRIVE_MAX_TENTATIVAS", 5)
+    return (
+        Q(status="PENDENTE", criado_em__lt=agora - atraso)
+        | Q(status="PROCESSANDO", atualizado_em__lt=agora - timeout)
+        | Q(status="ERRO", tentativas__lt=max_tentativas, atualizado_em__lt=agora - atraso)
+    )
+
+
+def _reservar(tarefa_id: int, filtro: Q) -> Optional[TarefaDrive]:
+    """Passa a tarefa para PROCESSANDO com um UPDATE condicional: só um worker fica com ela."""
+    reservadas = TarefaDrive.objects.filter(filtro, pk=tarefa_id).update(
+        status="PROCESSANDO", tentativas=F("tentativas") + 1, atualizado_em=timezone.now()
+    )
+    if not reservadas:
+        return None
+    return TarefaDrive.objects.get(pk=tarefa_id)
+
+
+def _executar(tarefa: TarefaDrive):
+    from core.services.arquivamento import restaurar_arquivos_locais
+    from core.services.drive_pastas import renomear_pastas_etapas
+    from core.services.fotos import enviar_fotos_drive
+
+    parametros = tarefa.parametros
+    if tarefa.tipo == ENVIAR_FOTOS:
+        enviar_fotos_drive(parametros["foto_ids"])
+    elif tarefa.tipo == RESTAURAR_ARQUIVOS:
+        os_obj = OS.objects.select_related("oficina").filter(pk=parametros["os_id"]).first()
+        if os_obj is not None:
+            restaurar_arquivos_locais(os_obj)
+    elif tarefa.tipo == RENOMEAR_PASTAS:
+        renomear_pastas_etapas(tarefa.oficina_id, parametros["etapa_ids"])
+    else:
+        raise ValueError(f"Tipo de tarefa do Drive desconhecido: {tarefa.tipo}")
+
+
+def executar_tarefa(tarefa_id: int, *, retomando: bool = False) -> bool:
+    """Executa a tarefa se conseguir reservá-la. Retorna se executou."""
+    filtro = Q(status="PENDENTE")
+    if retomando:
+        filtro = _filtro_retomaveis(timezone.now())
+    tarefa = _reservar(tarefa_id, filtro)
+    if tarefa is None:
+        return False
+
+    extra_log = {"oficina_id": tarefa.oficina_id, "tarefa_id": tarefa.id, "tipo": tarefa.tipo}
+    try:
+        _executar(tarefa)
+    except Exception as exc:
+        logger.exception("Tarefa do Drive falhou", extra=extra_log)
+        tarefa.status = "ERRO"
+        tarefa.erro = str(exc)
+    else:
+        tarefa.status = "CONCLUIDA"
+        tarefa.erro = None
+    tarefa.finalizado_em = timezone.now()
+    tarefa.save(update_fields=["status", "erro", "finalizado_em", "atualizado_em"])
+    return True
+
+
+def _executar_em_thread(tarefa_id: int):
+    try:
+        executar_tarefa(tarefa_id)
+    except Exception:
+        logger.exception("Erro ao executar tarefa do Drive", extra={"tarefa_id": tarefa_id})
+    finally:
+        connections.close_all()
+
+
+def processar_tarefas_pendentes(limite: Optional[int] = None) -> int:
+    """Executa as tarefas que as threads pós-commit não concluíram."""
+    ids = TarefaDrive.objects.filter(_filtro_retomaveis(timezone.now())).order_by("criado_em", "id")
+    if limite is not None:
+        ids = ids[:limite]
+
+    processadas = 0
+    for tarefa_id in list(ids.values_list("id", flat=True)):
+        if executar_tarefa(tarefa_id, retomando=True):
+            processadas += 1
+    return processadas
@@ -0,0 +1,162 @@
+"""
+Timeline materializada da OS (etapas ativas da oficina x OSEtapaStatus).
+
+O snapshot fica em ``OS.timeline_snapshot`` e só é recalculado depois de
+invalidado pelos sinais (OSEtapaStatus da OS, etapas da oficina). ``is_atual``
+não faz parte do snapshot: sai de ``etapa_atual_id`` na leitura, então avançar
+a OS não exige recálculo.
+
+``timeline_versao`` evita gravar um snapshot velho: o recálculo só grava se
+nenhuma invalidação aconteceu enquanto ele lia o banco.
+
+Na lista (``?incluir=timeline``) os snapshots invalidados da página são
+calculados juntos (uma consulta de OSEtapaStatus) e regravados depois da
+resposta, numa thread no primário: a listagem não escreve, então não fixa o
+cliente no primário nem faz um UPDATE por OS.
+"""
+import logging
+import threading
+from functools import reduce
+from operator import or_
+
+from django.db import connections, transaction
+from django.db.models import Case, F, Q, Value, When
+from rest_framework import serializers
+
+from core.db_router import lendo_da_replica
+from core.services.etapas import obter_grafo_etapas
+
+_CAMPO_DATA = serializers.DateTimeField()
+
+
+logger = logging.getLogger(__name__)
+
+
+def calcular_timelines(os_lista) -> dict:
+    """Timeline de cada OS da lista ({os_id: timeline}), com uma consulta de OSEtapaStatus."""
+    from core.models import OSEtapaStatus
+
+    if not os_lista:
+        return {}
+
+    etapas_por_oficina = {
+        oficina_id: obter_grafo_etapas(oficina_id).ativas
+        for oficina_id in {os_obj.oficina_id for os_obj in os_lista}
+    }
+    etapa_ids = {etapa.id for etapas in etapas_por_oficina.values() for etapa in etapas}
+
+    concluidas = {}
+    for os_id, etapa_id, concluida_em in OSEtapaStatus.objects.filter(
+        os_id__in=[os_obj.pk for os_obj in os_lista], etapa_id__in=etapa_ids
+    ).values_list("os_id", "etapa_id", "concluida_em"):
+        concluidas[(os_id, etapa_id)] = concluida_em
+
+    timelines = {}
+    for os_obj in os_lista:
+        timeline = []
+        for etapa in etapas_por_oficina[os_obj.oficina_id]:
+            concluida_em = concluidas.get((os_obj.pk, etapa.id))
+            timeline.append(
+                {
+                    "etapa": etapa.id,
+                    "etapa_nome": etapa.nome,
+                    "ordem": etapa.ordem,
+                    "status": "concluida" if concluida_em else "pendente",
+                    "concluida_em": _CAMPO_DATA.to_representation(concluida_em) if concluida_em else None,
+                }
+            )
+        timelines[os_obj.pk] = timeline
+    return timelines
+
+
+def calcular_timeline(os_obj) -> list:
+    return calcular_timelines([os_obj])[os_obj.pk]
+
+
+def obter_timeline(os_obj) -> list:
+    """Timeline da OS, recalculando (e gravando) o snapshot só se estiver invalidado."""
+    from core.models import OS
+
+    snapshot = os_obj.timeline_snapshot
+    if snapshot is None:
+        versao = os_obj.timeline_versao
+        snapshot = calcular_timeline(os_obj)
+        # Lido da réplica pode estar atrasado: usa, mas não grava
+        if not lendo_da_replica():
+            gravou = OS.objects.filter(pk=os_obj.pk, timeline_versao=versao).update(
+                timeline_snapshot=snapshot
+            )
+            if gravou:
+                os_obj.timeline_snapshot = snapshot
+
+    return [{**item, "is_atual": os_obj.etapa_atual_id == item["etapa"]} for item in snapshot]
+
+
+def invalidar_timeline(*, os_id=None, oficina_id=None):
+    from core.models import OS
+
+    if os_id is not None:
+        qs = OS.objects.filter(pk=os_id)
+    elif oficina_id is not None:
+        qs = OS.objects.filter(oficina_id=oficina_id)
+    else:
+        return
+    qs.update(timeline_snapshot=None, timeline_versao=F("timeline_versao") + 1)
+
+
+def _gravar_snapshots(os_lista, timelines) -> int:
+    """Um UPDATE para a lista toda; cada OS só é gravada se a versão não mudou."""
+    from core.models import OS
+
+    if not os_lista:
+        return 0
+    campo = OS._meta.get_field("timeline_snapshot")
+    return OS.objects.filter(
+        reduce(or_, (Q(pk=os_obj.pk, timeline_versao=os_obj.timeline_versao) for os_obj in os_lista))
+    ).update(
+        timeline_snapshot=Case(
+            *(When(pk=os_obj.pk, then=Value(timelines[os_obj.pk], output_field=campo)) for os_obj in os_lista),
+            output_field=campo,
+        )
+    )
+
+
+def regravar_timelines(os_ids) -> int:
+    """Recalcula no primário e grava os snapshots ainda invalidados destas OS."""
+    from core.models import OS
+
+    os_lista = list(
+        OS.objects.filter(pk__in=list(os_ids), timeline_snapshot__isnull=True).only(
+            "id", "oficina_id", "timeline_versao"
+        )
+    )
+    return _gravar_snapshots(os_lista, calcular_timelines(os_lista))
+
+
+def _regravar_em_thread(os_ids: list):
+    try:
+        regravar_timelines(os_ids)
+    except Exception:
+        logger.exception("Erro ao regravar snapshots da timeline", extra={"os_ids": os_ids})
+    finally:
+        connections.close_all()
+
+
+def preparar_timelines(os_lista):
+    """
+    Preenche em memória os snapshots invalidados de uma página de OS, para que
+    ``obter_timeline`` não consulte o banco por OS, e agenda a regravação
+    deles para depois do commit.
+    """
+    invalidadas = [os_obj for os_obj in os_lista if os_obj.timeline_snapshot is None]
+    if not invalidadas:
+        return
+
+    timelines = calcular_timelines(invalidadas)
+    for os_obj in invalidadas:
+        os_obj.timeline_snapshot = timelines[os_obj.pk]
+
+    os_ids = [os_obj.pk for os_obj in invalidadas]
+    transaction.on_commit(
+        lambda: threading.Thread(target=_regravar_em_thread, args=(os_ids,), daemon=True).start()
+    )
@@ -0,0 +1,150 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .drive_circuito import fechar_circuito
+from .models import (
+    OS,
+    ConfigFoto,
+    Etapa,
+    FotoOS,
+    Oficina,
+    OficinaDriveConfig,
+    OSEtapaStatus,
+    ObservacaoEtapaOS,
+    RegistroExcluido,
+)
+from .services.busca_os import indexar_os, remover_os_do_indice
+from .services.cache import (
+    ESCOPO_CONFIG_FOTOS,
+    ESCOPO_DRIVE,
+    ESCOPO_ETAPAS,
+    ESCOPO_FOTOS,
+    ESCOPO_OS,
+    invalidar,
+)
+from .services.drive_pastas import agendar_renomeacao_pastas_etapa
+from .services.etapas import invalidar_grafo_etapas
+from .services.timeline import invalidar_timeline
+
+
+def _exclusao_da_oficina(origin) -> bool:
+    """A exclusão vem em cascata da própria Oficina (não há a quem avisar)."""
+    if isinstance(origin, QuerySet):
+        return origin.model is Oficina
+    return isinstance(origin, Oficina)
+
+
+def _registrar_exclusao(modelo, objeto_id, oficina_id, os_id=None, origin=None):
+    # O tombstone apontaria para a oficina que está sendo apagada
+    if oficina_id is None or _exclusao_da_oficina(origin):
+        return
+    RegistroExcluido.objects.create(
+        oficina_id=oficina_id,
+        modelo=modelo,
+        objeto_id=objeto_id,
+        os_id_original=os_id,
+    )
+
+
+@receiver(post_delete, sender=OS, dispatch_uid="core_tombstone_os")
+def registrar_exclusao_os(sender, instance, **kwargs):
+    _registrar_exclusao("OS", instance.pk, instance.oficina_id, instance.pk, kwargs.get("origin"))
+    remover_os_do_indice(instance.pk)
+
+
+@receiver(post_save, sender=OS, dispatch_uid="core_busca_indexar_os")
+def indexar_os_na_busca(sender, instance, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and not {"placa", "codigo", "nome_cliente"} & set(update_fields):
+        return
+    indexar_os(instance)
+
+
+@receiver(post_delete, sender=FotoOS, dispatch_uid="core_tombstone_fotoos")
+@receiver(post_delete, sender=OSEtapaStatus, dispatch_uid="core_tombstone_osetapastatus")
+@receiver(post_delete, sender=ObservacaoEtapaOS, dispatch_uid="core_tombstone_observacao")
+def registrar_exclusao_filho_os(sender, instance, **kwargs):
+    if _exclusao_da_oficina(kwargs.get("origin")):
+        return
+    # Na exclusão em cascata a OS ainda existe quando os filhos são apagados.
+    oficina_id = (
+        OS.objects.filter(pk=instance.os_id).values_list("oficina_id", flat=True).first()
+    )
+    _registrar_exclusao(sender.__name__, instance.pk, oficina_id, instance.os_id, kwargs.get("origin"))
+
+
+def _invalidar_cache(oficina_id, *escopos):
+    if oficina_id is None:
+        return
+    invalidar(oficina_id, *escopos)
+    # De novo após o commit: uma leitura no meio da transação pode ter
+    # repovoado o cache com dados que ainda não eram visíveis aos outros.
+    transaction.on_commit(lambda: invalidar(oficina_id, *escopos))
+
+
+@receiver(post_save, sender=Etapa, dispatch_uid="core_grafo_etapas_save")
+@receiver(post_delete, sender=Etapa, dispatch_uid="core_grafo_etapas_delete")
+def invalidar_grafo_por_etapa(sender, instance, **kwargs):
+    invalidar_grafo_etapas(instance.oficina_id)
+    _invalidar_cache(instance.oficina_id, ESCOPO_ETAPAS)
+    invalidar_timeline(oficina_id=instance.oficina_id)
+
+
+@receiver(pre_save, sender=Etapa, dispatch_uid="core_drive_etapa_nome_anterior")
+def guardar_nome_anterior_etapa(sender, instance, **kwargs):
+    instance._nome_anterior = None
+    if instance.pk and not kwargs.get("raw"):
+        instance._nome_anterior = (
+            Etapa.objects.filter(pk=instance.pk).values_list("nome", "ordem").first()
+        )
+
+
+@receiver(post_save, sender=Etapa, dispatch_uid="core_drive_renomear_pastas_etapa")
+def renomear_pastas_por_etapa(sender, instance, created, **kwargs):
+    # Nome da subpasta no Drive = ordem + nome da etapa
+    anterior = getattr(instance, "_nome_anterior", None)
+    if created or anterior is None or anterior == (instance.nome, instance.ordem):
+        return
+    agendar_renomeacao_pastas_etapa(instance.oficina_id, instance.pk)
+
+
+@receiver(post_save, sender=OSEtapaStatus, dispatch_uid="core_timeline_status_save")
+@receiver(post_delete, sender=OSEtapaStatus, dispatch_uid="core_timeline_status_delete")
+def invalidar_timeline_por_status(sender, instance, **kwargs):
+    invalidar_timeline(os_id=instance.os_id)
+
+
+@receiver(post_save, sender=Oficina, dispatch_uid="core_grafo_etapas_oficina_save")
+@receiver(post_delete, sender=Oficina, dispatch_uid="core_grafo_etapas_oficina_delete")
+def invalidar_grafo_por_oficina(sender, instance, **kwargs):
+    invalidar_grafo_etapas(instance.pk)
+    invalidar(instance.pk)
+
+
+@receiver(post_save, sender=OS, dispatch_uid="core_cache_os_save")
+@receiver(post_delete, sender=OS, dispatch_uid="core_cache_os_delete")
+def invalidar_cache_os(sender, instance, **kwargs):
+    _invalidar_cache(instance.oficina_id, ESCOPO_OS)
+
+
+@receiver(post_save, sender=ConfigFoto, dispatch_uid="core_cache_configfoto_save")
+@receiver(post_delete, sender=ConfigFoto, dispatch_uid="core_cache_configfoto_delete")
+def invalidar_cache_config_foto(sender, instance, **kwargs):
+    _invalidar_cache(instance.oficina_id, ESCOPO_CONFIG_FOTOS)
+
+
+@receiver(post_save, sender=FotoOS, dispatch_uid="core_cache_fotoos_save")
+@receiver(post_delete, sender=FotoOS, dispatch_uid="core_cache_fotoos_delete")
+def invalidar_cache_foto(sender, instance, **kwargs):
+    oficina_id = getattr(instance.os, "oficina_id", None) if instance.os_id else None
+    _invalidar_cache(oficina_id, ESCOPO_FOTOS)
+
+
+@receiver(post_save, sender=OficinaDriveConfig, dispatch_uid="core_cache_drive_save")
+@receiver(post_delete, sender=OficinaDriveConfig, dispatch_uid="core_cache_drive_delete")
+def invalidar_cache_drive(sender, instance, **kwargs):
+    _invalidar_cache(instance.oficina_id, ESCOPO_DRIVE)
+    # Credenciais ou pasta raiz novas: volta a tentar o Drive na hora
+    fechar_circuito(instance.oficina_id)
@@ -1,15 +1,44 @@
 import base64
+import gzip
+import json
+import os
 import shutil
 import tempfile
-from unittest import mock
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf
 
+import httpx
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import override_settings
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-from core.models import ConfigFoto, Oficina, UsuarioOficina, Etapa, FotoOS, OS
+from core import db_router
+from core.middleware import brotli
+from core.drive_async import ClienteDriveAsync, enviar_foto_drive_async, enviar_fotos_drive_async
+from core.drive_circuito import estado_circuito, permitir_chamada
+from core.drive_service import upload_foto_os_drive
+from core.models import ConfigFoto, Oficina, OficinaDriveConfig, UsuarioOficina, Etapa, FotoOS, OS, OSArquivada, OSEtapaStatus, ObservacaoEtapaOS, PerfilRequisicao, RegistroExcluido, SyncJob, TarefaDrive
+from core.services.arquivamento import arquivar_os_fechadas, reidratar_os
+from core.services.busca_os import remover_os_do_indice
+from core.services.drive_pastas import renomear_pastas_etapas
+from core.services import pwa as pwa_service
+from core.services.etapas import invalidar_grafo_etapas, obter_grafo_etapas
+from core.services.sync import SyncService
+from core.services.sync_jobs import processar_sync_jobs_pendentes
+from core.views import OSViewSet
 
 
 class SyncViewTests(APITestCase):
@@ -69,6 +98,50 @@ class SyncViewTests(APITestCase):
         )
         self.assertEqual(FotoOS.objects.count(), 0)
 
+    @override_settings(METRICS_TOKEN="segredo")
+    def test_metrics_expoe_sync_e_latencia_por_view(self):
+        self.client.post(self.url, self._build_payload(numero_interno="M1"), format="json")
+
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer segredX").status_code, 401)
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer segredo")
+
+        self.assertEqual(response.status_code, 200)
+        conteudo = response.content.decode()
+        self.assertIn('sync_items_total{status="created"}', conteudo)
+        self.assertIn('http_request_duration_seconds_count{method="POST",status="200",view="sync"}', conteudo)
+        self.assertIn('db_queries_per_request_count{view="sync"}', conteudo)
+        self.assertIn("sync_jobs_pending 0.0", conteudo)
+
+    def test_profiling_por_cabecalho_apenas_para_superusuario(self):
+        self.client.get("/api/os/", HTTP_X_PROFILE="1")
+        self.assertFalse(PerfilRequisicao.objects.exists())
+
+        with mock.patch("core.profiling.cProfile.Profile") as profile:
+            self.client.force_authenticate(None)
+            self.client.get("/api/os/", HTTP_X_PROFILE="1")
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+            self.client.get("/api/os/", HTTP_X_PROFILE="1")
+        profile.assert_not_called()
+
+        admin_user = User.objects.create_superuser(username="root", password="pass")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(admin_user)}")
+        response = self.client.get("/api/os/", HTTP_X_PROFILE="1", HTTP_X_REQUEST_ID="req-123")
+
+        self.assertEqual(response["X-Request-ID"], "req-123")
+        perfil = PerfilRequisicao.objects.get(request_id="req-123")
+        self.assertEqual(perfil.motivo, "CABECALHO")
+        self.assertGreater(perfil.total_consultas, 0)
+        self.assertIn("cumulative", perfil.perfil)
+
+        self.client.force_login(admin_user)
+        download = self.client.get(
+            reverse("admin:core_perfilrequisicao_download", args=[perfil.pk])
+        )
+        self.assertEqual(download.status_code, 200)
+        self.assertIn(b"Request ID: req-123", download.content)
+
     def test_sync_cria_foto_com_base64_valido(self):
         conteudo = base64.b64encode(b"foto-conteudo").decode()
         fotos = {
@@ -92,6 +165,58 @@ class SyncViewTests(APITestCase):
         self.assertEqual(FotoOS.objects.count(), 1)
         self.assertEqual(response.data["os"][0]["photo_errors"], [])
 
+    def test_tracing_exporta_spans_encadeados_em_jsonl(self):
+        conteudo = base64.b64encode(b"foto-conteudo").decode()
+        fotos = {"livres": [{"arquivo": f"data:image/png;base64,{conteudo}", "extensao": "png"}]}
+        caminho = os.path.join(self._media_root, "spans.jsonl")
+
+        with override_settings(TRACING_JSONL_PATH=caminho), mock.patch(
+            "core.services.sync.criar_pasta_os"
+        ), mock.patch("core.services.sync.upload_foto_para_drive"):
+            response = self.client.post(
+                self.url, self._build_payload(numero_interno="T1", fotos=fotos), format="json"
+            )
+
+        with open(caminho, encoding="utf-8") as arquivo:
+            spans = {s["nome"]: s for s in map(json.loads, arquivo)}
+
+        raiz = spans["http.request"]
+        self.assertEqual(response["X-Trace-ID"], raiz["trace_id"])
+        self.assertIsNone(raiz["parent_id"])
+        self.assertEqual({s["trace_id"] for s in spans.values()}, {raiz["trace_id"]})
+        self.assertEqual(spans["sync.processar"]["parent_id"], raiz["span_id"])
+        self.assertEqual(spans["sync.item"]["parent_id"], spans["sync.processar"]["span_id"])
+        self.assertEqual(spans["sync.salvar_os"]["parent_id"], spans["sync.item"]["span_id"])
+        self.assertEqual(spans["sync.item"]["atributos"]["status"], "created")
+        self.assertEqual(spans["foto.decodificar"]["atributos"]["bytes"], len(b"foto-conteudo"))
+
+    @override_settings(TRACING_OTLP_ENDPOINT="http://coletor:4318", TRACING_OTLP_FILA_MAX=2)
+    def test_tracing_otlp_usa_uma_thread_e_descarta_com_fila_cheia(self):
+        from core import tracing
+
+        with mock.patch.object(tracing, "_fila_otlp", None), \
+                mock.patch.object(tracing, "_worker_otlp", None), \
+                mock.patch.object(tracing, "_otlp_descartados", 0), \
+                mock.patch("core.tracing.threading.Thread") as thread:
+            for indice in range(3):
+                with tracing.span("trace", indice=indice):
+                    pass
+            fila = tracing._fila_otlp
+            self.assertEqual(thread.call_count, 1)
+            self.assertEqual(fila.qsize(), 2)
+            self.assertEqual(tracing._otlp_descartados, 1)
+
+        with mock.patch("core.tracing._enviar_otlp") as enviar:
+            kwargs = thread.call_args.kwargs
+            threading.Thread(target=kwargs["target"], args=kwargs["args"], daemon=True).start()
+            fila.join()
+
+        self.assertEqual(enviar.call_count, 2)
+        endpoint, corpo = enviar.call_args.args
+        self.assertEqual(endpoint, "http://coletor:4318")
+        span_enviado = json.loads(corpo)["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        self.assertIn({"key": "indice", "value": {"intValue": "1"}}, span_enviado["attributes"])
+
     def test_sync_base64_invalido_registra_photo_errors(self):
         fotos = {
             "livres": [
@@ -189,6 +314,237 @@ class SyncViewTests(APITestCase):
             any("aplicando etapa inicial da oficina" in message for message in logs.output)
         )
 
+    def test_sync_em_lotes_reverte_apenas_item_com_falha(self):
+        payload = {
+            "osPendentes": [
+                self._build_payload(numero_interno=codigo)["osPendentes"][0]
+                for codigo in ("L1", "L2", "L3")
+            ]
+        }
+        salvar_fotos_original = SyncService._salvar_fotos
+
+        def salvar_fotos(service, os_obj, item):
+            if os_obj.codigo == "L2":
+                raise IntegrityError("falha simulada")
+            return salvar_fotos_original(service, os_obj, item)
+
+        with mock.patch.object(SyncService, "_salvar_fotos", salvar_fotos):
+            resultados, erro = SyncService(self.user, tamanho_lote=2).processar(payload)
+
+        self.assertIsNone(erro)
+        self.assertEqual(
+            [item["status"] for item in resultados], ["created", "error", "created"]
+        )
+        self.assertEqual(
+            set(OS.objects.values_list("codigo", flat=True)), {"L1", "L3"}
+        )
+
+    def test_sync_em_lotes_envia_ao_drive_apos_commit_e_apaga_arquivo_do_item_revertido(self):
+        conteudo = base64.b64encode(b"foto-lote").decode()
+        fotos = {"livres": [{"arquivo": f"data:image/png;base64,{conteudo}", "extensao": "png"}]}
+        payload = {
+            "osPendentes": [
+                self._build_payload(numero_interno=codigo, fotos=fotos)["osPendentes"][0]
+                for codigo in ("D1", "D2")
+            ]
+        }
+        salvar_fotos_original = SyncService._salvar_fotos
+        arquivos = []
+
+        def salvar_fotos(service, os_obj, item):
+            erros = salvar_fotos_original(service, os_obj, item)
+            arquivos.append(service._fotos_gravadas[-1].arquivo.name)
+            if os_obj.codigo == "D2":
+                raise IntegrityError("falha simulada")
+            return erros
+
+        with mock.patch.object(SyncService, "_salvar_fotos", salvar_fotos), mock.patch(
+            "core.services.sync.criar_pasta_os"
+        ) as criar_pasta, mock.patch("core.services.sync.upload_foto_para_drive") as upload:
+            with self.captureOnCommitCallbacks(execute=True):
+                resultados, _ = SyncService(self.user, tamanho_lote=2).processar(payload)
+                upload.assert_not_called()
+
+        self.assertEqual([r["status"] for r in resultados], ["created", "error"])
+        criar_pasta.assert_called_once()
+        self.assertEqual(upload.call_args.args[0].os.codigo, "D1")
+        self.assertTrue(default_storage.exists(arquivos[0]))
+        self.assertFalse(default_storage.exists(arquivos[1]))
+
+    def test_sync_sem_lote_reporta_falha_do_drive_em_photo_errors(self):
+        conteudo = base64.b64encode(b"foto-drive").decode()
+        fotos = {"livres": [{"arquivo": f"data:image/png;base64,{conteudo}", "extensao": "png"}]}
+
+        with mock.patch("core.services.sync.criar_pasta_os"), mock.patch(
+            "core.services.sync.upload_foto_para_drive", side_effect=RuntimeError("drive fora")
+        ):
+            response = self.client.post(
+                self.url, self._build_payload(numero_interno="DRV-1", fotos=fotos), format="json"
+            )
+
+        foto = FotoOS.objects.get(os__codigo="DRV-1")
+        self.assertEqual(response.data["os"][0]["status"], "created")
+        self.assertEqual(
+            response.data["os"][0]["photo_errors"],
+            [f"[SYNC] Erro ao enviar foto {foto.id} para o Drive: drive fora"],
+        )
+
+    def test_sync_assincrono_retorna_202_e_expoe_resultados(self):
+        payload = self._build_payload(numero_interno="ASYNC-1")
+
+        response = self.client.post(f"{self.url}?async=1", payload, format="json")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], "PENDENTE")
+        self.assertFalse(OS.objects.filter(codigo="ASYNC-1").exists())
+
+        self.assertEqual(processar_sync_jobs_pendentes(), 1)
+
+        detalhe = self.client.get(response.data["status_url"])
+        self.assertEqual(detalhe.status_code, 200)
+        self.assertEqual(detalhe.data["status"], "CONCLUIDO")
+        self.assertEqual(detalhe.data["itens_processados"], 1)
+        self.assertEqual(detalhe.data["results"][0]["status"], "created")
+        self.assertTrue(OS.objects.filter(codigo="ASYNC-1").exists())
+
+    def test_job_abandonado_vai_para_erro_e_job_usa_a_oficina_gravada(self):
+        travado = SyncJob.objects.create(oficina=self.oficina, user=self.user, status="PROCESSANDO")
+        SyncJob.objects.filter(pk=travado.pk).update(atualizado_em=timezone.now() - timedelta(hours=1))
+        outra = Oficina.objects.create(nome="Outra")
+        Etapa.objects.create(oficina=outra, nome="Check-in", ordem=1, is_checkin=True)
+        job = SyncJob.objects.create(
+            oficina=outra, user=self.user, payload=self._build_payload(numero_interno="J-1")
+        )
+
+        self.assertEqual(processar_sync_jobs_pendentes(), 1)
+
+        travado.refresh_from_db()
+        self.assertEqual(travado.status, "ERRO")
+        self.assertIsNotNone(travado.finalizado_em)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "CONCLUIDO")
+        self.assertTrue(OS.objects.filter(oficina=outra, codigo="J-1").exists())
+
+    @override_settings(SYNC_TAMANHO_LOTE=2)
+    def test_job_grava_progresso_por_lote_e_mantem_parciais_em_erro(self):
+        payload = {
+            "osPendentes": [
+                self._build_payload(numero_interno=codigo)["osPendentes"][0]
+                for codigo in ("P1", "P2", "P3")
+            ]
+        }
+        job = SyncJob.objects.create(oficina=self.oficina, user=self.user, payload=payload, total_itens=3)
+        processar_original = SyncService._processar_item_isolado
+        progresso_visto = []
+
+        def processar_item(service, item):
+            # Estado gravado do job quando cada item começa
+            progresso_visto.append(SyncJob.objects.get(pk=job.pk).itens_processados)
+            if len(progresso_visto) == 3:
+                raise RuntimeError("worker falhou")
+            return processar_original(service, item)
+
+        with mock.patch.object(SyncService, "_processar_item_isolado", processar_item):
+            processar_sync_jobs_pendentes()
+
+        self.assertEqual(progresso_visto, [0, 0, 2])
+        job.refresh_from_db()
+        self.assertEqual(job.status, "ERRO")
+        self.assertEqual(job.itens_processados, 2)
+        self.assertEqual([r["status"] for r in job.resultados], ["created", "created"])
+
+    def test_sync_job_de_outro_usuario_retorna_404(self):
+        outro = User.objects.create_user(username="outro", password="pass")
+        job = SyncJob.objects.create(oficina=self.oficina, user=outro)
+
+        response = self.client.get(reverse("sync-job-detail", args=[job.id]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_sync_aceita_corpo_gzip(self):
+        corpo = gzip.compress(
+            json.dumps(self._build_payload(numero_interno="GZ-1")).encode()
+        )
+
+        response = self.client.generic(
+            "POST",
+            self.url,
+            corpo,
+            content_type="application/json",
+            HTTP_CONTENT_ENCODING="gzip",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(OS.objects.filter(codigo="GZ-1").exists())
+
+    @override_settings(API_CORPO_DESCOMPACTADO_MAX_BYTES=1024)
+    def test_sync_rejeita_gzip_que_excede_limite_descompactado(self):
+        corpo = gzip.compress(b" " * 10_000)
+
+        response = self.client.generic(
+            "POST",
+            self.url,
+            corpo,
+            content_type="application/json",
+            HTTP_CONTENT_ENCODING="gzip",
+        )
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(OS.objects.count(), 0)
+
+    def test_respostas_da_api_sao_compactadas(self):
+        for numero in range(5):
+            OS.objects.create(oficina=self.oficina, codigo=f"CMP-{numero}")
+
+        response = self.client.get(reverse("os-list"), HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 5)
+
+    @skipIf(brotli is None, "brotli não instalado")
+    def test_brotli_usa_qualidade_configurada_e_respeita_q_zero(self):
+        for numero in range(5):
+            OS.objects.create(oficina=self.oficina, codigo=f"CMP-{numero}")
+
+        with override_settings(API_BROTLI_QUALIDADE=4), mock.patch(
+            "core.middleware.brotli.compress", wraps=brotli.compress
+        ) as compress:
+            response = self.client.get(reverse("os-list"), HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(compress.call_args.kwargs["quality"], 4)
+        self.assertEqual(len(json.loads(brotli.decompress(response.content))), 5)
+
+        # br;q=0 recusa brotli mesmo aparecendo no cabeçalho
+        response = self.client.get(reverse("os-list"), HTTP_ACCEPT_ENCODING="br;q=0, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_busca_os_normaliza_placa_e_ordena_por_relevancia(self):
+        contem = OS.objects.create(
+            oficina=self.oficina, codigo="X-ABC1D234", placa="XYZ9A99"
+        )
+        exata = OS.objects.create(oficina=self.oficina, codigo="77", placa="ABC-1D23")
+        OS.objects.create(oficina=self.oficina, codigo="88", placa="QWE1R23")
+
+        response = self.client.get(reverse("os-list"), {"search": "abc1d23"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.data], [exata.id, contem.id])
+
+        response = self.client.get(reverse("os-list"), {"search": "QWE-1"})
+        self.assertEqual([item["placa"] for item in response.data], ["QWE1R23"])
+
+    def test_falha_no_indice_de_busca_e_registrada_sem_propagar(self):
+        conexao = mock.Mock()
+        conexao.cursor.side_effect = DatabaseError("fts corrompido")
+
+        with mock.patch("core.services.busca_os._usa_fts", return_value=True), mock.patch(
+            "core.services.busca_os.connection", conexao
+        ), self.assertLogs("core.services.busca_os", "ERROR") as logs:
+            remover_os_do_indice(123)
+
+        self.assertIn("Falha ao remover OS da busca", logs.output[0])
+
     def test_patch_os_nao_altera_etapa_atual_quando_nao_enviada(self):
         os_obj = OS.objects.create(
             oficina=self.oficina, codigo="OS-ETAPA", etapa_atual=self.etapa
@@ -265,6 +621,210 @@ class AvancarEtapaTests(APITestCase):
             arquivo=SimpleUploadedFile("foto.jpg", b"dados", content_type="image/jpeg"),
         )
 
+    def test_timeline_materializada_so_recalcula_apos_mudanca(self):
+        url_timeline = reverse("os-timeline", args=[self.os.id])
+
+        primeira = self.client.get(url_timeline)
+        self.assertEqual([item["etapa"] for item in primeira.data], [self.etapa_atual.id, self.proxima_etapa.id])
+        self.os.refresh_from_db()
+        self.assertIsNotNone(self.os.timeline_snapshot)
+
+        # Snapshot pronto: a leitura não consulta OSEtapaStatus
+        with mock.patch("core.services.timeline.calcular_timeline") as calcular:
+            self.client.get(url_timeline)
+            self.client.get(reverse("os-list"), {"incluir": "timeline"})
+        calcular.assert_not_called()
+
+        response = self.client.post(
+            reverse("os-marcar-etapa-concluida", args=[self.os.id]), {"etapa": self.etapa_atual.id}
+        )
+        self.assertEqual(response.data["timeline"][0]["status"], "concluida")
+        self.assertTrue(response.data["timeline"][1]["is_atual"])
+
+        Etapa.objects.create(oficina=self.oficina, nome="Pintura", ordem=3, ativa=True)
+        self.os.refresh_from_db()
+        self.assertIsNone(self.os.timeline_snapshot)
+        lista = self.client.get(reverse("os-list"), {"incluir": "timeline"})
+        self.assertEqual(len(lista.data[0]["timeline"]), 3)
+
+    def test_lista_recalcula_timelines_da_pagina_juntas_e_regrava_depois(self):
+        for indice in range(2, 5):
+            os_obj = OS.objects.create(oficina=self.oficina, codigo=f"OS-{indice}", etapa_atual=self.etapa_atual)
+            OSEtapaStatus.objects.create(os=os_obj, etapa=self.etapa_atual, concluida_em=timezone.now())
+        Etapa.objects.create(oficina=self.oficina, nome="Pintura", ordem=3, ativa=True)
+        self.assertFalse(OS.objects.filter(timeline_snapshot__isnull=False).exists())
+
+        with mock.patch("core.services.timeline.threading.Thread") as thread, \
+                self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as consultas:
+            lista = self.client.get(reverse("os-list"), {"incluir": "timeline"})
+
+        self.assertEqual(len(lista.data), 4)
+        self.assertTrue(all(len(item["timeline"]) == 3 for item in lista.data))
+        sql = [c["sql"] for c in consultas.captured_queries]
+        self.assertEqual(len([q for q in sql if "core_osetapastatus" in q]), 1)
+        self.assertFalse([q for q in sql if q.startswith("UPDATE")])
+        self.assertFalse(OS.objects.filter(timeline_snapshot__isnull=False).exists())
+
+        # Depois da resposta: um UPDATE grava todos os snapshots da página
+        kwargs = thread.call_args.kwargs
+        with CaptureQueriesContext(connection) as consultas:
+            kwargs["target"](*kwargs["args"])
+        self.assertEqual(len([c for c in consultas.captured_queries if c["sql"].startswith("UPDATE")]), 1)
+        por_id = {item["id"]: item["timeline"] for item in lista.data}
+        for os_obj in OS.objects.all():
+            self.assertEqual(
+                [{**item, "is_atual": os_obj.etapa_atual_id == item["etapa"]} for item in os_obj.timeline_snapshot],
+                por_id[os_obj.id],
+            )
+
+    def test_lista_de_os_traz_resumo_de_fotos_com_consultas_fixas(self):
+        self._criar_foto_obrigatoria()
+        livre = FotoOS.objects.create(
+            os=self.os,
+            etapa=self.etapa_atual,
+            tipo="LIVRE",
+            arquivo=SimpleUploadedFile("livre.jpg", b"dados", content_type="image/jpeg"),
+        )
+        outra = OS.objects.create(oficina=self.oficina, codigo="OS-2", etapa_atual=self.etapa_atual)
+        url = reverse("os-list")
+
+        self.client.get(url)  # aquece o grafo de etapas
+        with CaptureQueriesContext(connection) as com_duas:
+            response = self.client.get(url)
+        for indice in range(5):
+            OS.objects.create(oficina=self.oficina, codigo=f"OS-X{indice}")
+        with CaptureQueriesContext(connection) as com_sete:
+            self.client.get(url)
+
+        self.assertEqual(len(com_duas), len(com_sete))
+        por_id = {item["id"]: item for item in response.data}
+        self.assertNotIn("fotos", por_id[self.os.id])
+        self.assertEqual(
+            por_id[self.os.id]["resumo_fotos"],
+            [
+                {
+                    "etapa": self.etapa_atual.id,
+                    "etapa_nome": "Check-in",
+                    "total": 2,
+                    "ultima_foto": livre.id,
+                    "configs_pendentes": [],
+                }
+            ],
+        )
+        self.assertEqual(por_id[outra.id]["resumo_fotos"][0]["configs_pendentes"], [self.config.id])
+
+        detalhe = self.client.get(reverse("os-detail", args=[self.os.id]))
+        self.assertEqual(len(detalhe.data["fotos"]), 2)
+
+    def test_detalhe_painel_agrega_em_consultas_fixas_e_versiona_por_etag(self):
+        url = reverse("os-detalhe-painel", args=[self.os.id])
+        self._criar_foto_obrigatoria()
+
+        self.client.get(url)  # aquece o grafo de etapas e o snapshot da timeline
+        FotoOS.objects.create(
+            os=self.os,
+            etapa=self.proxima_etapa,
+            tipo="LIVRE",
+            arquivo=SimpleUploadedFile("livre.jpg", b"dados", content_type="image/jpeg"),
+        )
+        with CaptureQueriesContext(connection) as com_duas:
+            response = self.client.get(url)
+        for indice in range(4):
+            FotoOS.objects.create(
+                os=self.os,
+                etapa=self.proxima_etapa,
+                tipo="LIVRE",
+                arquivo=SimpleUploadedFile(f"l{indice}.jpg", b"dados", content_type="image/jpeg"),
+            )
+        with CaptureQueriesContext(connection) as com_seis:
+            maior = self.client.get(url)
+
+        self.assertEqual(len(com_duas), len(com_seis))
+        self.assertEqual(response.data["os"]["id"], self.os.id)
+        self.assertEqual(
+            [(g["etapa"], len(g["fotos"])) for g in response.data["fotos_por_etapa"]],
+            [(self.etapa_atual.id, 1), (self.proxima_etapa.id, 1)],
+        )
+        self.assertTrue(response.data["fotos_por_etapa"][0]["fotos"][0]["thumb_url"])
+        self.assertEqual(len(response.data["timeline"]), 2)
+        self.assertEqual(maior.data["fotos_total"], 6)
+        self.assertEqual(maior["ETag"], f'"{maior.data["versao"]}"')
+
+        with CaptureQueriesContext(connection) as consultas_304:
+            repetida = self.client.get(url, HTTP_IF_NONE_MATCH=maior["ETag"])
+        self.assertEqual(repetida.status_code, 304)
+        self.assertLess(len(consultas_304), len(com_seis))
+
+        ObservacaoEtapaOS.objects.create(os=self.os, etapa=self.etapa_atual, texto="Risco na porta")
+        nova = self.client.get(url, HTTP_IF_NONE_MATCH=maior["ETag"])
+        self.assertEqual(nova.status_code, 200)
+        self.assertEqual([o["texto"] for o in nova.data["observacoes"]], ["Risco na porta"])
+
+    def test_upload_em_lote_grava_fotos_e_enfileira_drive_uma_vez(self):
+        url = reverse("fotoos-lote")
+        arquivos = [
+            SimpleUploadedFile(f"lote{indice}.jpg", b"dados", content_type="image/jpeg")
+            for indice in range(3)
+        ]
+
+        with mock.patch("core.views.enfileirar_envio_drive") as enfileirar:
+            response = self.client.post(
+                url,
+                {"os": self.os.id, "arquivos": arquivos, "config_foto": [self.config.id, "", ""]},
+                format="multipart",
+            )
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([f["tipo"] for f in response.data], ["PADRAO", "LIVRE", "LIVRE"])
+        self.assertEqual({f["etapa"] for f in response.data}, {self.etapa_atual.id})
+        self.assertEqual(FotoOS.objects.filter(os=self.os, tirada_por=self.usuario_oficina).count(), 3)
+        for foto in FotoOS.objects.filter(os=self.os):
+            self.assertTrue(default_storage.exists(foto.arquivo.name))
+        enfileirar.assert_called_once_with([f["id"] for f in response.data], self.oficina.id)
+
+        config_de_outra_etapa = ConfigFoto.objects.create(
+            oficina=self.oficina, etapa=self.proxima_etapa, nome="Porta"
+        )
+        invalido = self.client.post(
+            url,
+            {
+                "os": self.os.id,
+                "arquivos": [SimpleUploadedFile("x.jpg", b"dados", content_type="image/jpeg")],
+                "config_foto": [config_de_outra_etapa.id],
+            },
+            format="multipart",
+        )
+        self.assertEqual(invalido.status_code, 400)
+        self.assertEqual([str(k) for k in invalido.data["arquivos"]], ["0"])
+        self.assertEqual(FotoOS.objects.filter(os=self.os).count(), 3)
+
+        # Erros apontam o arquivo do lote que falhou nas regras de FotoOSSerializer
+        misto = self.client.post(
+            url,
+            {
+                "os": self.os.id,
+                "arquivos": [
+                    SimpleUploadedFile("ok.jpg", b"dados", content_type="image/jpeg"),
+                    SimpleUploadedFile("x.jpg", b"dados", content_type="image/jpeg"),
+                ],
+                "config_foto": [self.config.id, config_de_outra_etapa.id],
+            },
+            format="multipart",
+        )
+        self.assertEqual(misto.status_code, 400)
+        self.assertEqual([str(k) for k in misto.data["arquivos"]], ["1"])
+
+        outra_os = OS.objects.create(oficina=Oficina.objects.create(nome="Outra lote"), codigo="OUT-L")
+        de_outra = self.client.post(
+            url,
+            {"os": outra_os.id, "arquivos": [SimpleUploadedFile("x.jpg", b"dados", content_type="image/jpeg")]},
+            format="multipart",
+        )
+        self.assertEqual(de_outra.status_code, 400)
+        self.assertIn("os", de_outra.data)
+        self.assertEqual(FotoOS.objects.count(), 3)
+
     def test_nao_avanca_sem_fotos_obrigatorias(self):
         response = self.client.post(self.url, {})
 
@@ -312,3 +872,920 @@ class AvancarEtapaTests(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.os.refresh_from_db()
         self.assertEqual(self.os.etapa_atual, self.etapa_atual)
+
+    def test_grafo_de_etapas_fica_em_cache_e_invalida_ao_salvar_etapa(self):
+        grafo = obter_grafo_etapas(self.oficina)
+        self.assertEqual(grafo.checkin, self.etapa_atual)
+        self.assertEqual(grafo.proxima(self.etapa_atual), self.proxima_etapa)
+
+        with self.assertNumQueries(0):
+            self.assertIs(obter_grafo_etapas(self.oficina.id), grafo)
+
+        intermediaria = Etapa.objects.create(
+            oficina=self.oficina, nome="Desmontagem", ordem=1, ativa=True
+        )
+        intermediaria.ordem = 2
+        self.proxima_etapa.ordem = 3
+        self.proxima_etapa.save()
+        intermediaria.save()
+
+        self._criar_foto_obrigatoria()
+        response = self.client.post(self.url, {})
+
+        self.assertEqual(response.status_code, 200)
+        self.os.refresh_from_db()
+        self.assertEqual(self.os.etapa_atual, intermediaria)
+
+    def test_grafo_lido_da_replica_nao_fica_em_cache(self):
+        invalidar_grafo_etapas(self.oficina.id)
+        with mock.patch("core.services.etapas.lendo_da_replica", return_value=True):
+            da_replica = obter_grafo_etapas(self.oficina)
+
+        self.assertIsNot(obter_grafo_etapas(self.oficina), da_replica)
+
+
+@override_settings(PWA_CHANGES_SOBREPOSICAO_SEGUNDOS=0)
+class PwaEndpointsTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._media_root = tempfile.mkdtemp()
+        cls._override_media = override_settings(MEDIA_ROOT=cls._media_root)
+        cls._override_media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._override_media.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="pwa", password="pass")
+        self.oficina = Oficina.objects.create(nome="Oficina PWA")
+        UsuarioOficina.objects.create(
+            user=self.user, oficina=self.oficina, papel="FUNC", ativo=True
+        )
+        self.etapa = Etapa.objects.create(
+            oficina=self.oficina, nome="Check-in", ordem=1, is_checkin=True
+        )
+        self.os = OS.objects.create(
+            oficina=self.oficina, codigo="OS-PWA", etapa_atual=self.etapa
+        )
+        self.foto = FotoOS.objects.create(
+            os=self.os,
+            etapa=self.etapa,
+            tipo="LIVRE",
+            arquivo=SimpleUploadedFile("foto.jpg", b"dados", content_type="image/jpeg"),
+        )
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("pwa-changes")
+
+    def test_sem_since_devolve_estado_completo(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["completo"])
+        self.assertEqual([item["id"] for item in response.data["os"]], [self.os.id])
+        self.assertEqual([item["id"] for item in response.data["fotos"]], [self.foto.id])
+        self.assertTrue(response.data["cursor"])
+
+    def test_com_since_devolve_apenas_alteracoes_e_exclusoes(self):
+        cursor = self.client.get(self.url).data["cursor"]
+
+        nova_os = OS.objects.create(oficina=self.oficina, codigo="OS-NOVA")
+        foto_id = self.foto.id
+        self.foto.delete()
+
+        response = self.client.get(self.url, {"since": cursor})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data["completo"])
+        self.assertEqual([item["id"] for item in response.data["os"]], [nova_os.id])
+        self.assertEqual(response.data["fotos"], [])
+        self.assertIn(
+            {"modelo": "FotoOS", "id": foto_id, "os_id": self.os.id},
+            response.data["excluidos"],
+        )
+
+    @override_settings(PWA_EXCLUIDOS_RETENCAO_DIAS=30)
+    def test_limpeza_de_excluidos_e_cursor_anterior_a_retencao(self):
+        cursor_antigo = self.client.get(self.url).data["cursor"]
+        self.foto.delete()
+        recente = OS.objects.create(oficina=self.oficina, codigo="OS-APAGADA")
+        recente_id = recente.id
+        recente.delete()
+        RegistroExcluido.objects.filter(modelo="FotoOS").update(
+            excluido_em=timezone.now() - timedelta(days=31)
+        )
+
+        saida = StringIO()
+        call_command("limpar_registros_excluidos", "--dry-run", stdout=saida)
+        self.assertIn("1 registro(s)", saida.getvalue())
+        self.assertEqual(RegistroExcluido.objects.count(), 2)
+
+        call_command("limpar_registros_excluidos", stdout=StringIO())
+        self.assertEqual(
+            list(RegistroExcluido.objects.values_list("modelo", "objeto_id")), [("OS", recente_id)]
+        )
+
+        # Cursor dentro da retenção: delta normal
+        response = self.client.get(self.url, {"since": cursor_antigo})
+        self.assertFalse(response.data["completo"])
+
+        # Cursor mais velho que a retenção: tombstones podem faltar, volta o estado completo
+        antigo = (timezone.now() - timedelta(days=31)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        response = self.client.get(self.url, {"since": antigo})
+        self.assertTrue(response.data["completo"])
+        self.assertEqual(response.data["excluidos"], [])
+        self.assertEqual([item["id"] for item in response.data["os"]], [self.os.id])
+
+    def test_excluir_oficina_com_os_nao_grava_tombstones(self):
+        OSEtapaStatus.objects.create(os=self.os, etapa=self.etapa, concluida_em=timezone.now())
+        ObservacaoEtapaOS.objects.create(os=self.os, etapa=self.etapa, texto="Riscado")
+        # Tombstone já existente vai junto com a oficina
+        OS.objects.create(oficina=self.oficina, codigo="OS-PWA-2").delete()
+
+        self.oficina.delete()
+
+        self.assertFalse(Oficina.objects.filter(nome="Oficina PWA").exists())
+        self.assertFalse(OS.objects.exists())
+        self.assertFalse(RegistroExcluido.objects.exists())
+
+        # Exclusão da OS fora da cascata da oficina continua registrada
+        oficina = Oficina.objects.create(nome="Outra PWA")
+        os_obj = OS.objects.create(oficina=oficina, codigo="OS-X")
+        os_id = os_obj.id
+        os_obj.delete()
+        self.assertEqual(
+            list(RegistroExcluido.objects.values_list("modelo", "objeto_id")), [("OS", os_id)]
+        )
+
+    def test_bootstrap_reune_dados_e_responde_304_para_mesma_versao(self):
+        config = ConfigFoto.objects.create(
+            oficina=self.oficina, etapa=self.etapa, nome="Frente"
+        )
+        url = reverse("pwa-bootstrap")
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["usuario"]["oficina_id"], self.oficina.id)
+        self.assertEqual(response.data["oficina"]["id"], self.oficina.id)
+        self.assertEqual([e["id"] for e in response.data["etapas"]], [self.etapa.id])
+        self.assertEqual([c["id"] for c in response.data["config_fotos"]], [config.id])
+        self.assertEqual(
+            [v["os_id"] for v in response.data["veiculos_em_producao"]], [self.os.id]
+        )
+        self.assertEqual(response["ETag"], f'"{response.data["versao"]}"')
+
+        repetida = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(repetida.status_code, 304)
+
+    def test_veiculos_em_producao_usa_cache_ate_alteracao_da_oficina(self):
+        url = reverse("pwa-veiculos-em-producao")
+
+        with mock.patch(
+            "core.services.pwa._calcular_veiculos_em_producao",
+            wraps=pwa_service._calcular_veiculos_em_producao,
+        ) as calcular:
+            primeira = self.client.get(url)
+            segunda = self.client.get(url)
+            self.assertEqual(calcular.call_count, 1)
+            self.assertEqual(primeira.data, segunda.data)
+
+            # Alteração em outra oficina não invalida esta
+            outra = Oficina.objects.create(nome="Outra PWA")
+            OS.objects.create(oficina=outra, codigo="OS-OUTRA")
+            self.client.get(url)
+            self.assertEqual(calcular.call_count, 1)
+
+            nova_os = OS.objects.create(oficina=self.oficina, codigo="OS-PWA-2")
+            terceira = self.client.get(url)
+
+        self.assertEqual(calcular.call_count, 2)
+        self.assertIn(nova_os.id, [v["os_id"] for v in terceira.data])
+
+
+class PlanoConsultasTests(TestCase):
+    """
+    Confere via EXPLAIN que as consultas quentes usam os índices compostos.
+    """
+
+    def setUp(self):
+        self.oficina = Oficina.objects.create(nome="Oficina Índices")
+        self.etapa = Etapa.objects.create(
+            oficina=self.oficina, nome="Check-in", ordem=1, is_checkin=True
+        )
+        self.os = OS.objects.create(
+            oficina=self.oficina, codigo="IDX-1", etapa_atual=self.etapa
+        )
+
+    def _plano(self, qs):
+        if connection.vendor != "postgresql":
+            return qs.explain()
+        # SET LOCAL vale só até o fim desta transação, sem vazar para a conexão
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            return qs.explain()
+
+    def assertUsaIndice(self, qs, indice):
+        plano = self._plano(qs)
+        self.assertIn(indice, plano, msg=plano)
+
+    def test_os_por_etapa_do_dashboard(self):
+        qs = OS.objects.filter(oficina=self.oficina, aberta=True, etapa_atual=self.etapa)
+        self.assertUsaIndice(qs, "os_abertas_etapa_idx")
+
+    def test_lista_de_os_ordenada(self):
+        qs = OS.objects.filter(oficina=self.oficina).order_by("-data_entrada", "-criado_em")
+        self.assertUsaIndice(qs, "os_oficina_entrada_idx")
+
+    def test_lista_do_pwa_usa_indice_parcial(self):
+        qs = OS.objects.filter(oficina=self.oficina, aberta=True).order_by("-atualizado_em")
+        self.assertUsaIndice(qs, "os_abertas_atualizado_idx")
+
+    def test_fotos_da_os_por_etapa(self):
+        qs = FotoOS.objects.filter(os=self.os, etapa=self.etapa).order_by("tirada_em")
+        self.assertUsaIndice(qs, "fotoos_os_etapa_tirada_idx")
+
+    def test_etapas_ativas_da_oficina(self):
+        qs = Etapa.objects.filter(oficina=self.oficina, ativa=True).order_by("ordem")
+        self.assertUsaIndice(qs, "etapa_ativas_ordem_idx")
+
+    def test_configs_obrigatorias_da_etapa(self):
+        qs = ConfigFoto.objects.filter(
+            oficina=self.oficina, etapa=self.etapa, obrigatoria=True, ativa=True
+        )
+        self.assertUsaIndice(qs, "configfoto_obrigatorias_idx")
+
+
+class ArquivamentoOSTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._media_root = tempfile.mkdtemp()
+        cls._override_media = override_settings(MEDIA_ROOT=cls._media_root)
+        cls._override_media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._override_media.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.oficina = Oficina.objects.create(nome="Oficina Arquivo")
+        self.etapa = Etapa.objects.create(
+            oficina=self.oficina, nome="Check-in", ordem=1, is_checkin=True
+        )
+        self.os = OS.objects.create(
+            oficina=self.oficina,
+            codigo="ARQ-1",
+            placa="ABC1D23",
+            etapa_atual=self.etapa,
+            aberta=False,
+            data_saida=timezone.now() - timedelta(days=400),
+        )
+        self.foto_drive = FotoOS.objects.create(
+            os=self.os,
+            etapa=self.etapa,
+            tipo="LIVRE",
+            arquivo=SimpleUploadedFile("drive.jpg", b"no-drive", content_type="image/jpeg"),
+            drive_file_id="drive-123",
+        )
+        self.foto_local = FotoOS.objects.create(
+            os=self.os,
+            etapa=self.etapa,
+            tipo="LIVRE",
+            arquivo=SimpleUploadedFile("local.jpg", b"so-local", content_type="image/jpeg"),
+        )
+
+    def test_arquiva_os_antiga_e_libera_apenas_fotos_no_drive(self):
+        nome_drive = self.foto_drive.arquivo.name
+        nome_local = self.foto_local.arquivo.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            total = arquivar_os_fechadas(dias=180)
+
+        self.assertEqual(total, 1)
+        self.assertFalse(OS.objects.filter(id=self.os.id).exists())
+        self.assertEqual(FotoOS.objects.count(), 0)
+        self.assertTrue(OSArquivada.objects.filter(os_id_original=self.os.id).exists())
+        self.assertFalse(default_storage.exists(nome_drive))
+        self.assertTrue(default_storage.exists(nome_local))
+
+    def test_reidrata_com_ids_originais_e_baixa_fotos_do_drive(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            arquivar_os_fechadas(dias=180)
+        arquivada = OSArquivada.objects.get(os_id_original=self.os.id)
+
+        with mock.patch(
+            "core.services.arquivamento.baixar_arquivo_drive", return_value=b"do-drive"
+        ) as baixar:
+            os_obj = reidratar_os(arquivada)
+
+        self.assertEqual(os_obj.id, self.os.id)
+        self.assertEqual(os_obj.etapa_atual, self.etapa)
+        self.assertEqual(
+            set(FotoOS.objects.filter(os=os_obj).values_list("id", flat=True)),
+            {self.foto_drive.id, self.foto_local.id},
+        )
+        baixar.assert_called_once()
+        foto = FotoOS.objects.get(id=self.foto_drive.id)
+        with foto.arquivo.open("rb") as fp:
+            self.assertEqual(fp.read(), b"do-drive")
+        self.assertFalse(OSArquivada.objects.exists())
+
+    def test_endpoint_reidrata_com_fotos_em_segundo_plano_e_409_em_conflito(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            arquivar_os_fechadas(dias=180)
+        user = User.objects.create_user(username="gerente-arq", password="senha")
+        UsuarioOficina.objects.create(user=user, oficina=self.oficina, papel="GERENTE", ativo=True)
+        client = APIClient()
+        client.force_authenticate(user)
+        url = reverse("os-arquivada-reidratar", args=[self.os.id])
+
+        novo = OS.objects.create(oficina=self.oficina, codigo="ARQ-1")
+        response = client.post(url)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("ARQ-1", response.data["detail"])
+        self.assertTrue(OSArquivada.objects.exists())
+
+        novo.delete()
+        with mock.patch("core.services.arquivamento.baixar_arquivo_drive") as baixar, mock.patch(
+            "core.services.tarefas_drive.threading.Thread"
+        ) as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post(url)
+
+        self.assertEqual(response.status_code, 200)
+        baixar.assert_not_called()
+        tarefa = TarefaDrive.objects.get()
+        self.assertEqual((tarefa.tipo, tarefa.parametros), ("RESTAURAR_ARQUIVOS", {"os_id": self.os.id}))
+        thread.assert_called_once()
+        self.assertEqual(thread.call_args.kwargs["args"], (tarefa.id,))
+
+    def test_nao_arquiva_os_aberta_ou_recente(self):
+        OS.objects.create(oficina=self.oficina, codigo="ABERTA", aberta=True)
+        OS.objects.create(
+            oficina=self.oficina,
+            codigo="RECENTE",
+            aberta=False,
+            data_saida=timezone.now() - timedelta(days=5),
+        )
+
+        self.assertEqual(arquivar_os_fechadas(dias=180), 1)
+        self.assertEqual(
+            set(OS.objects.values_list("codigo", flat=True)), {"ABERTA", "RECENTE"}
+        )
+
+
+class ImportacaoBootTests(TestCase):
+    def test_boot_nao_carrega_cliente_do_google(self):
+        saida = StringIO()
+
+        call_command("medir_importacao", top=1, stdout=saida)
+
+        self.assertIn("Importação do boot", saida.getvalue())
+
+
+@override_settings(DRIVE_REQUISICOES_POR_SEGUNDO=0)
+class DriveAsyncTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._media_root = tempfile.mkdtemp()
+        cls._override_media = override_settings(MEDIA_ROOT=cls._media_root)
+        cls._override_media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._override_media.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.oficina = Oficina.objects.create(nome="Oficina Async")
+        self.etapa = Etapa.objects.create(oficina=self.oficina, nome="Check-in", ordem=1, is_checkin=True)
+        self.os = OS.objects.create(oficina=self.oficina, codigo="ASY-1", placa="ABC1D23")
+        self.config = OficinaDriveConfig.objects.create(
+            oficina=self.oficina,
+            root_folder_id="raiz",
+            credentials_json=json.dumps(
+                {
+                    "token": "expirado",
+                    "refresh_token": "refresh",
+                    "token_uri": "https://oauth2.googleapis.com/token",
+                    "client_id": "cliente",
+                    "client_secret": "segredo",
+                }
+            ),
+        )
+        self.user = User.objects.create_user(username="async", password="senha")
+        UsuarioOficina.objects.create(user=self.user, oficina=self.oficina, papel="ADMIN", ativo=True)
+
+    def test_envia_foto_renovando_token_e_criando_pastas(self):
+        foto = FotoOS.objects.create(
+            os=self.os,
+            etapa=self.etapa,
+            tipo="LIVRE",
+            arquivo=SimpleUploadedFile("foto.jpg", b"conteudo", content_type="image/jpeg"),
+        )
+        foto = FotoOS.objects.select_related("os", "etapa").get(id=foto.id)
+        chamadas = []
+
+        def responder(request):
+            chamadas.append((request.method, request.url.path, request.headers.get("Authorization")))
+            if request.url.path == "/token":
+                return httpx.Response(200, json={"access_token": "novo"})
+            if request.headers["Authorization"] == "Bearer expirado":
+                return httpx.Response(401)
+            if request.url.path.startswith("/upload/"):
+                self.assertIn(b"conteudo", request.content)
+                return httpx.Response(200, json={"id": "arquivo-1"})
+            if request.method == "GET":
+                return httpx.Response(200, json={"files": []})
+            nome = json.loads(request.content)["name"]
+            return httpx.Response(200, json={"id": "pasta-etapa" if nome.startswith("01") else "pasta-os"})
+
+        async def enviar():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(responder)) as http:
+                return await enviar_foto_drive_async(foto, http=http)
+
+        self.assertEqual(async_to_sync(enviar)(), "arquivo-1")
+
+        self.assertEqual(FotoOS.objects.get(id=foto.id).drive_file_id, "arquivo-1")
+        self.assertEqual(OS.objects.get(id=self.os.id).drive_folder_id, "pasta-os")
+        self.config.refresh_from_db()
+        self.assertEqual(json.loads(self.config.credentials_json)["token"], "novo")
+        self.assertEqual([c[1] for c in chamadas][:2], ["/drive/v3/files", "/token"])
+        self.assertTrue(all(c[2] == "Bearer novo" for c in chamadas[2:] if c[1] != "/token"))
+
+    def test_lote_cria_pastas_uma_vez_e_envia_todas_as_fotos(self):
+        self.config.credentials_json = json.dumps({"token": "valido"})
+        self.config.save()
+        for indice in range(4):
+            FotoOS.objects.create(
+                os=self.os,
+                etapa=self.etapa,
+                tipo="LIVRE",
+                arquivo=SimpleUploadedFile(f"f{indice}.jpg", b"conteudo", content_type="image/jpeg"),
+            )
+        fotos = list(FotoOS.objects.select_related("os", "etapa").order_by("id"))
+        pastas_criadas = []
+
+        def responder(request):
+            if request.url.path.startswith("/upload/"):
+                return httpx.Response(200, json={"id": f"arquivo-{len(request.content)}"})
+            if request.method == "GET":
+                self.assertIn(f"key='os_id' and value='{self.os.id}'", request.url.params["q"])
+                self.assertNotIn("name=", request.url.params["q"])
+                return httpx.Response(200, json={"files": []})
+            self.assertIn("appProperties", json.loads(request.content))
+            pastas_criadas.append(json.loads(request.content)["name"])
+            return httpx.Response(200, json={"id": f"pasta-{len(pastas_criadas)}"})
+
+        async def enviar():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(responder)) as http:
+                return await enviar_fotos_drive_async(fotos, http=http)
+
+        with override_settings(DRIVE_UPLOAD_CONCORRENCIA=2):
+            file_ids = async_to_sync(enviar)()
+
+        self.assertTrue(all(file_ids))
+        self.assertEqual(len(pastas_criadas), 2)
+        self.assertFalse(FotoOS.objects.filter(drive_file_id__isnull=True).exists())
+
+    def test_drive_backfill_envia_pendencias_e_retoma_sem_repetir(self):
+        self.config.credentials_json = json.dumps({"token": "valido"})
+        self.config.save()
+        outra_os = OS.objects.create(oficina=self.oficina, codigo="ASY-2")
+        for os_obj in (self.os, self.os, outra_os):
+            FotoOS.objects.create(
+                os=os_obj,
+                etapa=self.etapa,
+                tipo="LIVRE",
+                arquivo=SimpleUploadedFile("f.jpg", b"conteudo", content_type="image/jpeg"),
+            )
+        chamadas = []
+
+        def responder(request):
+            chamadas.append(request.url.path)
+            if request.url.path.startswith("/upload/"):
+                return httpx.Response(200, json={"id": f"arquivo-{len(chamadas)}"})
+            if request.method == "GET":
+                return httpx.Response(200, json={"files": []})
+            return httpx.Response(200, json={"id": f"pasta-{len(chamadas)}"})
+
+        cliente_original = httpx.AsyncClient
+        saida = StringIO()
+        with mock.patch(
+            "core.drive_async.httpx.AsyncClient",
+            lambda **kwargs: cliente_original(transport=httpx.MockTransport(responder)),
+        ):
+            call_command("drive_backfill", "--lote", "1", stdout=saida)
+            self.assertFalse(FotoOS.objects.filter(drive_file_id__isnull=True).exists())
+            self.assertFalse(OS.objects.filter(drive_folder_id__isnull=True).exists())
+            self.os.refresh_from_db()
+            outra_os.refresh_from_db()
+            self.assertNotEqual(self.os.drive_folder_id, outra_os.drive_folder_id)
+
+            chamadas.clear()
+            call_command("drive_backfill", stdout=saida)
+
+        self.assertEqual(chamadas, [])
+        self.assertIn("3 fotos enviadas", saida.getvalue())
+        self.assertIn(f"retomar com --oficina {self.oficina.id} --a-partir-de-os", saida.getvalue())
+
+        with self.assertRaisesMessage(CommandError, "--a-partir-de-os exige --oficina"):
+            call_command("drive_backfill", "--a-partir-de-os", str(outra_os.id), stdout=StringIO())
+
+    def test_marcar_pastas_grava_app_properties_nas_pastas_antigas(self):
+        self.config.credentials_json = json.dumps({"token": "valido"})
+        self.config.save()
+        self.os.drive_folder_id = "pasta-os"
+        self.os.save()
+        sem_pasta = OS.objects.create(oficina=self.oficina, codigo="ASY-2", placa="XYZ9A87")
+        filhos = {
+            "raiz": [{"id": "pasta-2", "name": "OS-ASY-2 - XYZ9A87 -"}],
+            "pasta-os": [
+                {"id": "etapa-nova", "name": "01 - Check-in"},
+                {"id": "etapa-antiga", "name": "Check-in"},
+                {"id": "livres", "name": "00 - Livres"},
+                {"id": "outra", "name": "Pasta do usuário"},
+            ],
+        }
+        marcadas = {}
+
+        def responder(request):
+            if request.method == "PATCH":
+                marcadas[request.url.path.rsplit("/", 1)[-1]] = json.loads(request.content)["appProperties"]
+                return httpx.Response(200, json={"id": "ok"})
+            pai = request.url.params["q"].split("'")[3]
+            return httpx.Response(200, json={"files": filhos.get(pai, [])})
+
+        cliente_original = httpx.AsyncClient
+        saida = StringIO()
+        with mock.patch(
+            "core.drive_async.httpx.AsyncClient",
+            lambda **kwargs: cliente_original(transport=httpx.MockTransport(responder)),
+        ):
+            call_command("drive_marcar_pastas", stdout=saida)
+
+        sem_pasta.refresh_from_db()
+        self.assertEqual(sem_pasta.drive_folder_id, "pasta-2")
+        self.assertEqual(set(marcadas), {"pasta-os", "pasta-2", "etapa-nova", "livres"})
+        self.assertEqual(
+            marcadas["etapa-nova"],
+            {"tipo": "etapa", "oficina_id": str(self.oficina.id), "os_id": str(self.os.id), "etapa_id": str(self.etapa.id)},
+        )
+        self.assertEqual(marcadas["livres"]["tipo"], "livres")
+        self.assertIn("1 subpastas duplicadas", saida.getvalue())
+
+    def test_processar_tarefas_drive_retoma_o_que_as_threads_perderam(self):
+        antigo = timezone.now() - timedelta(hours=1)
+
+        def tarefa(status, tentativas=0, velha=True, foto_ids=(1,)):
+            criada = TarefaDrive.objects.create(
+                oficina=self.oficina, tipo="ENVIAR_FOTOS", status=status,
+                tentativas=tentativas, parametros={"foto_ids": list(foto_ids)},
+            )
+            if velha:
+                TarefaDrive.objects.filter(pk=criada.pk).update(criado_em=antigo, atualizado_em=antigo)
+            return criada
+
+        perdida = tarefa("PENDENTE")
+        recente = tarefa("PENDENTE", velha=False)
+        abandonada = tarefa("PROCESSANDO", tentativas=1)
+        falhou = tarefa("ERRO", tentativas=1, foto_ids=(99,))
+        esgotada = tarefa("ERRO", tentativas=5)
+        concluida = tarefa("CONCLUIDA", tentativas=1)
+
+        def enviar(foto_ids):
+            if foto_ids == [99]:
+                raise RuntimeError("drive fora")
+            return len(foto_ids)
+
+        saida = StringIO()
+        with mock.patch("core.services.fotos.enviar_fotos_drive", side_effect=enviar) as enviar_mock:
+            call_command("processar_tarefas_drive", stdout=saida)
+
+        self.assertEqual(enviar_mock.call_count, 3)
+        self.assertIn("3 tarefa(s)", saida.getvalue())
+        estados = {
+            t.pk: (t.status, t.tentativas)
+            for t in TarefaDrive.objects.filter(pk__in=[
+                perdida.pk, recente.pk, abandonada.pk, falhou.pk, esgotada.pk, concluida.pk
+            ])
+        }
+        self.assertEqual(estados[perdida.pk], ("CONCLUIDA", 1))
+        self.assertEqual(estados[recente.pk], ("PENDENTE", 0))
+        self.assertEqual(estados[abandonada.pk], ("CONCLUIDA", 2))
+        self.assertEqual(estados[falhou.pk], ("ERRO", 2))
+        self.assertEqual(estados[esgotada.pk], ("ERRO", 5))
+        self.assertEqual(estados[concluida.pk], ("CONCLUIDA", 1))
+
+    def test_renomear_etapas_agenda_um_envio_e_renomeia_pastas_pelo_id(self):
+        self.config.credentials_json = json.dumps({"token": "valido"})
+        self.config.save()
+        pintura = Etapa.objects.create(oficina=self.oficina, nome="Pintura", ordem=2)
+
+        with mock.patch("core.services.tarefas_drive.threading.Thread") as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.etapa.nome = "Recepção"
+                self.etapa.save()
+                pintura.ordem = 3
+                pintura.save()
+                pintura.mostrar_no_dashboard = False
+                pintura.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.etapa.ativa = False
+                self.etapa.save()
+
+        thread.assert_called_once()
+        tarefa = TarefaDrive.objects.get(pk=thread.call_args.kwargs["args"][0])
+        oficina_id, etapa_ids = tarefa.oficina_id, tarefa.parametros["etapa_ids"]
+        self.assertEqual((oficina_id, etapa_ids), (self.oficina.id, sorted([self.etapa.id, pintura.id])))
+
+        pastas = {
+            str(self.etapa.id): [{"id": "e1-os1", "name": "01 - Check-in"}, {"id": "e1-os2", "name": "01 - Recepção"}],
+            str(pintura.id): [{"id": "e2-os1", "name": "02 - Pintura"}],
+        }
+        renomeadas = {}
+
+        def responder(request):
+            if request.method == "PATCH":
+                renomeadas[request.url.path.rsplit("/", 1)[-1]] = json.loads(request.content)["name"]
+                return httpx.Response(200, json={"id": "ok"})
+            q = request.url.params["q"]
+            self.assertNotIn("in parents", q)
+            etapa_id = q.split("key='etapa_id' and value='")[1].split("'")[0]
+            return httpx.Response(200, json={"files": pastas[etapa_id]})
+
+        cliente_original = httpx.AsyncClient
+        with mock.patch(
+            "core.drive_async.httpx.AsyncClient",
+            lambda **kwargs: cliente_original(transport=httpx.MockTransport(responder)),
+        ):
+            resultado = renomear_pastas_etapas(oficina_id, etapa_ids)
+
+        self.assertEqual(renomeadas, {"e1-os1": "01 - Recepção", "e2-os1": "03 - Pintura"})
+        self.assertEqual(resultado, {"renomeadas": 2, "falhas": 0})
+
+    def test_status_do_drive_pela_view_async(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get("/api/drive/status/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "has_drive": True,
+                "ativo": True,
+                "root_folder_id": "raiz",
+                "circuito": {
+                    "estado": "fechado",
+                    "falhas_consecutivas": 0,
+                    "motivo": None,
+                    "nova_tentativa_em": None,
+                },
+            },
+        )
+
+    @override_settings(DRIVE_CIRCUITO_FALHAS=2)
+    def test_circuito_abre_apos_404_seguidos_e_fecha_com_sonda(self):
+        self.config.credentials_json = json.dumps({"token": "valido"})
+        self.config.save()
+        fotos = [
+            FotoOS.objects.create(
+                os=self.os,
+                etapa=self.etapa,
+                tipo="LIVRE",
+                arquivo=SimpleUploadedFile(f"f{i}.jpg", b"x", content_type="image/jpeg"),
+            )
+            for i in range(4)
+        ]
+        fotos = list(FotoOS.objects.select_related("os", "etapa").filter(id__in=[f.id for f in fotos]).order_by("id"))
+        chamadas = []
+        raiz_apagada = True
+
+        def responder(request):
+            chamadas.append(request.method)
+            if request.method == "PATCH":
+                # Pasta de etapa apagada: 404 de um item, não da integração
+                return httpx.Response(404)
+            if raiz_apagada:
+                return httpx.Response(404, json={"error": {"message": "File not found: raiz"}})
+            if request.method == "GET":
+                return httpx.Response(200, json={"files": [{"id": "pasta"}]})
+            return httpx.Response(200, json={"id": "arquivo"})
+
+        def enviar(foto):
+            async def executar():
+                async with httpx.AsyncClient(transport=httpx.MockTransport(responder)) as http:
+                    return await enviar_foto_drive_async(foto, http=http)
+
+            return async_to_sync(executar)()
+
+        async def renomear_apagada():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(responder)) as http:
+                async with ClienteDriveAsync(self.config, http=http) as drive:
+                    for _ in range(3):
+                        with self.assertRaises(httpx.HTTPStatusError):
+                            await drive.renomear("apagada", "01 - Check-in")
+
+        async_to_sync(renomear_apagada)()
+        self.assertEqual(estado_circuito(self.oficina.id)["falhas_consecutivas"], 0)
+        chamadas.clear()
+
+        self.assertIsNone(enviar(fotos[0]))
+        self.assertIsNone(enviar(fotos[1]))
+        self.assertEqual(len(chamadas), 2)
+        estado = estado_circuito(self.oficina.id)
+        self.assertEqual((estado["estado"], estado["motivo"]), ("aberto", "nao_encontrado"))
+
+        # Aberto: nenhuma chamada sai, nem pelo cliente do Google
+        self.assertIsNone(enviar(fotos[2]))
+        self.assertEqual(len(chamadas), 2)
+        with mock.patch("googleapiclient.discovery.build") as build:
+            self.assertIsNone(upload_foto_os_drive(
+                os_obj=self.os, etapa=self.etapa, caminho_arquivo_local="x", nome_arquivo="x"
+            ))
+        build.assert_not_called()
+
+        # Prazo vencido: meio aberto, só uma sonda liberada entre os workers
+        cache.delete(f"drive_circuito:{self.oficina.id}:aberto")
+        self.assertEqual(estado_circuito(self.oficina.id)["estado"], "meio_aberto")
+        self.assertTrue(permitir_chamada(self.oficina.id))
+        self.assertFalse(permitir_chamada(self.oficina.id))
+        cache.delete(f"drive_circuito:{self.oficina.id}:sonda")
+
+        raiz_apagada = False
+        self.assertEqual(enviar(fotos[3]), "arquivo")
+        self.assertEqual(estado_circuito(self.oficina.id)["estado"], "fechado")
+
+    def test_upload_async_valida_oficina_e_envia_ao_drive(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse("fotos-os-upload")
+
+        with mock.patch("core.drive_async.enviar_foto_drive_async", new=mock.AsyncMock(return_value=True)) as enviar:
+            resposta = client.post(
+                url,
+                {
+                    "os": self.os.id,
+                    "etapa": self.etapa.id,
+                    "arquivo": SimpleUploadedFile("foto.jpg", b"dados", content_type="image/jpeg"),
+                },
+                format="multipart",
+            )
+
+        self.assertEqual(resposta.status_code, 201, resposta.content)
+        foto = FotoOS.objects.get(id=resposta.json()["id"])
+        self.assertEqual((foto.os_id, foto.etapa_id, foto.tipo), (self.os.id, self.etapa.id, "LIVRE"))
+        self.assertEqual(foto.tirada_por.user, self.user)
+        enviar.assert_awaited_once()
+        self.assertEqual(enviar.await_args.args[0].id, foto.id)
+
+        # OS de outra oficina: recusada antes de gravar ou chamar o Drive
+        outra = Oficina.objects.create(nome="Outra")
+        os_outra = OS.objects.create(oficina=outra, codigo="OUT-1", placa="XYZ9Z99")
+        with mock.patch("core.drive_async.enviar_foto_drive_async", new=mock.AsyncMock()) as enviar:
+            resposta = client.post(
+                url,
+                {
+                    "os": os_outra.id,
+                    "arquivo": SimpleUploadedFile("foto.jpg", b"dados", content_type="image/jpeg"),
+                },
+                format="multipart",
+            )
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn("os", resposta.json())
+        self.assertFalse(FotoOS.objects.filter(os=os_outra).exists())
+        enviar.assert_not_awaited()
+
+
+class BenchmarkConexoesTests(TestCase):
+    def test_mede_aquisicao_com_threads_concorrentes(self):
+        saida = StringIO()
+
+        call_command("benchmark_conexoes", threads=2, iteracoes=3, stdout=saida)
+
+        self.assertIn("Aquisições: 6", saida.getvalue())
+        self.assertIn("erros: 0", saida.getvalue())
+
+
+@override_settings(DATABASE_REPLICA_ALIAS="replica", REPLICA_LAG_CHECAGEM_SEGUNDOS=0)
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        db_router._estado_atraso.update(checado_em=None, disponivel=False)
+        cache.clear()
+        self.router = db_router.ReplicaRouter()
+        self.middleware = db_router.ReplicaMiddleware(lambda request: None)
+        self.lista_os = OSViewSet.as_view({"get": "list", "post": "create"})
+        patcher = mock.patch("core.db_router.medir_atraso_replica", return_value=0.0)
+        self.medir_atraso = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _requisicao(self, metodo="get"):
+        request = getattr(RequestFactory(), metodo)("/api/os/", HTTP_AUTHORIZATION="Bearer abc")
+        self.middleware.process_request(request)
+        self.middleware.process_view(request, self.lista_os, (), {})
+        return request
+
+    def test_lista_le_da_replica_e_escrita_fixa_no_primario(self):
+        request = self._requisicao()
+        self.assertEqual(self.router.db_for_read(OS), "replica")
+
+        self.assertEqual(self.router.db_for_write(OS), "default")
+        self.assertIsNone(self.router.db_for_read(OS))
+        self.middleware.process_response(request, None)
+
+        # Mesmo cliente logo depois de escrever: continua no primário
+        self._requisicao()
+        self.assertIsNone(self.router.db_for_read(OS))
+
+    def test_acoes_fora_da_lista_e_replica_atrasada_ficam_no_primario(self):
+        self._requisicao("post")
+        self.assertIsNone(self.router.db_for_read(OS))
+
+        self._requisicao()
+        self.assertEqual(self.router.db_for_read(OS), "replica")
+
+        self.medir_atraso.return_value = 30.0
+        self.assertIsNone(self.router.db_for_read(OS))
+
+
+@override_settings(DATABASE_REPLICA_ALIAS="replica", REPLICA_LAG_CHECAGEM_SEGUNDOS=0)
+class ReplicaSqliteTests(APITestCase):
+    """
+    Réplica de verdade: um segundo SQLite migrado à parte e sem replicação, de
+    modo que o conteúdo da lista mostra de qual banco ela foi lida. Fora dos
+    testes, o equivalente é ``DATABASE_REPLICA_URL=sqlite:///replica.sqlite3``.
+
+    O alias é registrado depois do setUpClass porque o runner só prepara os
+    bancos do settings; cada teste ainda roda numa transação nos dois bancos.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._dir_replica = tempfile.mkdtemp()
+        connections.settings["replica"] = {
+            **connections.settings["default"],
+            "NAME": os.path.join(cls._dir_replica, "replica.sqlite3"),
+            "TEST": {"MIRROR": None},
+        }
+        cls.databases = cls.databases | {"replica"}
+        # allow_migrate só recusa o alias configurado como réplica
+        with override_settings(DATABASE_REPLICA_ALIAS=None):
+            call_command("migrate", database="replica", verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.databases = cls.databases - {"replica"}
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+        shutil.rmtree(cls._dir_replica, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        db_router._estado_atraso.update(checado_em=None, disponivel=False)
+        cache.clear()
+        self.user = User.objects.create_user(username="replica", password="pass")
+        self.oficina = Oficina.objects.create(nome="Oficina Réplica")
+        usuario_oficina = UsuarioOficina.objects.create(
+            user=self.user, oficina=self.oficina, papel="GERENTE", ativo=True
+        )
+        for obj in (self.user, self.oficina, usuario_oficina):
+            type(obj).objects.using("replica").bulk_create([obj])
+        OS.objects.using("replica").bulk_create([OS(oficina=self.oficina, codigo="SO-NA-REPLICA")])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def _codigos_listados(self):
+        resposta = self.client.get("/api/os/")
+        self.assertEqual(resposta.status_code, 200)
+        return {item["codigo"] for item in resposta.json()}
+
+    def test_lista_le_da_replica_e_escrita_fixa_o_cliente_no_primario(self):
+        self.assertEqual(self._codigos_listados(), {"SO-NA-REPLICA"})
+
+        with mock.patch("core.views.criar_pasta_os"):
+            resposta = self.client.post(
+                "/api/os/", {"codigo": "NO-PRIMARIO", "modelo_veiculo": "Gol"}, format="json"
+            )
+        self.assertEqual(resposta.status_code, 201, resposta.content)
+        self.assertFalse(OS.objects.using("replica").filter(codigo="NO-PRIMARIO").exists())
+
+        # Mesmo cliente logo depois de escrever: a lista vem do primário
+        self.assertEqual(self._codigos_listados(), {"NO-PRIMARIO"})
+
+        cache.clear()
+        self.assertEqual(self._codigos_listados(), {"SO-NA-REPLICA"})
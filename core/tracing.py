@@ -0,0 +1,304 @@
+"""
+Spans de tracing leves para o pipeline de sync e Drive.
+
+``span("nome", **atributos)`` abre um span filho do span corrente (contextvar);
+sem span corrente, abre a raiz de um novo trace. Quando a raiz termina, o
+trace inteiro vai para os exportadores configurados:
+
+- ``TRACING_JSONL_PATH``: uma linha JSON por span, anexada ao arquivo;
+- ``TRACING_OTLP_ENDPOINT``: POST OTLP/HTTP (JSON) em ``<endpoint>/v1/traces``,
+  feito por uma única thread do processo, que consome uma fila de até
+  ``TRACING_OTLP_FILA_MAX`` traces. Fila cheia (coletor lento ou fora do ar)
+  descarta o trace em vez de segurar a resposta ou acumular threads.
+
+Sem nenhum exportador configurado, ``span`` não coleta nada (e devolve um
+span nulo, cujo ``definir`` é ignorado).
+O filtro ``TraceLogFilter`` (ver LOGGING) põe ``trace_id``/``span_id`` em todos
+os registros de log emitidos dentro de um span.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
+
+logger = logging.getLogger(__name__)
+
+_span_atual: ContextVar[Optional["Span"]] = ContextVar("span_atual", default=None)
+_lock_arquivo = threading.Lock()
+
+_lock_otlp = threading.Lock()
+_fila_otlp: Optional[queue.Queue] = None
+_worker_otlp: Optional[threading.Thread] = None
+_otlp_descartados = 0
+
+
+class Span:
+    def __init__(self, nome: str, trace_id: str, parent: Optional["Span"], atributos: dict):
+        self.nome = nome
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.atributos = atributos
+        self.status = "ok"
+        self.inicio_ns = time.time_ns()
+        self.fim_ns: Optional[int] = None
+        # Todos os spans do trace ficam na lista da raiz
+        self.spans_do_trace: List["Span"] = parent.spans_do_trace if parent else []
+        self.spans_do_trace.append(self)
+
+    @property
+    def duracao_ms(self) -> float:
+        return ((self.fim_ns or time.time_ns()) - self.inicio_ns) / 1_000_000
+
+    def definir(self, **atributos):
+        self.atributos.update(atributos)
+
+    def como_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "nome": self.nome,
+            "inicio_ns": self.inicio_ns,
+            "fim_ns": self.fim_ns,
+            "duracao_ms": round(self.duracao_ms, 3),
+            "status": self.status,
+            "atributos": self.atributos,
+        }
+
+
+class _SpanNulo:
+    """Devolvido por ``span`` com o tracing desligado."""
+
+    trace_id = None
+    span_id = None
+
+    def definir(self, **atributos):
+        pass
+
+
+_SPAN_NULO = _SpanNulo()
+
+
+def tracing_ativo() -> bool:
+    return bool(
+        getattr(settings, "TRACING_JSONL_PATH", None)
+        or getattr(settings, "TRACING_OTLP_ENDPOINT", None)
+    )
+
+
+def span_atual() -> Optional[Span]:
+    return _span_atual.get()
+
+
+class TraceLogFilter(logging.Filter):
+    def filter(self, record):
+        atual = _span_atual.get()
+        record.trace_id = atual.trace_id if atual else None
+        record.span_id = atual.span_id if atual else None
+        return True
+
+
+@contextmanager
+def span(nome: str, **atributos):
+    if not tracing_ativo():
+        yield _SPAN_NULO
+        return
+
+    pai = _span_atual.get()
+    trace_id = pai.trace_id if pai else os.urandom(16).hex()
+    novo = Span(nome, trace_id, pai, atributos)
+    token = _span_atual.set(novo)
+    try:
+        yield novo
+    except BaseException as exc:
+        novo.status = "erro"
+        novo.atributos.setdefault("erro", repr(exc))
+        raise
+    finally:
+        novo.fim_ns = time.time_ns()
+        _span_atual.reset(token)
+        if pai is None:
+            exportar(novo.spans_do_trace)
+
+
+def exportar(spans: List[Span]):
+    caminho = getattr(settings, "TRACING_JSONL_PATH", None)
+    if caminho:
+        try:
+            _exportar_jsonl(caminho, spans)
+        except Exception:
+            logger.warning("Falha ao exportar spans para JSONL", exc_info=True)
+
+    endpoint = getattr(settings, "TRACING_OTLP_ENDPOINT", None)
+    if endpoint:
+        _enfileirar_otlp(endpoint, spans)
+
+
+def _exportar_jsonl(caminho: str, spans: List[Span]):
+    linhas = "".join(json.dumps(s.como_dict(), default=str) + "\n" for s in spans)
+    with _lock_arquivo, open(caminho, "a", encoding="utf-8") as arquivo:
+        arquivo.write(linhas)
+
+
+def _valor_otlp(valor) -> dict:
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+def _payload_otlp(spans: List[Span]) -> dict:
+    servico = getattr(settings, "TRACING_SERVICE_NAME", "oficina")
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": servico}}]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "core.tracing"},
+                        "spans": [
+                            {
+                                "traceId": s.trace_id,
+                                "spanId": s.span_id,
+                                "parentSpanId": s.parent_id or "",
+                                "name": s.nome,
+                                "kind": 2 if s.parent_id is None else 1,
+                                "startTimeUnixNano": str(s.inicio_ns),
+                                "endTimeUnixNano": str(s.fim_ns or s.inicio_ns),
+                                "attributes": [
+                                    {"key": chave, "value": _valor_otlp(valor)}
+                                    for chave, valor in s.atributos.items()
+                                    if valor is not None
+                                ],
+                                "status": {"code": 2 if s.status == "erro" else 1},
+                            }
+                            for s in spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def _enfileirar_otlp(endpoint: str, spans: List[Span]):
+    global _otlp_descartados
+
+    try:
+        _obter_fila_otlp().put_nowait((endpoint, spans))
+    except queue.Full:
+        with _lock_otlp:
+            _otlp_descartados += 1
+            descartados = _otlp_descartados
+        if descartados == 1 or descartados % 1000 == 0:
+            logger.warning(
+                "Fila do exportador OTLP cheia; traces descartados",
+                extra={"descartados": descartados},
+            )
+
+
+def _obter_fila_otlp() -> queue.Queue:
+    """Fila do processo, com a thread exportadora (recriadas se ela morrer, ex.: após fork)."""
+    global _fila_otlp, _worker_otlp
+
+    worker = _worker_otlp
+    if worker is not None and worker.is_alive():
+        return _fila_otlp
+    with _lock_otlp:
+        if _worker_otlp is None or not _worker_otlp.is_alive():
+            _fila_otlp = queue.Queue(maxsize=max(1, int(getattr(settings, "TRACING_OTLP_FILA_MAX", 1000))))
+            _worker_otlp = threading.Thread(
+                target=_consumir_fila_otlp, args=(_fila_otlp,), name="tracing-otlp", daemon=True
+            )
+            _worker_otlp.start()
+        return _fila_otlp
+
+
+def _consumir_fila_otlp(fila: queue.Queue):
+    while True:
+        endpoint, spans = fila.get()
+        try:
+            _enviar_otlp(endpoint, json.dumps(_payload_otlp(spans)).encode())
+        except Exception:
+            logger.warning("Falha ao exportar spans para OTLP", exc_info=True)
+        finally:
+            fila.task_done()
+
+
+def _enviar_otlp(endpoint: str, corpo: bytes):
+    url = endpoint.rstrip("/") + "/v1/traces"
+    requisicao = urllib.request.Request(
+        url, data=corpo, headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(requisicao, timeout=5):
+            pass
+    except Exception:
+        logger.warning("Falha ao enviar spans ao coletor OTLP", extra={"url": url}, exc_info=True)
+
+
+class TracingMiddleware:
+    """Abre o span raiz de cada requisição da /api/."""
+
+    caminhos = ("/api/",)
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not request.path.startswith(self.caminhos) or not tracing_ativo():
+            return self.get_response(request)
+
+        with span("http.request", method=request.method, path=request.path) as raiz:
+            response = self.get_response(request)
+            self._anotar(request, response, raiz)
+        return response
+
+    async def __acall__(self, request):
+        if not request.path.startswith(self.caminhos) or not tracing_ativo():
+            return await self.get_response(request)
+
+        with span("http.request", method=request.method, path=request.path) as raiz:
+            response = await self.get_response(request)
+            self._anotar(request, response, raiz)
+        return response
+
+    def _anotar(self, request, response, raiz):
+        match = getattr(request, "resolver_match", None)
+        raiz.definir(
+            view=match.view_name if match else None,
+            status_code=response.status_code,
+        )
+        if response.status_code >= 500:
+            raiz.status = "erro"
+        # Só usa o usuário já resolvido (pela view da API): avaliar o
+        # SimpleLazyObject da sessão aqui faria consulta fora de thread no ASGI.
+        user = getattr(request, "user", None)
+        if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+            user = None
+        if getattr(user, "is_authenticated", False):
+            raiz.definir(user_id=user.id)
+        response["X-Trace-ID"] = raiz.trace_id
@@ -20,6 +20,20 @@ def get_oficina_do_usuario(user):
         return None
 
 
+async def aget_oficina_do_usuario(user):
+    """Versão async de get_oficina_do_usuario, para as views async."""
+    if not user.is_authenticated or user.is_superuser:
+        return None
+
+    try:
+        usuario_oficina = await UsuarioOficina.objects.select_related("oficina").aget(
+            user=user, ativo=True
+        )
+        return usuario_oficina.oficina
+    except UsuarioOficina.DoesNotExist:
+        return None
+
+
 def get_papel_do_usuario(user, token=None, oficina=None):
     """Retorna o papel do usuário, preferindo o claim do token JWT.
 
@@ -1,14 +1,17 @@
+import hmac
 import json
 import logging
-from datetime import date
+from datetime import date, timedelta, timezone as dt_timezone
 
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Q
+from django.http import HttpResponse
 from django.shortcuts import redirect
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from google_auth_oauthlib.flow import Flow
 from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
@@ -17,7 +20,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from .drive_circuito import estado_circuito
 from .drive_service import criar_pasta_os, upload_foto_os_drive, upload_foto_para_drive
+from .metricas import gerar_metricas, registrar_bytes_foto
 from .models import (
     ConfigFoto,
     Etapa,
@@ -25,18 +30,23 @@ from .models import (
     OS,
     OSEtapaStatus,
     ObservacaoEtapaOS,
+    OSArquivada,
     Oficina,
     OficinaDriveConfig,
+    RegistroExcluido,
+    SyncJob,
     UsuarioOficina,
 )
 from .serializers import (
     ConfigFotoSerializer,
     EtapaSerializer,
+    FotoOSLoteSerializer,
     FotoOSSerializer,
     ObservacaoEtapaOSSerializer,
+    OSEtapaStatusSerializer,
     OSSerializer,
     OficinaSerializer,
-    PwaVeiculoEmProducaoSerializer,
+    SyncJobSerializer,
     UsuarioOficinaSerializer,
 )
 from .permissions import (
@@ -46,7 +56,17 @@ from .permissions import (
     IsOficinaUser,
     IsOSPermission,
 )
-from .utils import get_oficina_do_usuario, get_papel_do_usuario
+from .services.arquivamento import (
+    ConflitoReidratacao,
+    agendar_restauracao_arquivos,
+    reidratar_os,
+)
+from .services.busca_os import buscar_os
+from .services.cache import ESCOPO_ETAPAS, ESCOPO_OS, obter_ou_calcular
+from .services.etapas import obter_grafo_etapas
+from .services.os_detalhe import anotar_versao_detalhe, montar_detalhe_painel, versao_detalhe
+from .services.timeline import obter_timeline, preparar_timelines
+from .utils import aget_oficina_do_usuario, get_oficina_do_usuario, get_papel_do_usuario
 
 logger = logging.getLogger(__name__)
 
@@ -55,23 +75,7 @@ class AuthMeView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-
-        payload = {
-            "id": user.id,
-            "username": user.username,
-            "full_name": user.get_full_name() or user.username,
-        }
-
-        oficina = get_oficina_do_usuario(user)
-        if oficina is not None:
-            payload["oficina_id"] = oficina.id
-
-        papel = get_papel_do_usuario(user, getattr(request, "auth", None))
-        if papel:
-            payload["papel"] = papel
-
-        return Response(payload)
+        return Response(montar_dados_usuario(request.user, getattr(request, "auth", None)))
 
 
 class OficinaViewSet(viewsets.ModelViewSet):
@@ -195,6 +199,29 @@ class OSViewSet(viewsets.ModelViewSet):
     )
     serializer_class = OSSerializer
     permission_classes = [IsAuthenticated, IsOSPermission]
+    acoes_na_replica = ("list", "detalhe_painel")
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        incluir = self.request.query_params.get("incluir", "") if self.request else ""
+        context["incluir_timeline"] = "timeline" in incluir.split(",")
+        return context
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        os_lista = list(page if page is not None else queryset)
+
+        # Fotos completas ficam no detalhe (/api/os/<id>/) e em /api/fotos-os/?os=
+        context = self.get_serializer_context()
+        context["resumo_fotos"] = montar_resumo_fotos(os_lista)
+        if context["incluir_timeline"]:
+            preparar_timelines(os_lista)
+        serializer = self.get_serializer_class()(os_lista, many=True, context=context)
+
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
     def get_queryset(self):
         """
@@ -210,6 +237,10 @@ class OSViewSet(viewsets.ModelViewSet):
             'observacoes_etapas__etapa', 'observacoes_etapas__criado_por__user'
         )
 
+        if self.action == "detalhe_painel":
+            # Observações e fotos só são buscadas depois de conferir a versão
+            base_qs = anotar_versao_detalhe(base_qs.prefetch_related(None))
+
         if user.is_superuser:
             qs = base_qs.all()
         else:
@@ -221,16 +252,10 @@ class OSViewSet(viewsets.ModelViewSet):
 
         params = self.request.query_params
 
-        # 🔍 Busca geral
-        search = params.get("search")
+        # 🔍 Busca geral (placa/código normalizados, ver core.services.busca_os)
+        search = (params.get("search") or "").strip()
         if search:
-            search = search.strip()
-            if search:
-                qs = qs.filter(
-                    Q(codigo__icontains=search) |
-                    Q(placa__icontains=search) |
-                    Q(nome_cliente__icontains=search)
-                )
+            qs = buscar_os(qs, search)
 
         # 🎫 Filtro por status (campo 'aberta' boolean)
         status_param = params.get("status")
@@ -244,8 +269,11 @@ class OSViewSet(viewsets.ModelViewSet):
         if etapa_id:
             qs = qs.filter(etapa_atual_id=etapa_id)
 
-        # Ordenação padrão: OS mais recentes primeiro
-        qs = qs.order_by("-data_entrada", "-criado_em")
+        # Ordenação padrão: OS mais recentes primeiro (na busca, relevância antes)
+        if search:
+            qs = qs.order_by("relevancia_busca", "-data_entrada", "-criado_em")
+        else:
+            qs = qs.order_by("-data_entrada", "-criado_em")
 
         return qs
 
@@ -300,34 +328,9 @@ class OSViewSet(viewsets.ModelViewSet):
         )
 
     def _montar_timeline(self, os_obj):
-        etapas = (
-            Etapa.objects.filter(oficina=os_obj.oficina, ativa=True)
-            .order_by("ordem", "id")
-            .all()
-        )
-
-        status_map = {
-            item.etapa_id: item
-            for item in OSEtapaStatus.objects.filter(os=os_obj, etapa__in=etapas)
-        }
-
-        timeline = []
-        for etapa in etapas:
-            status_obj = status_map.get(etapa.id)
-            concluida_em = status_obj.concluida_em if status_obj else None
-
-            timeline.append(
-                {
-                    "etapa": etapa.id,
-                    "etapa_nome": etapa.nome,
-                    "ordem": etapa.ordem,
-                    "status": "concluida" if concluida_em else "pendente",
-                    "concluida_em": concluida_em,
-                    "is_atual": os_obj.etapa_atual_id == etapa.id,
-                }
-            )
-
-        return timeline
+        # Depois de alterar um OSEtapaStatus o snapshot em memória está velho
+        os_obj.refresh_from_db(fields=["timeline_snapshot", "timeline_versao"])
+        return obter_timeline(os_obj)
 
     def _obter_etapa_da_os(self, os_obj, etapa_id):
         try:
@@ -494,10 +497,31 @@ class OSViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK,
         )
 
+    @action(detail=True, methods=["get"], url_path="detalhe-painel")
+    def detalhe_painel(self, request, pk=None):
+        """
+        OS, timeline, observações e fotos por etapa numa resposta só (tela de
+        detalhe do painel). A versão vai no ETag: com ``If-None-Match`` igual
+        a resposta é 304 depois de uma única consulta da OS.
+        """
+        os_obj = self.get_object()
+        versao = versao_detalhe(os_obj)
+        etag = f'"{versao}"'
+
+        if etag in request.headers.get("If-None-Match", ""):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            dados = montar_detalhe_painel(os_obj, request, versao)
+            response = Response({"versao": versao, **dados}, status=status.HTTP_200_OK)
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
     @action(detail=True, methods=["get"], url_path="timeline")
     def timeline(self, request, pk=None):
         os_obj = self.get_object()
-        return Response(self._montar_timeline(os_obj), status=status.HTTP_200_OK)
+        return Response(obter_timeline(os_obj), status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["post"], url_path="timeline/marcar-concluida")
     def marcar_etapa_concluida(self, request, pk=None):
@@ -532,15 +556,7 @@ class OSViewSet(viewsets.ModelViewSet):
             status_obj.save(update_fields=["concluida_em", "atualizado_em"])
 
             if os_obj.etapa_atual_id == etapa.id:
-                proxima_etapa = (
-                    Etapa.objects.filter(
-                        oficina=os_obj.oficina,
-                        ativa=True,
-                        ordem__gt=etapa.ordem,
-                    )
-                    .order_by("ordem", "id")
-                    .first()
-                )
+                proxima_etapa = obter_grafo_etapas(os_obj.oficina_id).proxima(etapa)
 
                 os_obj.etapa_atual = proxima_etapa
                 os_obj.save(update_fields=["etapa_atual", "atualizado_em"])
@@ -617,15 +633,7 @@ class OSViewSet(viewsets.ModelViewSet):
             serializer = OSSerializer(os_obj, context={"request": request})
             return Response(serializer.data, status=status.HTTP_200_OK)
 
-        proxima_etapa = (
-            Etapa.objects.filter(
-                oficina=os_obj.oficina,
-                ativa=True,
-                ordem__gt=etapa_atual.ordem,
-            )
-            .order_by("ordem")
-            .first()
-        )
+        proxima_etapa = obter_grafo_etapas(os_obj.oficina_id).proxima(etapa_atual)
 
         if proxima_etapa is None:
             serializer = OSSerializer(os_obj, context={"request": request})
@@ -679,11 +687,66 @@ class OSViewSet(viewsets.ModelViewSet):
         serializer = OSSerializer(os_obj, context={"request": request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+class OSArquivadaReidratarView(APIView):
+    """
+    Reidratação sob demanda de uma OS arquivada (ver core.services.arquivamento).
+    """
+
+    permission_classes = [IsAuthenticated, IsOficinaAdmin]
+
+    def post(self, request, os_id):
+        qs = OSArquivada.objects.all()
+        if not request.user.is_superuser:
+            oficina = get_oficina_do_usuario(request.user)
+            if oficina is None:
+                qs = qs.none()
+            else:
+                qs = qs.filter(oficina=oficina)
+
+        arquivada = qs.filter(os_id_original=os_id).first()
+        if arquivada is None:
+            return Response(
+                {"detail": "OS arquivada não encontrada."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        try:
+            # Tarefa de restauração gravada junto com a OS reidratada
+            with transaction.atomic():
+                os_obj = reidratar_os(arquivada, baixar_fotos=False)
+                agendar_restauracao_arquivos(os_obj)
+        except ConflitoReidratacao as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+
+        return Response(
+            OSSerializer(os_obj, context={"request": request}).data,
+            status=status.HTTP_200_OK,
+        )
+
+
+def _salvar_foto_recebida(serializer, user) -> FotoOS:
+    """Salva a FotoOS de um upload, com o vínculo do usuário em tirada_por."""
+    from .models import UsuarioOficina
+
+    usuario_oficina = None
+    oficina = get_oficina_do_usuario(user)
+    if oficina:
+        usuario_oficina = UsuarioOficina.objects.filter(
+            user=user, oficina=oficina, ativo=True
+        ).first()
+
+    # salva a foto corretamente
+    foto = serializer.save(tirada_por=usuario_oficina)
+    registrar_bytes_foto(getattr(foto.arquivo, "size", 0), "upload")
+    return foto
+
+
 class FotoOSViewSet(viewsets.ModelViewSet):
     queryset = FotoOS.objects.select_related('os', 'etapa', 'config_foto', 'tirada_por').all()
     serializer_class = FotoOSSerializer
     permission_classes = [IsAuthenticated, IsFotoOSPermission]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
+    acoes_na_replica = ("list",)
 
     def get_queryset(self):
         user = self.request.user
@@ -708,18 +771,7 @@ class FotoOSViewSet(viewsets.ModelViewSet):
         return qs
 
     def perform_create(self, serializer):
-        from .models import UsuarioOficina
-
-        user = self.request.user
-        usuario_oficina = None
-        oficina = get_oficina_do_usuario(user)
-        if oficina:
-            usuario_oficina = UsuarioOficina.objects.filter(
-                user=user, oficina=oficina, ativo=True
-            ).first()
-
-        # salva a foto corretamente
-        foto = serializer.save(tirada_por=usuario_oficina)
+        foto = _salvar_foto_recebida(serializer, self.request.user)
 
         # tenta subir pro drive
         try:
@@ -732,7 +784,7 @@ class FotoOSViewSet(viewsets.ModelViewSet):
                 )
                 if drive_file_id:
                     foto.drive_file_id = drive_file_id
-                    foto.save(update_fields=["drive_file_id"])
+                    foto.save(update_fields=["drive_file_id", "atualizado_em"])
                 else:
                     logger.warning(
                         "Upload do Drive indisponível para foto",
@@ -756,22 +808,103 @@ class FotoOSViewSet(viewsets.ModelViewSet):
         # Futuro: remover também do Drive quando integrado (S7-6 / melhorias futuras)
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=False, methods=["post"], url_path="lote")
+    def lote(self, request):
+        """
+        Várias fotos de uma OS/etapa num único multipart (``arquivos`` repetido,
+        ``config_foto`` opcional e alinhado por posição). As fotos são gravadas
+        com bulk_create e o envio ao Drive roda depois da resposta, num lote só.
+        """
+        serializer = FotoOSLoteSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+
+        fotos = criar_fotos_em_lote(
+            os_obj=dados["os"],
+            etapa=dados["etapa"],
+            itens=dados["itens"],
+            usuario_oficina=dados["usuario_oficina"],
+        )
+        enfileirar_envio_drive([foto.id for foto in fotos], dados["os"].oficina_id)
+
+        return Response(
+            FotoOSSerializer(fotos, many=True, context={"request": request}).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class FotoOSUploadView(AsyncAPIView):
+    """
+    Mesmo upload do POST /api/fotos-os/, mas async (servido pelo uvicorn): a
+    gravação no banco roda em thread e o envio ao Drive usa o cliente httpx de
+    core.drive_async, sem prender um worker enquanto o Drive responde.
+    """
+    permission_classes = [IsAuthenticated, IsFotoOSPermission]
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+
+    async def post(self, request):
+        from .drive_async import enviar_foto_drive_async
+
+        serializer = FotoOSSerializer(data=request.data, context={"request": request})
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        foto = await sync_to_async(_salvar_foto_recebida)(serializer, request.user)
+
+        if foto.etapa_id and not await enviar_foto_drive_async(foto):
+            logger.warning(
+                "Upload do Drive indisponível para foto",
+                extra={"oficina_id": foto.os.oficina_id, "os_id": foto.os_id, "foto_id": foto.id},
+            )
+
+        dados = await sync_to_async(lambda: serializer.data)()
+        return Response(dados, status=status.HTTP_201_CREATED)
+
 
 from django.utils import timezone
 
 from .models import Etapa, UsuarioOficina, Oficina  # garante esses imports
-from .services.fotos import criar_foto_os
+from .services.fotos import (
+    criar_foto_os,
+    criar_fotos_em_lote,
+    enfileirar_envio_drive,
+    montar_resumo_fotos,
+)
 from .services.sync import SyncService
+from .services.pwa import (
+    limite_retencao_excluidos,
+    montar_bootstrap,
+    montar_dados_usuario,
+    montar_veiculos_em_producao,
+)
+from .services.sync_jobs import criar_sync_job
 
 
 class SyncView(APIView):
     """
     Endpoint especial para sincronização em lote das OS criadas offline no PWA.
+
+    Com ``?async=1`` (ou ``Prefer: respond-async``) o payload é salvo como
+    SyncJob e a resposta é 202; o progresso fica em /api/sync/jobs/<id>/.
     """
 
     permission_classes = [IsAuthenticated]
 
+    def _modo_assincrono(self, request):
+        if request.query_params.get("async") in {"1", "true"}:
+            return True
+        return "respond-async" in request.headers.get("Prefer", "")
+
     def post(self, request):
+        if self._modo_assincrono(request):
+            job, erro = criar_sync_job(request.user, request.data)
+            if erro:
+                return Response(erro, status=status.HTTP_400_BAD_REQUEST)
+
+            data = SyncJobSerializer(job).data
+            data["status_url"] = reverse("sync-job-detail", args=[job.id])
+            return Response(data, status=status.HTTP_202_ACCEPTED)
+
         service = SyncService(request.user, request=request)
         resultados, erro = service.processar(request.data)
 
@@ -790,113 +923,175 @@ class SyncView(APIView):
         return Response(payload, status=status.HTTP_200_OK)
 
 
+class SyncJobDetailView(APIView):
+    """
+    Status e resultados por item de uma sincronização assíncrona.
+    Cada usuário só enxerga os próprios jobs (superusuário vê todos).
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        qs = SyncJob.objects.all()
+        if not request.user.is_superuser:
+            qs = qs.filter(user=request.user)
+
+        job = qs.filter(pk=pk).first()
+        if job is None:
+            return Response(
+                {"detail": "Sincronização não encontrada."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        return Response(SyncJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
 class PwaVeiculosEmProducaoView(APIView):
     permission_classes = [IsAuthenticated]
     authentication_classes = [JWTAuthentication]
+    acoes_na_replica = ("get",)
 
     def get(self, request):
-        user = request.user
+        return Response(montar_veiculos_em_producao(request.user), status=status.HTTP_200_OK)
 
-        if user.is_superuser:
-            queryset = OS.objects.select_related("etapa_atual", "oficina").filter(aberta=True)
-        else:
-            oficina = get_oficina_do_usuario(user)
-            if oficina is None:
-                return Response([], status=status.HTTP_200_OK)
-
-            queryset = OS.objects.select_related("etapa_atual", "oficina").filter(
-                oficina=oficina,
-                aberta=True,
-            )
 
-        ordens = list(queryset.order_by("-atualizado_em"))
+class PwaBootstrapView(APIView):
+    """
+    Pacote único de inicialização do PWA (usuário, oficina, etapas, ConfigFoto
+    e veículos em produção), substituindo as chamadas separadas a
+    /api/auth/me/, /api/etapas/, /api/config-fotos/ e
+    /api/pwa/veiculos-em-producao/.
+
+    A ``versao`` do pacote vai no ETag: com ``If-None-Match`` igual, a
+    resposta é 304 sem corpo. A compactação fica a cargo do
+    ApiCompressionMiddleware.
+    """
 
-        if not ordens:
-            return Response([], status=status.HTTP_200_OK)
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
 
-        os_ids = [os_obj.id for os_obj in ordens]
-        fotos_por_os = {}
+    def get(self, request):
+        bundle, versao = montar_bootstrap(request)
+        etag = f'"{versao}"'
 
-        for foto in FotoOS.objects.filter(os_id__in=os_ids).select_related("etapa"):
-            fotos_por_os.setdefault(foto.os_id, []).append(foto)
+        if etag in request.headers.get("If-None-Match", ""):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({"versao": versao, **bundle}, status=status.HTTP_200_OK)
 
-        primeira_etapa_cache = {}
-        configs_cache = {}
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
 
-        def obter_etapa_atual(os_obj):
-            if os_obj.etapa_atual:
-                return os_obj.etapa_atual
 
-            oficina_id = os_obj.oficina_id
-            if oficina_id not in primeira_etapa_cache:
-                primeira_etapa_cache[oficina_id] = (
-                    Etapa.objects.filter(oficina_id=oficina_id, ativa=True)
-                    .order_by("ordem")
-                    .first()
-                )
-            return primeira_etapa_cache[oficina_id]
+class PwaChangesView(APIView):
+    """
+    Delta sync do PWA.
+
+    Sem ``since`` devolve o estado completo das OS abertas da oficina. Com
+    ``since`` devolve apenas OS, fotos, status de etapa e observações alterados
+    depois do cursor, mais os registros excluídos. O ``cursor`` da resposta é o
+    ``since`` da próxima chamada; como a consulta volta
+    PWA_CHANGES_SOBREPOSICAO_SEGUNDOS antes dele, o cliente deve aplicar os
+    registros como upsert por id. Um ``since`` mais antigo que
+    PWA_EXCLUIDOS_RETENCAO_DIAS é tratado como ausente (``completo``).
+    """
 
-        def obter_configs(oficina_id, etapa_id):
-            chave = (oficina_id, etapa_id)
-            if chave not in configs_cache:
-                if etapa_id is None:
-                    configs_cache[chave] = []
-                else:
-                    configs_cache[chave] = list(
-                        ConfigFoto.objects.filter(
-                            oficina_id=oficina_id,
-                            etapa_id=etapa_id,
-                            obrigatoria=True,
-                            ativa=True,
-                        ).values_list("id", flat=True)
-                    )
-            return configs_cache[chave]
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
 
-        def build_drive_thumb(drive_file_id):
-            if not drive_file_id:
-                return None
-            return f"https://drive.google.com/thumbnail?id={drive_file_id}&sz=w800"
+    def _formatar_cursor(self, valor):
+        return valor.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
-        resposta = []
+    def get(self, request):
+        cursor = timezone.now()
 
-        for os_obj in ordens:
-            etapa = obter_etapa_atual(os_obj)
-            etapa_id = etapa.id if etapa else None
-            config_ids = obter_configs(os_obj.oficina_id, etapa_id)
-            fotos_da_os = fotos_por_os.get(os_obj.id, [])
+        since = None
+        since_param = request.query_params.get("since")
+        if since_param:
+            since = parse_datetime(since_param)
+            if since is None:
+                return Response(
+                    {"detail": "Parâmetro 'since' inválido."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, dt_timezone.utc)
+            # Tombstones anteriores ao cursor já podem ter sido apagados
+            if since < limite_retencao_excluidos():
+                since = None
+
+        resposta = {
+            "cursor": self._formatar_cursor(cursor),
+            "completo": since is None,
+            "os": [],
+            "fotos": [],
+            "status_etapas": [],
+            "observacoes": [],
+            "excluidos": [],
+        }
 
-            configs_atendidos = {
-                foto.config_foto_id
-                for foto in fotos_da_os
-                if foto.config_foto_id in config_ids
-            }
-            faltantes = max(len(config_ids) - len(configs_atendidos), 0)
+        user = request.user
+        oficina = get_oficina_do_usuario(user)
+        if oficina is None and not user.is_superuser:
+            return Response(resposta, status=status.HTTP_200_OK)
 
-            thumb_url = None
-            if etapa_id is not None:
-                fotos_na_etapa = [f for f in fotos_da_os if f.etapa_id == etapa_id]
-                if fotos_na_etapa:
-                    ultima_foto = max(fotos_na_etapa, key=lambda f: (f.tirada_em, f.id))
-                    thumb_url = build_drive_thumb(ultima_foto.drive_file_id)
+        os_qs = OS.objects.select_related("oficina", "etapa_atual").prefetch_related(
+            "fotos", "observacoes_etapas__etapa", "observacoes_etapas__criado_por__user"
+        )
+        fotos_qs = FotoOS.objects.select_related(
+            "os", "etapa", "config_foto", "tirada_por__user"
+        )
+        status_qs = OSEtapaStatus.objects.select_related("os", "etapa")
+        observacoes_qs = ObservacaoEtapaOS.objects.select_related(
+            "etapa", "criado_por__user"
+        )
+        excluidos_qs = RegistroExcluido.objects.all()
 
-            resposta.append(
-                {
-                    "os_id": os_obj.id,
-                    "codigo": os_obj.codigo,
-                    "placa": os_obj.placa,
-                    "modelo_veiculo": os_obj.modelo_veiculo,
-                    "etapa_atual": {
-                        "id": etapa_id,
-                        "nome": etapa.nome if etapa else None,
-                    },
-                    "faltam_fotos_obrigatorias": faltantes,
-                    "thumb_url": thumb_url,
-                }
+        if oficina is not None:
+            os_qs = os_qs.filter(oficina=oficina)
+            fotos_qs = fotos_qs.filter(os__oficina=oficina)
+            status_qs = status_qs.filter(os__oficina=oficina)
+            observacoes_qs = observacoes_qs.filter(os__oficina=oficina)
+            excluidos_qs = excluidos_qs.filter(oficina=oficina)
+
+        if since is None:
+            os_qs = os_qs.filter(aberta=True)
+            fotos_qs = fotos_qs.filter(os__aberta=True)
+            status_qs = status_qs.filter(os__aberta=True)
+            observacoes_qs = observacoes_qs.filter(os__aberta=True)
+            excluidos_qs = excluidos_qs.none()
+        else:
+            desde = since - timedelta(
+                seconds=getattr(settings, "PWA_CHANGES_SOBREPOSICAO_SEGUNDOS", 0)
             )
+            os_qs = os_qs.filter(atualizado_em__gt=desde)
+            fotos_qs = fotos_qs.filter(atualizado_em__gt=desde)
+            status_qs = status_qs.filter(atualizado_em__gt=desde)
+            observacoes_qs = observacoes_qs.filter(atualizado_em__gt=desde)
+            excluidos_qs = excluidos_qs.filter(excluido_em__gt=desde)
+
+        context = {"request": request}
+        resposta["os"] = OSSerializer(
+            os_qs.order_by("atualizado_em", "id"), many=True, context=context
+        ).data
+        resposta["fotos"] = FotoOSSerializer(
+            fotos_qs.order_by("atualizado_em", "id"), many=True, context=context
+        ).data
+        resposta["status_etapas"] = OSEtapaStatusSerializer(
+            status_qs.order_by("atualizado_em", "id"), many=True, context=context
+        ).data
+        resposta["observacoes"] = ObservacaoEtapaOSSerializer(
+            observacoes_qs.order_by("atualizado_em", "id"), many=True, context=context
+        ).data
+        resposta["excluidos"] = [
+            {"modelo": modelo, "id": objeto_id, "os_id": os_id}
+            for modelo, objeto_id, os_id in excluidos_qs.values_list(
+                "modelo", "objeto_id", "os_id_original"
+            )
+        ]
 
-        serializer = PwaVeiculoEmProducaoSerializer(data=resposta, many=True)
-        serializer.is_valid(raise_exception=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(resposta, status=status.HTTP_200_OK)
 
 
 class ProximaEtapaAPIView(APIView):
@@ -946,15 +1141,7 @@ class ProximaEtapaAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        proxima_etapa = (
-            Etapa.objects.filter(
-                oficina=os_obj.oficina,
-                ativa=True,
-                ordem__gt=etapa_atual.ordem,
-            )
-            .order_by("ordem", "id")
-            .first()
-        )
+        proxima_etapa = obter_grafo_etapas(os_obj.oficina_id).proxima(etapa_atual)
 
         if proxima_etapa is None:
             return Response({"proxima_etapa": None}, status=status.HTTP_200_OK)
@@ -974,6 +1161,7 @@ class DashboardResumoView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    acoes_na_replica = ("get",)
 
     def get_oficina_do_usuario(self, request):
         """
@@ -994,14 +1182,22 @@ class DashboardResumoView(APIView):
 
     def get(self, request, *args, **kwargs):
         oficina = self.get_oficina_do_usuario(request)
+        hoje = timezone.localdate()
 
+        data = obter_ou_calcular(
+            oficina.id if oficina is not None else None,
+            (ESCOPO_OS, ESCOPO_ETAPAS),
+            "dashboard_resumo",
+            lambda: self._montar_resumo(oficina, hoje),
+            hoje.isoformat(),
+        )
+        return Response(data)
+
+    def _montar_resumo(self, oficina, hoje):
         qs_os = OS.objects.all()
         if oficina is not None:
             qs_os = qs_os.filter(oficina=oficina)
 
-        # Hoje (na timezone configurada)
-        hoje = timezone.localdate()
-
         # ✅ Seu model tem campo "aberta" (BooleanField), não "status"
         os_abertas = qs_os.filter(aberta=True).count()
 
@@ -1035,10 +1231,10 @@ class DashboardResumoView(APIView):
             "etapas": etapas_cards,
         }
 
-        return Response(data)
+        return data
 
 
-class OficinaDriveStatusView(APIView):
+class OficinaDriveStatusView(AsyncAPIView):
     """
     Retorna o status da integração de Google Drive para a oficina do usuário logado.
     Usado pelo painel para mostrar se está conectado ou não.
@@ -1048,20 +1244,17 @@ class OficinaDriveStatusView(APIView):
     """
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
+    async def get(self, request):
         user = request.user
-        oficina = get_oficina_do_usuario(user)
+        oficina = await aget_oficina_do_usuario(user)
 
         # Se for superuser e não tiver oficina em get_oficina_do_usuario,
         # tenta pegar ?oficina_id=, mas se não vier, apenas mostra "sem drive".
         if user.is_superuser and oficina is None:
             oficina_id = request.query_params.get("oficina_id")
             if oficina_id:
-                try:
-                    oficina = Oficina.objects.get(id=oficina_id)
-                except Oficina.DoesNotExist:
-                    # oficina_id inválida -> considera sem integração
-                    oficina = None
+                # oficina_id inválida -> considera sem integração
+                oficina = await Oficina.objects.filter(id=oficina_id).afirst()
 
         # Se ainda assim não tiver oficina, considera "sem integração", mas 200 OK
         if oficina is None:
@@ -1076,14 +1269,15 @@ class OficinaDriveStatusView(APIView):
             )
 
         # Tenta buscar config de Drive
-        try:
-            config = oficina.drive_config
+        config = await OficinaDriveConfig.objects.filter(oficina=oficina).afirst()
+        if config is not None:
             data = {
                 "has_drive": True,
                 "ativo": config.ativo,
                 "root_folder_id": config.root_folder_id,
+                "circuito": await sync_to_async(estado_circuito, thread_sensitive=False)(oficina.id),
             }
-        except OficinaDriveConfig.DoesNotExist:
+        else:
             data = {
                 "has_drive": False,
                 "ativo": False,
@@ -1133,6 +1327,8 @@ class GoogleDriveAuthURLView(APIView):
                     status=status.HTTP_404_NOT_FOUND,
                 )
 
+        from google_auth_oauthlib.flow import Flow
+
         flow = Flow.from_client_secrets_file(
             settings.GOOGLE_DRIVE_CLIENT_SECRETS_FILE,
             scopes=settings.GOOGLE_DRIVE_SCOPES,
@@ -1151,7 +1347,30 @@ class GoogleDriveAuthURLView(APIView):
 
         return Response({"authorization_url": authorization_url})
 
-class GoogleDriveOAuth2CallbackView(APIView):
+def _trocar_codigo_por_credenciais(code: str) -> dict:
+    """Troca o code do OAuth2 por tokens (chamada bloqueante da lib do Google)."""
+    from google_auth_oauthlib.flow import Flow
+
+    flow = Flow.from_client_secrets_file(
+        settings.GOOGLE_DRIVE_CLIENT_SECRETS_FILE,
+        scopes=settings.GOOGLE_DRIVE_SCOPES,
+        redirect_uri=settings.GOOGLE_DRIVE_REDIRECT_URI,
+    )
+    flow.fetch_token(code=code)
+    creds = flow.credentials
+
+    # Monta o JSON que usaremos depois no drive_service.py
+    return {
+        "token": creds.token,
+        "refresh_token": creds.refresh_token,
+        "token_uri": creds.token_uri,
+        "client_id": creds.client_id,
+        "client_secret": creds.client_secret,
+        "scopes": creds.scopes,
+    }
+
+
+class GoogleDriveOAuth2CallbackView(AsyncAPIView):
     """
     Endpoint de callback do OAuth2 do Google.
     - Troca o "code" por tokens
@@ -1163,23 +1382,25 @@ class GoogleDriveOAuth2CallbackView(APIView):
     permission_classes = []
     authentication_classes = []
 
-    def get(self, request):
+    async def get(self, request):
+        from .drive_async import ClienteDriveAsync
+
+        redirect_url = getattr(
+            settings,
+            "GOOGLE_DRIVE_POST_CONNECT_REDIRECT",
+            "/painel/integracoes/drive/",
+        )
+
         error = request.GET.get("error")
         if error:
             # Erro vindo do Google (usuário cancelou, etc.)
-            return redirect(
-                f"{getattr(settings, 'GOOGLE_DRIVE_POST_CONNECT_REDIRECT', '/painel/integracoes/drive/')}"
-                f"?status=error&msg={error}"
-            )
+            return redirect(f"{redirect_url}?status=error&msg={error}")
 
         code = request.GET.get("code")
         state = request.GET.get("state", "")
 
         if not code or not state:
-            return redirect(
-                f"{getattr(settings, 'GOOGLE_DRIVE_POST_CONNECT_REDIRECT', '/painel/integracoes/drive/')}"
-                "?status=error&msg=missing_code_or_state"
-            )
+            return redirect(f"{redirect_url}?status=error&msg=missing_code_or_state")
 
         # Extrai oficina_id do state ("oficina:123")
         oficina_id = None
@@ -1187,50 +1408,21 @@ class GoogleDriveOAuth2CallbackView(APIView):
             oficina_id = state.split(":", 1)[1]
 
         if not oficina_id:
-            return redirect(
-                f"{getattr(settings, 'GOOGLE_DRIVE_POST_CONNECT_REDIRECT', '/painel/integracoes/drive/')}"
-                "?status=error&msg=invalid_state"
-            )
-
-        try:
-            oficina = Oficina.objects.get(id=oficina_id)
-        except Oficina.DoesNotExist:
-            return redirect(
-                f"{getattr(settings, 'GOOGLE_DRIVE_POST_CONNECT_REDIRECT', '/painel/integracoes/drive/')}"
-                "?status=error&msg=oficina_not_found"
-            )
+            return redirect(f"{redirect_url}?status=error&msg=invalid_state")
 
-        # Refaz o flow para buscar o token
-        flow = Flow.from_client_secrets_file(
-            settings.GOOGLE_DRIVE_CLIENT_SECRETS_FILE,
-            scopes=settings.GOOGLE_DRIVE_SCOPES,
-            redirect_uri=settings.GOOGLE_DRIVE_REDIRECT_URI,
-        )
+        oficina = await Oficina.objects.filter(id=oficina_id).afirst()
+        if oficina is None:
+            return redirect(f"{redirect_url}?status=error&msg=oficina_not_found")
 
         try:
-            flow.fetch_token(code=code)
+            cred_data = await sync_to_async(_trocar_codigo_por_credenciais, thread_sensitive=False)(code)
         except Exception:
-            return redirect(
-                f"{getattr(settings, 'GOOGLE_DRIVE_POST_CONNECT_REDIRECT', '/painel/integracoes/drive/')}"
-                "?status=error&msg=token_fetch_failed"
-            )
-
-        creds = flow.credentials
-
-        # Monta o JSON que usaremos depois no drive_service.py
-        cred_data = {
-            "token": creds.token,
-            "refresh_token": creds.refresh_token,
-            "token_uri": creds.token_uri,
-            "client_id": creds.client_id,
-            "client_secret": creds.client_secret,
-            "scopes": creds.scopes,
-        }
+            return redirect(f"{redirect_url}?status=error&msg=token_fetch_failed")
 
         cred_json = json.dumps(cred_data)
 
         # Cria ou atualiza a config
-        config, created = OficinaDriveConfig.objects.get_or_create(
+        config, created = await OficinaDriveConfig.objects.aget_or_create(
             oficina=oficina,
             defaults={
                 "credentials_json": cred_json,
@@ -1245,31 +1437,35 @@ class GoogleDriveOAuth2CallbackView(APIView):
 
         # Cria pasta raiz se ainda não existir
         if not config.root_folder_id:
-            from googleapiclient.discovery import build
-
-            service = build("drive", "v3", credentials=creds)
-
-            folder_metadata = {
-                "name": f"CheckAuto - {oficina.nome}",
-                "mimeType": "application/vnd.google-apps.folder",
-            }
-
             try:
-                folder = service.files().create(
-                    body=folder_metadata,
-                    fields="id",
-                ).execute()
-                config.root_folder_id = folder.get("id")
+                async with ClienteDriveAsync(config) as drive:
+                    config.root_folder_id = await drive.criar_pasta(f"CheckAuto - {oficina.nome}")
             except Exception:
                 # Se der erro, mantemos root_folder_id vazio
-                pass
-
-        config.save()
+                logger.warning(
+                    "Falha ao criar pasta raiz no Drive",
+                    extra={"oficina_id": oficina.id},
+                    exc_info=True,
+                )
 
-        redirect_url = getattr(
-            settings,
-            "GOOGLE_DRIVE_POST_CONNECT_REDIRECT",
-            "/painel/integracoes/drive/",
-        )
+        await config.asave()
 
         return redirect(f"{redirect_url}?status=ok")
+
+
+def metricas_view(request):
+    """
+    Endpoint /metrics (Prometheus). Exige ``Authorization: Bearer <METRICS_TOKEN>``;
+    sem token configurado, fica disponível apenas com DEBUG.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=404)
+    elif not hmac.compare_digest(
+        request.META.get("HTTP_AUTHORIZATION", "").encode(), f"Bearer {token}".encode()
+    ):
+        return HttpResponse(status=401)
+
+    conteudo, content_type = gerar_metricas()
+    return HttpResponse(conteudo, content_type=content_type)